@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Batch Notebook Operations
+Applies a pipeline of controller operations to many notebooks in parallel
+
+Each notebook is opened by a NotebookController in a worker process, the
+pipeline steps run in order, and a structured result is collected per file.
+A failing step stops the pipeline for that notebook only.
+
+Usage:
+    python batch_notebooks.py 'notebooks/**/*.ipynb' -s clear_outputs -s save
+    python batch_notebooks.py 'students/*.ipynb' -s 'replace:df_raw=>df' -s verify -s save
+    python batch_notebooks.py 'reports/*.ipynb' -s execute -s save -s 'export:pdf/{stem}.pdf' -j 8
+"""
+
+import io
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'notebook_controller'))
+from notebook_controller import NotebookController
+
+Step = Union[str, Tuple[Union[str, Callable], Dict[str, Any]]]
+
+
+# ==================== OPERATIONS ====================
+
+def _target_path(controller: NotebookController, pattern: str) -> str:
+    """Expand ``{stem}``, ``{name}`` and ``{dir}`` in an output path pattern."""
+    path = controller.notebook_path
+    return pattern.format(stem=path.stem, name=path.name, dir=str(path.parent))
+
+
+def op_clear_outputs(controller: NotebookController) -> Dict:
+    """Clear outputs and execution counts of every code cell."""
+    return {'cleared': controller.clear_all_outputs()}
+
+
+def op_replace(controller: NotebookController, old: str, new: str,
+               cell_type: Optional[str] = None) -> Dict:
+    """Replace text in every cell (optionally only cells of ``cell_type``)."""
+    return {'cells_changed': controller.replace_in_all_cells(old, new, cell_type)}
+
+
+def _output_types(cell: Dict) -> List[str]:
+    outputs = cell.get('outputs', [])
+    if hasattr(outputs, 'output_types'):
+        return list(outputs.output_types)  # lazily loaded: nothing is decoded
+    return [output.get('output_type') for output in outputs]
+
+
+def op_verify(controller: NotebookController) -> Dict:
+    """Check the notebook for empty cells, code cells without output and errors."""
+    cells = controller.notebook['cells']
+    code = [i for i, cell in enumerate(cells) if cell['cell_type'] == 'code']
+    empty = [i for i, cell in enumerate(cells) if not cell.text.strip()]
+    without_output = [i for i in code if not cells[i].get('outputs')]
+    errors = [i for i in code if 'error' in _output_types(cells[i])]
+
+    issues = []
+    if empty:
+        issues.append(f"{len(empty)} empty cells")
+    if without_output:
+        issues.append(f"{len(without_output)} code cells without output")
+    if errors:
+        issues.append(f"{len(errors)} cells with errors")
+
+    return {
+        'cells': len(cells),
+        'code_cells': len(code),
+        'empty_cells': empty,
+        'code_without_output': without_output,
+        'error_cells': errors,
+        'issues': issues
+    }
+
+
+def op_execute(controller: NotebookController, timeout: int = 600) -> Dict:
+    """Execute every cell; fails the pipeline at the first failing cell."""
+    if not controller.execute_all_cells(timeout=timeout):
+        raise RuntimeError("Execution failed")
+    return {'executed': True}
+
+
+def op_vacuum(controller: NotebookController, max_text: Optional[int] = 10000,
+              dpi: Optional[float] = None, mime_policy: Optional[str] = None,
+              minify: Optional[bool] = None) -> Dict:
+    """Shrink outputs: cap long text, recompress (and downscale) PNGs, drop mime types."""
+    result = controller.vacuum(max_text=max_text, dpi=dpi, mime_policy=mime_policy, minify=minify)
+    return {'cells_compacted': len(result['cells']), 'bytes_saved': result['saved']}
+
+
+def op_save(controller: NotebookController, path: Optional[str] = None) -> Dict:
+    """Save in place, or to ``path`` (may contain ``{stem}``, ``{name}``, ``{dir}``)."""
+    if path is None:
+        controller.save()
+        return {'saved': str(controller.notebook_path)}
+    target = _target_path(controller, path)
+    Path(target).parent.mkdir(parents=True, exist_ok=True)
+    controller.save_as(target)
+    return {'saved': target}
+
+
+def op_export(controller: NotebookController, output: str = '{dir}/{stem}.pdf',
+              html: bool = True) -> Dict:
+    """Convert the notebook file on disk to PDF (save first to include edits)."""
+    sys.path.insert(0, str(Path(__file__).parent.parent / 'pdf_export'))
+    if html:
+        from notebook_to_html_pdf import NotebookToHTMLPDFConverter as Converter
+    else:
+        from notebook_to_pdf import NotebookToPDFConverter as Converter
+
+    target = _target_path(controller, output)
+    Path(target).parent.mkdir(parents=True, exist_ok=True)
+    if not Converter(str(controller.notebook_path), target).convert():
+        raise RuntimeError("PDF conversion failed")
+    return {'pdf': target}
+
+
+OPERATIONS: Dict[str, Callable] = {
+    'clear_outputs': op_clear_outputs,
+    'replace': op_replace,
+    'verify': op_verify,
+    'execute': op_execute,
+    'vacuum': op_vacuum,
+    'save': op_save,
+    'export': op_export
+}
+
+
+def parse_step(spec: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Parse a command-line step specification.
+
+    Formats:
+        clear_outputs | verify | save | execute | vacuum
+        replace:OLD=>NEW
+        save:PATH | export:PATH | execute:TIMEOUT | vacuum:DPI
+
+    Returns:
+        (operation name, keyword arguments)
+    """
+    name, _, arg = spec.partition(':')
+    if name not in OPERATIONS:
+        raise ValueError(f"Unknown operation: {name} (choose from {', '.join(OPERATIONS)})")
+    if not arg:
+        return name, {}
+    if name == 'replace':
+        old, sep, new = arg.partition('=>')
+        if not sep:
+            raise ValueError("replace expects OLD=>NEW")
+        return name, {'old': old, 'new': new}
+    if name == 'execute':
+        return name, {'timeout': int(arg)}
+    if name == 'vacuum':
+        return name, {'dpi': float(arg)}
+    if name == 'save':
+        return name, {'path': arg}
+    if name == 'export':
+        return name, {'output': arg}
+    raise ValueError(f"{name} takes no argument")
+
+
+# ==================== WORKER ====================
+
+def _normalize_steps(steps: List[Step]) -> List[Tuple[Union[str, Callable], Dict[str, Any]]]:
+    normalized = []
+    for step in steps:
+        if isinstance(step, str):
+            step = parse_step(step)
+        operation, kwargs = step
+        if isinstance(operation, str) and operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+        normalized.append((operation, dict(kwargs)))
+    return normalized
+
+
+def process_notebook(path: str, steps: List[Step], controller_options: Optional[Dict] = None,
+                     log_lines: int = 20) -> Dict:
+    """
+    Run a pipeline on one notebook.
+
+    Args:
+        path: Notebook path
+        steps: Operation names, step specifications, or (operation, kwargs)
+            pairs; an operation may be any picklable callable taking the
+            controller as its first argument
+        controller_options: Keyword arguments for NotebookController
+        log_lines: Number of trailing log lines kept when the pipeline fails
+
+    Returns:
+        Result dictionary with ``path``, ``ok``, ``seconds``, ``steps``,
+        ``error``, ``traceback`` and ``log`` (the last two None on success);
+        each step has ``step``, ``ok``, ``seconds`` and ``result``
+    """
+    result = _new_result(path)
+    started = time.perf_counter()
+    log = io.StringIO()
+
+    try:
+        with redirect_stdout(log):
+            with NotebookController(path, **(controller_options or {})) as controller:
+                for operation, kwargs in _normalize_steps(steps):
+                    func = OPERATIONS[operation] if isinstance(operation, str) else operation
+                    name = operation if isinstance(operation, str) else operation.__name__
+                    step_started = time.perf_counter()
+                    step = {'step': name, 'ok': False, 'seconds': 0.0, 'result': None}
+                    result['steps'].append(step)
+                    try:
+                        step['result'] = func(controller, **kwargs)
+                        step['ok'] = True
+                    finally:
+                        step['seconds'] = round(time.perf_counter() - step_started, 3)
+        result['ok'] = True
+
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        result['traceback'] = traceback.format_exc()
+        result['log'] = log.getvalue().splitlines()[-log_lines:]
+
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def _new_result(path: str) -> Dict:
+    """A result dictionary for a notebook whose pipeline has not run (yet)."""
+    return {'path': path, 'ok': False, 'seconds': 0.0, 'steps': [], 'error': None,
+            'traceback': None, 'log': None}
+
+
+# ==================== BATCH ====================
+
+def find_notebooks(patterns: List[str]) -> List[str]:
+    """Expand glob patterns (``**`` recurses) into notebook paths, skipping checkpoints."""
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            if '.ipynb_checkpoints' in Path(match).parts or match in seen:
+                continue
+            seen.add(match)
+            paths.append(match)
+    return paths
+
+
+def run_batch(patterns: List[str], steps: List[Step], workers: Optional[int] = None,
+              controller_options: Optional[Dict] = None, report: Optional[str] = None,
+              verbose: bool = True) -> List[Dict]:
+    """
+    Apply a pipeline of operations to every notebook matching the patterns.
+
+    Args:
+        patterns: Notebook paths or glob patterns
+        steps: Pipeline steps (see process_notebook)
+        workers: Worker processes (default: CPU count)
+        controller_options: Keyword arguments for NotebookController; by
+            default backups are off and outputs are loaded lazily unless
+            the pipeline executes cells
+        report: Write the results to this JSON file
+        verbose: Print one line per notebook as it finishes
+
+    Returns:
+        Per-notebook result dictionaries in input order
+    """
+    normalized = _normalize_steps(steps)  # fail fast on a bad pipeline
+    paths = find_notebooks(patterns)
+    options = {'auto_backup': False,
+               'lazy': not any(operation == 'execute' for operation, _ in normalized)}
+    options.update(controller_options or {})
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths) or 1))
+
+    if verbose:
+        print(f"📚 {len(paths)} notebooks, {len(steps)} steps, {workers} workers")
+
+    started = time.perf_counter()
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_notebook, path, normalized, options): path
+                   for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker process itself died (e.g. out of memory)
+                result = _new_result(path)
+                result['error'] = f"{type(e).__name__}: {e}"
+                result['traceback'] = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+                result['log'] = []
+            results[path] = result
+            if verbose:
+                if result['ok']:
+                    issues = [issue for step in result['steps']
+                              for issue in (step.get('result') or {}).get('issues', [])]
+                    note = f" ⚠️  {', '.join(issues)}" if issues else ''
+                    print(f"✅ {path} ({result['seconds']:.2f}s){note}")
+                else:
+                    print(f"❌ {path}: {result['error']}")
+
+    ordered = [results[path] for path in paths]
+    failed = sum(1 for result in ordered if not result['ok'])
+
+    if verbose:
+        print(f"\n{'='*70}")
+        print("Batch Summary:")
+        print(f"  ✅ Succeeded: {len(ordered) - failed}")
+        print(f"  ❌ Failed: {failed}")
+        print(f"  ⏱️  Time: {time.perf_counter() - started:.1f}s")
+        print(f"{'='*70}")
+
+    if report:
+        with open(report, 'w') as f:
+            json.dump(ordered, f, indent=2, default=str)
+        if verbose:
+            print(f"📝 Report: {report}")
+
+    return ordered
+
+
+# ==================== MAIN ====================
+
+def parse_args():
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(
+        description='Apply controller operations to many notebooks in parallel',
+        epilog=f"Operations: {', '.join(OPERATIONS)}")
+    parser.add_argument('patterns', nargs='+', help='Notebook paths or glob patterns (quote them)')
+    parser.add_argument('-s', '--step', action='append', dest='steps', required=True,
+                        metavar='OP[:ARG]',
+                        help="Pipeline step, repeatable and run in order, e.g. "
+                             "clear_outputs, 'replace:OLD=>NEW', verify, execute:600, vacuum:100, "
+                             "save, 'save:out/{stem}.ipynb', 'export:pdf/{stem}.pdf'")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='Worker processes (default: CPU count)')
+    parser.add_argument('--report', metavar='FILE', help='Write per-notebook results as JSON')
+    parser.add_argument('--backup', action='store_true',
+                        help='Record a backup point for every notebook that is saved')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        steps = [parse_step(spec) for spec in args.steps]
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+
+    results = run_batch(args.patterns, steps, workers=args.workers,
+                        controller_options={'auto_backup': args.backup}, report=args.report)
+    sys.exit(0 if all(result['ok'] for result in results) else 1)
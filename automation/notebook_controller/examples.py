@@ -291,7 +291,7 @@ def example_8_validation():
     empty_count = 0
     for i in range(nb.get_cell_count()):
         cell = nb.view_cell(i, show_output=False)
-        source = ''.join(cell.get('source', []))
+        source = cell.text
         if not source.strip():
             empty_count += 1
             issues.append(f"Cell {i}: Empty cell")
@@ -21,805 +21,5855 @@ Version: 1.0.0
 
 import json
 import copy
+import ast
 import subprocess
 import sys
 import tempfile
 import os
+import gzip
+import pickle
+import shutil
+import base64
+import hashlib
+import io
+import struct
+import zlib
+import bisect
+import difflib
+import asyncio
+import functools
+from collections import Counter, deque
+from collections.abc import Sequence
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Any, Tuple, Union
 from datetime import datetime
 import re
+import queue
+import threading
+import time
+import uuid
 
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
 
-class NotebookController:
-    """
-    Main controller class for Jupyter notebook automation.
+try:
+    from jupyter_client.manager import start_new_kernel
+except ImportError:  # pragma: no cover - only needed for persistent-kernel mode
+    start_new_kernel = None
 
-    Provides full control over notebook files including viewing, editing,
-    executing, and managing cells with undo/redo capabilities.
-    """
+try:
+    from PIL import Image
+except ImportError:  # Only needed to downscale PNG outputs; recompression falls back to zlib
+    Image = None
 
-    def __init__(self, notebook_path: str, auto_backup: bool = True):
-        """
-        Initialize the notebook controller.
+CellRef = Union[int, str]  # a cell index or an nbformat cell id
+_CELL_ID = re.compile(r'[A-Za-z0-9_-]{1,64}')
 
-        Args:
-            notebook_path: Path to the .ipynb file
-            auto_backup: Automatically create backup before modifications
-        """
-        self.notebook_path = Path(notebook_path)
-        self.auto_backup = auto_backup
-        self.notebook = None
-        self.current_cell_index = 0
-        self.history = []  # For undo/redo
-        self.history_position = -1
-        self.max_history = 50
 
-        if not self.notebook_path.exists():
-            raise FileNotFoundError(f"Notebook not found: {notebook_path}")
+# ==================== EVENTS ====================
 
-        self._load_notebook()
-        self._save_state()  # Initial state for undo
+class EventSink:
+    """
+    Receives the status events of a NotebookController.
 
-    # ==================== CORE OPERATIONS ====================
+    An event is a dictionary with ``event`` (its kind, e.g. ``'edit'``),
+    ``message`` (the console text, or None), ``op`` (the public method
+    being run), ``time`` (epoch seconds), ``elapsed`` (seconds since that
+    method was called) and event-specific fields such as ``index``. Every
+    public operation ends with a ``'done'`` event carrying its ``duration``.
+    """
 
-    def _load_notebook(self):
-        """Load the notebook from file."""
-        with open(self.notebook_path, 'r', encoding='utf-8') as f:
-            self.notebook = json.load(f)
-        print(f"✅ Loaded notebook: {self.notebook_path.name}")
-        print(f"   Cells: {len(self.notebook['cells'])}")
+    quiet = False  # drop events before they are built
+    detail = True  # render cell outputs into messages
 
-    def _save_notebook(self, path: Optional[Path] = None):
-        """Save the notebook to file."""
-        save_path = path or self.notebook_path
+    def emit(self, event: Dict):
+        raise NotImplementedError
 
-        if self.auto_backup and path is None:
-            self._create_backup()
+    def close(self):
+        pass
 
-        with open(save_path, 'w', encoding='utf-8') as f:
-            json.dump(self.notebook, f, indent=1, ensure_ascii=False)
 
-        print(f"💾 Saved notebook: {save_path.name}")
+class NullSink(EventSink):
+    """Discards every event; the controller skips building them."""
 
-    def _create_backup(self):
-        """Create a timestamped backup of the notebook."""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_name = f"{self.notebook_path.stem}_backup_{timestamp}.ipynb"
-        backup_path = self.notebook_path.parent / backup_name
+    quiet = True
+    detail = False
 
-        with open(backup_path, 'w', encoding='utf-8') as f:
-            json.dump(self.notebook, f, indent=1, ensure_ascii=False)
+    def emit(self, event: Dict):
+        pass
 
-        print(f"📦 Backup created: {backup_name}")
 
-    def _save_state(self):
-        """Save current state for undo functionality."""
-        # Remove any states after current position
-        self.history = self.history[:self.history_position + 1]
-
-        # Add current state
-        state = copy.deepcopy(self.notebook)
-        self.history.append({
-            'notebook': state,
-            'cell_index': self.current_cell_index,
-            'timestamp': datetime.now()
-        })
+class ConsoleSink(EventSink):
+    """Prints event messages, as the controller always has."""
+
+    def __init__(self, stream=None):
+        self.stream = stream
 
-        # Limit history size
-        if len(self.history) > self.max_history:
-            self.history.pop(0)
+    def emit(self, event: Dict):
+        message = event.get('message')
+        if message is None:
+            return
+        if event['event'] == 'stream':
+            print(message, end='', file=self.stream or sys.stdout, flush=True)
         else:
-            self.history_position += 1
+            print(message, file=self.stream or sys.stdout)
 
-    # ==================== CELL NAVIGATION ====================
 
-    def get_cell_count(self) -> int:
-        """Get total number of cells."""
-        return len(self.notebook['cells'])
+class JsonLinesSink(EventSink):
+    """Writes one JSON object per event to a file; cell outputs are not rendered."""
 
-    def jump_to_cell(self, index: int) -> bool:
-        """
-        Jump to a specific cell by index.
+    detail = False
 
+    def __init__(self, target):
+        """
         Args:
-            index: Cell index (0-based or negative for reverse indexing)
-
-        Returns:
-            True if successful, False otherwise
+            target: Path of the trace file (overwritten) or an open text file
         """
-        cell_count = self.get_cell_count()
+        if hasattr(target, 'write'):
+            self._file = target
+            self._owned = False
+        else:
+            self._file = open(target, 'w', encoding='utf-8', buffering=1)
+            self._owned = True
 
-        # Handle negative indexing
-        if index < 0:
-            index = cell_count + index
+    def emit(self, event: Dict):
+        self._file.write(json.dumps(event, ensure_ascii=False, default=_json_default) + '\n')
 
-        if 0 <= index < cell_count:
-            self.current_cell_index = index
-            print(f"📍 Jumped to cell {index}")
-            return True
-        else:
-            print(f"❌ Invalid cell index: {index} (total cells: {cell_count})")
-            return False
+    def close(self):
+        if self._owned and not self._file.closed:
+            self._file.close()
 
-    def next_cell(self) -> bool:
-        """Move to next cell."""
-        if self.current_cell_index < self.get_cell_count() - 1:
-            self.current_cell_index += 1
-            print(f"➡️  Moved to cell {self.current_cell_index}")
-            return True
-        else:
-            print("❌ Already at last cell")
-            return False
 
-    def prev_cell(self) -> bool:
-        """Move to previous cell."""
-        if self.current_cell_index > 0:
-            self.current_cell_index -= 1
-            print(f"⬅️  Moved to cell {self.current_cell_index}")
-            return True
-        else:
-            print("❌ Already at first cell")
-            return False
+class MemorySink(EventSink):
+    """Keeps events in memory (the most recent ``maxlen`` if given)."""
 
-    def first_cell(self):
-        """Jump to first cell."""
-        self.current_cell_index = 0
-        print("⏮️  Moved to first cell")
+    def __init__(self, maxlen: Optional[int] = None):
+        self.events = deque(maxlen=maxlen)
 
-    def last_cell(self):
-        """Jump to last cell."""
-        self.current_cell_index = self.get_cell_count() - 1
-        print("⏭️  Moved to last cell")
+    def emit(self, event: Dict):
+        self.events.append(event)
 
-    # ==================== CELL VIEWING ====================
+    def messages(self) -> List[str]:
+        """Console text of the recorded events."""
+        return [event['message'] for event in self.events if event.get('message') is not None]
 
-    def view_cell(self, index: Optional[int] = None, show_output: bool = True) -> Dict:
-        """
-        View a cell's content.
+    def durations(self) -> Dict[str, Tuple[int, float]]:
+        """Calls and total seconds per operation, from the ``'done'`` events."""
+        totals = {}
+        for event in self.events:
+            if event['event'] == 'done':
+                calls, seconds = totals.get(event['op'], (0, 0.0))
+                totals[event['op']] = (calls + 1, seconds + event['duration'])
+        return totals
 
-        Args:
-            index: Cell index (uses current if None)
-            show_output: Print the cell content
 
-        Returns:
-            Cell dictionary
-        """
-        if index is None:
-            index = self.current_cell_index
+def make_sink(spec) -> EventSink:
+    """
+    Build an event sink from a sink, None (console), ``'console'``,
+    ``'null'``, ``'memory'`` or a path for a JSON lines trace.
+    """
+    if isinstance(spec, EventSink):
+        return spec
+    if spec is None or spec == 'console':
+        return ConsoleSink()
+    if spec == 'null':
+        return NullSink()
+    if spec == 'memory':
+        return MemorySink()
+    return JsonLinesSink(spec)
+
+
+@contextmanager
+def _operation_scope(controller, name: str):
+    """Attribute the events emitted inside to operation ``name`` and report its duration."""
+    if controller._op_depth:
+        # Called from another operation: its cost belongs to the caller
+        yield
+        return
+    controller._op_depth = 1
+    controller._op_name = name
+    controller._op_started = time.perf_counter()
+    try:
+        yield
+    finally:
+        controller._op_depth = 0
+        if not controller.events.quiet:
+            controller._emit('done', duration=round(time.perf_counter() - controller._op_started, 6))
+        controller._op_name = None
 
-        if not (0 <= index < self.get_cell_count()):
-            print(f"❌ Invalid cell index: {index}")
-            return {}
 
-        cell = self.notebook['cells'][index]
+def _operation(method):
+    """Time a public controller method and report it to the event sink."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with _operation_scope(self, method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
 
-        if show_output:
-            self._print_cell(cell, index)
 
-        return cell
+def _async_operation(method):
+    """
+    Run a coroutine of AsyncNotebookController as one controller operation.
 
-    def _print_cell(self, cell: Dict, index: int):
-        """Pretty print a cell."""
-        cell_type = cell['cell_type']
-        source = ''.join(cell.get('source', []))
+    The notebook's lock is taken first, so operations queued behind it do
+    not share (or reset) the running operation's name and timer.
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        async with self._lock:
+            with _operation_scope(self.controller, method.__name__):
+                return await method(self, *args, **kwargs)
+    return wrapper
 
-        print(f"\n{'='*70}")
-        print(f"Cell {index} | Type: {cell_type.upper()}")
-        print(f"{'='*70}")
-        print(source)
 
-        # Show outputs for code cells
-        if cell_type == 'code' and 'outputs' in cell:
-            outputs = cell['outputs']
-            if outputs:
-                print(f"\n{'-'*70}")
-                print("OUTPUTS:")
-                print(f"{'-'*70}")
-                for i, output in enumerate(outputs):
-                    self._print_output(output, i)
-
-        print(f"{'='*70}\n")
-
-    def _print_output(self, output: Dict, index: int):
-        """Print a cell output."""
-        output_type = output.get('output_type', 'unknown')
+# ==================== KERNEL SESSION ====================
 
-        if output_type == 'stream':
-            text = ''.join(output.get('text', []))
-            print(f"[Stream {index}]:\n{text}")
+class KernelSession:
+    """
+    A long-lived Jupyter kernel that executes cell sources directly.
 
-        elif output_type == 'execute_result' or output_type == 'display_data':
-            data = output.get('data', {})
-            if 'text/plain' in data:
-                text = ''.join(data['text/plain'])
-                print(f"[Result {index}]:\n{text}")
-            if 'image/png' in data:
-                print(f"[Image {index}]: <PNG image data>")
+    Replaces the per-cell ``jupyter nbconvert --execute`` round trip: the
+    kernel is started once, keeps its namespace between cells, and outputs
+    are collected from the iopub channel as nbformat output dictionaries.
+    """
 
-        elif output_type == 'error':
-            ename = output.get('ename', 'Error')
-            evalue = output.get('evalue', '')
-            print(f"[Error {index}]: {ename}: {evalue}")
+    def __init__(self, kernel_name: str = 'python3', cwd: Optional[str] = None):
+        """
+        Initialize the kernel session (the kernel is started lazily).
 
-    def list_all_cells(self, show_content: bool = False):
+        Args:
+            kernel_name: Name of the kernelspec to launch
+            cwd: Working directory for the kernel process
         """
-        List all cells in the notebook.
+        self.kernel_name = kernel_name
+        self.cwd = cwd
+        self.km = None
+        self.kc = None
+
+    @property
+    def is_alive(self) -> bool:
+        """Whether the kernel process is running."""
+        return self.km is not None and self.km.is_alive()
+
+    def start(self):
+        """Start the kernel and wait until it is ready."""
+        if start_new_kernel is None:
+            raise RuntimeError(
+                "Persistent-kernel execution requires jupyter_client and ipykernel "
+                "(pip install jupyter_client ipykernel)"
+            )
+        kwargs = {'cwd': self.cwd} if self.cwd else {}
+        self.km, self.kc = start_new_kernel(kernel_name=self.kernel_name, **kwargs)
+
+    def shutdown(self):
+        """Stop the kernel and close its channels."""
+        if self.kc is not None:
+            self.kc.stop_channels()
+        if self.km is not None:
+            self.km.shutdown_kernel(now=True)
+        self.km = None
+        self.kc = None
+
+    def restart(self):
+        """Restart the kernel, discarding its namespace."""
+        if self.km is None:
+            self.start()
+            return
+        self.km.restart_kernel(now=True)
+        self.kc.wait_for_ready(timeout=60)
+
+    def execute(self, source: str, outputs: List[Dict], timeout: int = 60,
+                store_history: bool = True, on_output=None,
+                spill: Optional['StreamSpill'] = None) -> Tuple[str, Optional[int], str]:
+        """
+        Execute source in the kernel, appending outputs as they arrive.
+
+        While the cell runs, stream outputs hold their text as a list of
+        chunks (a valid nbformat multiline string); it is joined into one
+        string before returning.
 
         Args:
-            show_content: Show first 100 chars of each cell
+            source: Code to execute
+            outputs: List that receives nbformat output dictionaries
+            timeout: Execution timeout in seconds
+            store_history: Count the execution in the kernel's history
+            on_output: Called as ``on_output(output, text)`` for every output
+                message; ``text`` is the new chunk for streams, None otherwise
+            spill: Moves stream text beyond its size limit to disk
+
+        Returns:
+            (status, execution_count, message) where status is 'ok',
+            'error' or 'timeout'
         """
-        print(f"\n📓 Notebook: {self.notebook_path.name}")
-        print(f"Total cells: {self.get_cell_count()}\n")
+        if not self.is_alive:
+            self.start()
 
-        for i, cell in enumerate(self.notebook['cells']):
-            cell_type = cell['cell_type']
-            source = ''.join(cell.get('source', []))
+        msg_id = self.kc.execute(source, store_history=store_history, allow_stdin=False)
+        try:
+            return self._collect(msg_id, outputs, timeout, on_output, spill)
+        finally:
+            if spill is not None:
+                spill.close()
+            for output in outputs:
+                if output['output_type'] == 'stream' and isinstance(output['text'], list):
+                    output['text'] = ''.join(output['text'])
+
+    def _collect(self, msg_id: str, outputs: List[Dict], timeout: int, on_output,
+                 spill: Optional['StreamSpill']) -> Tuple[str, Optional[int], str]:
+        """Gather the iopub outputs and the reply of one execute request."""
+        deadline = time.monotonic() + timeout
+
+        # Collect iopub messages until the kernel reports idle for this request
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.km.interrupt_kernel()
+                return 'timeout', None, f"Timeout after {timeout} seconds"
+            try:
+                msg = self.kc.get_iopub_msg(timeout=remaining)
+            except Exception:
+                if not self.km.is_alive():
+                    return 'error', None, "Kernel died during execution"
+                continue
+            if msg['parent_header'].get('msg_id') != msg_id:
+                continue
 
-            marker = "👉" if i == self.current_cell_index else "  "
-            print(f"{marker} Cell {i:3d} | {cell_type:8s} |", end="")
+            msg_type = msg['msg_type']
+            content = msg['content']
 
-            if show_content:
-                preview = source[:100].replace('\n', ' ')
-                if len(source) > 100:
-                    preview += "..."
-                print(f" {preview}")
-            else:
-                lines = len(source.split('\n'))
-                print(f" {lines} lines")
+            if msg_type == 'status':
+                if content['execution_state'] == 'idle':
+                    break
+            elif msg_type == 'stream':
+                text = content['text']
+                last = outputs[-1] if outputs else None
+                if not (last and last['output_type'] == 'stream' and last['name'] == content['name']):
+                    last = {'output_type': 'stream', 'name': content['name'], 'text': []}
+                    outputs.append(last)
+                last['text'].append(text if spill is None else spill.accept(last, text))
+                if on_output is not None:
+                    on_output(last, text)
+            elif msg_type in ('display_data', 'execute_result'):
+                output = {'output_type': msg_type, 'data': content['data'],
+                          'metadata': content.get('metadata', {})}
+                if msg_type == 'execute_result':
+                    output['execution_count'] = content['execution_count']
+                outputs.append(output)
+                if on_output is not None:
+                    on_output(output, None)
+            elif msg_type == 'error':
+                output = {'output_type': 'error', 'ename': content['ename'],
+                          'evalue': content['evalue'], 'traceback': content['traceback']}
+                outputs.append(output)
+                if on_output is not None:
+                    on_output(output, None)
+            elif msg_type == 'clear_output':
+                outputs.clear()
+
+        # Fetch the matching execute_reply for status and execution count
+        while True:
+            remaining = max(deadline - time.monotonic(), 1)
+            reply = self.kc.get_shell_msg(timeout=remaining)
+            if reply['parent_header'].get('msg_id') == msg_id:
+                break
 
-    def search_cells(self, pattern: str, regex: bool = False, cell_type: Optional[str] = None):
+        content = reply['content']
+        if content['status'] == 'ok':
+            return 'ok', content.get('execution_count'), "Execution successful"
+        ename = content.get('ename', 'Error')
+        evalue = content.get('evalue', '')
+        return 'error', content.get('execution_count'), f"{ename}: {evalue}"
+
+    def set_cwd(self, path: str):
+        """Change the kernel's working directory."""
+        self.execute(f"__import__('os').chdir({str(path)!r})", [], store_history=False)
+
+
+class StreamSpill:
+    """
+    Caps the in-memory size of stream outputs during kernel execution.
+
+    Once a stream output holds ``limit`` characters, the rest of its text is
+    written to a file in ``directory`` and the output ends with a note
+    naming that file, so a chatty cell costs bounded memory.
+    """
+
+    def __init__(self, directory: Path, prefix: str, limit: int):
         """
-        Search for pattern in cells.
+        Initialize the spill.
 
         Args:
-            pattern: Search pattern
-            regex: Use regex matching
-            cell_type: Filter by cell type ('code' or 'markdown')
+            directory: Directory for spill files (created on first spill)
+            prefix: File name prefix, e.g. ``cell_12``
+            limit: Characters kept in memory per stream output
         """
-        print(f"\n🔍 Searching for: '{pattern}'")
-        if cell_type:
-            print(f"   Filter: {cell_type} cells only")
+        self.directory = Path(directory)
+        self.prefix = prefix
+        self.limit = limit
+        self._kept = {}  # id(output) -> characters kept in memory
+        self._spilled = {}  # id(output) -> [output, path, file, characters spilled]
+
+    def accept(self, output: Dict, text: str) -> str:
+        """Return the part of ``text`` to keep in memory, writing the rest to disk."""
+        key = id(output)
+        spilled = self._spilled.get(key)
+        if spilled is None:
+            kept = self._kept.get(key, 0)
+            room = max(self.limit - kept, 0)
+            if len(text) <= room:
+                self._kept[key] = kept + len(text)
+                return text
+            self._kept[key] = self.limit
+            self.directory.mkdir(parents=True, exist_ok=True)
+            suffix = f".{len(self._spilled)}" if self._spilled else ''
+            path = self.directory / f"{self.prefix}.{output['name']}{suffix}.txt"
+            spilled = self._spilled[key] = [output, path, open(path, 'w', encoding='utf-8'), 0]
+            head, text = text[:room], text[room:]
+        else:
+            head = ''
+        spilled[2].write(text)
+        spilled[3] += len(text)
+        return head
+
+    @property
+    def paths(self) -> List[Path]:
+        """Files written so far."""
+        return [spilled[1] for spilled in self._spilled.values()]
+
+    def close(self):
+        """Close the spill files and append a pointer to each truncated output."""
+        for output, path, handle, count in self._spilled.values():
+            if not handle.closed:
+                handle.close()
+                note = f"\n[... {_format_bytes(count)} more in {self.directory.name}/{path.name}]\n"
+                if isinstance(output['text'], list):
+                    output['text'].append(note)
+                else:
+                    output['text'] += note
 
-        matches = []
-        for i, cell in enumerate(self.notebook['cells']):
-            if cell_type and cell['cell_type'] != cell_type:
-                continue
 
-            source = ''.join(cell.get('source', []))
+# ==================== KERNEL POOL ====================
 
-            if regex:
-                if re.search(pattern, source, re.IGNORECASE):
-                    matches.append((i, source))
-            else:
-                if pattern.lower() in source.lower():
-                    matches.append((i, source))
+DEFAULT_WARMUP_IMPORTS = [
+    'numpy', 'pandas', 'scipy.stats', 'matplotlib.pyplot', 'seaborn',
+    'missingno', 'sklearn.model_selection', 'sklearn.linear_model',
+    'sklearn.ensemble', 'sklearn.metrics', 'sklearn.preprocessing',
+]
 
-        print(f"\n✅ Found {len(matches)} matches\n")
 
-        for i, source in matches:
-            cell_type = self.notebook['cells'][i]['cell_type']
-            lines = source.split('\n')
+class KernelPool:
+    """
+    A pool of pre-spawned kernels with the data-science stack already imported.
 
-            # Find matching lines
-            matching_lines = []
-            for line_num, line in enumerate(lines, 1):
-                if regex:
-                    if re.search(pattern, line, re.IGNORECASE):
-                        matching_lines.append((line_num, line))
-                else:
-                    if pattern.lower() in line.lower():
-                        matching_lines.append((line_num, line))
+    Kernels are started and warmed in background threads. ``acquire`` hands
+    out a ready kernel and immediately starts a replacement, so the next
+    notebook in a batch does not wait for kernel startup or imports.
+    Acquired kernels carry notebook state and are never returned to the pool.
+    """
 
-            print(f"Cell {i} ({cell_type}):")
-            for line_num, line in matching_lines:
-                print(f"  Line {line_num}: {line.strip()}")
-            print()
+    def __init__(self, size: int = 2, kernel_name: str = 'python3',
+                 imports: Optional[List[str]] = None,
+                 matplotlib_backend: Optional[str] = 'inline',
+                 cwd: Optional[str] = None):
+        """
+        Initialize the pool and start warming kernels.
 
-        return matches
+        Args:
+            size: Number of ready kernels to keep
+            kernel_name: Name of the kernelspec to launch
+            imports: Modules to import in each kernel (default: DEFAULT_WARMUP_IMPORTS)
+            matplotlib_backend: Backend passed to %matplotlib (None to skip)
+            cwd: Working directory for the kernel processes
+        """
+        self.size = size
+        self.kernel_name = kernel_name
+        self.imports = DEFAULT_WARMUP_IMPORTS if imports is None else imports
+        self.matplotlib_backend = matplotlib_backend
+        self.cwd = cwd
+        self._ready = queue.Queue()
+        self._closed = False
+
+        for _ in range(size):
+            self._spawn()
+
+    def _warmup_code(self) -> str:
+        """Build the code run in each new kernel before it becomes ready."""
+        lines = []
+        if self.matplotlib_backend:
+            lines.append(f"get_ipython().run_line_magic('matplotlib', {self.matplotlib_backend!r})")
+        lines.append("import importlib as _importlib")
+        lines.append(f"for _name in {list(self.imports)!r}:")
+        lines.append("    try:")
+        lines.append("        _importlib.import_module(_name)")
+        lines.append("    except ImportError:")
+        lines.append("        pass")
+        lines.append("del _importlib, _name")
+        return '\n'.join(lines)
+
+    def _spawn(self):
+        """Start and warm one kernel in a background thread."""
+        def worker():
+            kernel = KernelSession(self.kernel_name, cwd=self.cwd)
+            try:
+                kernel.start()
+                kernel.execute(self._warmup_code(), [], timeout=300, store_history=False)
+            except Exception as e:
+                kernel.shutdown()
+                self._ready.put(e)
+                return
+            if self._closed:
+                kernel.shutdown()
+            else:
+                self._ready.put(kernel)
 
-    # ==================== CELL EDITING ====================
+        threading.Thread(target=worker, daemon=True).start()
 
-    def edit_cell(self, content: str, index: Optional[int] = None, cell_type: Optional[str] = None):
+    def acquire(self, timeout: Optional[float] = None) -> KernelSession:
         """
-        Edit a cell's content.
+        Take a warm kernel from the pool and start warming its replacement.
 
         Args:
-            content: New content (string or list of strings)
-            index: Cell index (uses current if None)
-            cell_type: Change cell type ('code' or 'markdown')
+            timeout: Seconds to wait for a kernel (None waits indefinitely)
+
+        Returns:
+            A running, warmed KernelSession owned by the caller
         """
-        if index is None:
-            index = self.current_cell_index
+        if self._closed:
+            raise RuntimeError("Kernel pool is shut down")
+        item = self._ready.get(timeout=timeout)
+        self._spawn()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def shutdown(self):
+        """Shut down all idle kernels in the pool."""
+        self._closed = True
+        while True:
+            try:
+                item = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, KernelSession):
+                item.shutdown()
 
-        if not (0 <= index < self.get_cell_count()):
-            print(f"❌ Invalid cell index: {index}")
-            return False
+    def __enter__(self):
+        return self
 
-        self._save_state()
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        return False
 
-        cell = self.notebook['cells'][index]
 
-        # Update content
-        if isinstance(content, str):
-            cell['source'] = content.split('\n')
-            # Keep newlines except for last line
-            cell['source'] = [line + '\n' for line in cell['source'][:-1]] + [cell['source'][-1]]
-        else:
-            cell['source'] = content
+# ==================== LAZY LOADING ====================
 
-        # Update cell type if specified
-        if cell_type:
-            if cell_type not in ['code', 'markdown']:
-                print(f"❌ Invalid cell type: {cell_type}")
-                return False
+_JSON_SEPARATORS = re.compile(r'[\s,:]*')
+_JSON_DECODER = json.JSONDecoder()
+_JSON_INDENT = re.compile(r'\{\n( +)"')
+# A \uXXXX escape of a non-ASCII character, which only ensure_ascii=True writes
+# (starts with a literal so the search skips ahead quickly)
+_ASCII_ESCAPE = re.compile(r'\\u(?!00[0-7])[0-9a-fA-F]{4}')
 
-            old_type = cell['cell_type']
-            cell['cell_type'] = cell_type
 
-            # Update metadata based on type
-            if cell_type == 'code':
-                if 'execution_count' not in cell:
-                    cell['execution_count'] = None
-                if 'outputs' not in cell:
-                    cell['outputs'] = []
-            else:
-                # Remove code-specific fields from markdown
-                cell.pop('execution_count', None)
-                cell.pop('outputs', None)
+def _text_layout(text: str) -> Tuple[int, bool]:
+    """
+    Layout of serialized notebook text.
 
-            print(f"✏️  Changed cell {index} type: {old_type} → {cell_type}")
+    Returns:
+        (indent width, 0 unless indented with spaces and \\n line breaks;
+        whether non-ASCII characters are escaped)
+    """
+    match = _JSON_INDENT.match(text)
+    indent = len(match.group(1)) if match else 0
+    for escape in _ASCII_ESCAPE.finditer(text):
+        backslash = escape.start() - 1
+        while text[backslash] == '\\':
+            backslash -= 1
+        if (escape.start() - 1 - backslash) % 2 == 0:  # not itself an escaped backslash
+            return indent, True
+    return indent, False
+
+
+def _skip_json_string(text: str, pos: int) -> int:
+    """Return the offset just past the JSON string starting at ``pos``."""
+    end = pos
+    while True:
+        end = text.index('"', end + 1)
+        backslash = end - 1
+        while text[backslash] == '\\':
+            backslash -= 1
+        if (end - 1 - backslash) % 2 == 0:
+            return end + 1
+
+
+def _skip_json_value(text: str, pos: int) -> int:
+    """Return the offset just past the JSON value starting at ``pos`` without decoding it."""
+    depth = 0
+    while True:
+        ch = text[pos]
+        if ch == '"':
+            pos = _skip_json_string(text, pos)
+        elif ch in '[{':
+            depth += 1
+            pos += 1
+        elif ch in ']}':
+            depth -= 1
+            pos += 1
+        else:
+            pos = _JSON_DECODER.raw_decode(text, pos)[1]
+        if depth == 0:
+            return pos
+        pos = _JSON_SEPARATORS.match(text, pos).end()
 
-        print(f"✏️  Edited cell {index}")
-        return True
 
-    def append_to_cell(self, content: str, index: Optional[int] = None):
-        """Append content to a cell."""
-        if index is None:
-            index = self.current_cell_index
+def _walk_json_object(text: str, pos: int, handle) -> int:
+    """
+    Walk the members of the JSON object starting at ``pos``.
 
-        cell = self.notebook['cells'][index]
-        current_source = ''.join(cell.get('source', []))
-        new_source = current_source + '\n' + content
+    ``handle(key, value_offset)`` consumes or skips each value and returns
+    the offset just past it. Returns the offset just past the object.
+    """
+    pos = _JSON_SEPARATORS.match(text, pos + 1).end()
+    while text[pos] != '}':
+        key, pos = _JSON_DECODER.raw_decode(text, pos)
+        pos = _JSON_SEPARATORS.match(text, pos).end()
+        pos = handle(key, pos)
+        pos = _JSON_SEPARATORS.match(text, pos).end()
+    return pos + 1
 
-        return self.edit_cell(new_source, index)
 
-    def clear_cell(self, index: Optional[int] = None):
-        """Clear a cell's content."""
-        if index is None:
-            index = self.current_cell_index
+def _walk_json_array(text: str, pos: int, handle) -> int:
+    """Walk the elements of the JSON array at ``pos``; ``handle(offset)`` returns each element's end."""
+    pos = _JSON_SEPARATORS.match(text, pos + 1).end()
+    while text[pos] != ']':
+        pos = handle(pos)
+        pos = _JSON_SEPARATORS.match(text, pos).end()
+    return pos + 1
 
-        return self.edit_cell("", index)
 
-    def clear_outputs(self, index: Optional[int] = None):
-        """Clear outputs from a code cell."""
-        if index is None:
-            index = self.current_cell_index
+class LazyOutputs(Sequence):
+    """
+    Read-only view of a cell's outputs that decodes them on access.
 
-        if not (0 <= index < self.get_cell_count()):
-            print(f"❌ Invalid cell index: {index}")
-            return False
+    Holds the offsets of each output in the notebook text together with its
+    output_type, so counting outputs or checking their types never decodes
+    the (often base64 image) payload. Editing operations replace the whole
+    outputs list, so the view itself is never mutated.
+    """
 
-        cell = self.notebook['cells'][index]
+    def __init__(self, text: str, spans: List[Tuple[int, int, str]],
+                 layout: Tuple[int, bool] = (1, False)):
+        self._text = text
+        self._spans = spans
+        self._layout = layout  # of the text, as returned by _text_layout
+        self._decoded = [None] * len(spans)
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if self._decoded[index] is None:
+            start, end, _ = self._spans[index]
+            self._decoded[index] = json.loads(self._text[start:end])
+        return self._decoded[index]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (list, LazyOutputs)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"LazyOutputs({list(self.output_types)!r})"
+
+    @property
+    def output_types(self) -> List[str]:
+        """Output types, read from the index without decoding."""
+        return [span[2] for span in self._spans]
+
+    @property
+    def raw_size(self) -> int:
+        """Size of the serialized outputs in the notebook text."""
+        return sum(end - start for start, end, _ in self._spans)
+
+    def raw_items(self) -> List[str]:
+        """Serialized text of each output, exactly as it appears in the file."""
+        return [self._text[start:end] for start, end, _ in self._spans]
+
+    def saved_items(self) -> List[str]:
+        """
+        Serialized text of each output as a save writes it.
 
-        if cell['cell_type'] != 'code':
-            print(f"❌ Cell {index} is not a code cell")
+        That is indented by one space at the depth of a cell's outputs,
+        with non-ASCII characters unescaped. Text already in that layout is
+        returned as it is; text indented differently is re-indented (JSON
+        strings cannot hold raw line breaks, so every line break is layout),
+        and minified or ASCII-escaped text is decoded and encoded again.
+        """
+        indent, escaped = self._layout
+        if indent == 1 and not escaped:
+            return self.raw_items()
+        if indent and not escaped:
+            def reindent(match):
+                return '\n' + ' ' * (len(match.group(1)) // indent)
+            return [re.sub(r'\n( *)', reindent, item) for item in self.raw_items()]
+        return [json.dumps(output, indent=1, ensure_ascii=False).replace('\n', '\n    ')
+                for output in self]
+
+    def same_text(self, other: 'LazyOutputs') -> bool:
+        """True if both views serialize to the same text, compared without decoding."""
+        if self._layout != other._layout:
+            return self.saved_items() == other.saved_items()
+        if [end - start for start, end, _ in self._spans] != [end - start for start, end, _ in other._spans]:
             return False
+        if not self._spans:
+            return True
+        start, end = other._spans[0][0], other._spans[-1][1]
+        return self._text.startswith(other._text[start:end], self._spans[0][0])
 
-        self._save_state()
+    @property
+    def max_raw_size(self) -> int:
+        """Size of the largest serialized output."""
+        return max((end - start for start, end, _ in self._spans), default=0)
 
-        cell['outputs'] = []
-        cell['execution_count'] = None
+    def __deepcopy__(self, memo):
+        return self  # Immutable: copies can share it
 
-        print(f"🧹 Cleared outputs from cell {index}")
-        return True
+    def __reduce__(self):
+        return (list, (list(self),))
 
-    def clear_all_outputs(self):
-        """Clear all outputs from all code cells."""
-        self._save_state()
 
-        count = 0
-        for cell in self.notebook['cells']:
-            if cell['cell_type'] == 'code':
-                cell['outputs'] = []
-                cell['execution_count'] = None
-                count += 1
+def _index_outputs(text: str, pos: int, layout: Tuple[int, bool] = (1, False)) -> Tuple[LazyOutputs, int]:
+    """Index an outputs array: record each output's span and type only."""
+    spans = []
 
-        print(f"🧹 Cleared outputs from {count} code cells")
+    def index_output(start: int) -> int:
+        output_type = ['unknown']
 
-    # ==================== CELL INSERTION/DELETION ====================
+        def member(key: str, value_pos: int) -> int:
+            if key == 'output_type':
+                output_type[0], end = _JSON_DECODER.raw_decode(text, value_pos)
+                return end
+            return _skip_json_value(text, value_pos)
 
-    def insert_cell(self, content: str, cell_type: str = 'code',
-                   index: Optional[int] = None, position: str = 'after'):
-        """
-        Insert a new cell.
+        end = _walk_json_object(text, start, member)
+        spans.append((start, end, output_type[0]))
+        return end
 
-        Args:
-            content: Cell content
-            cell_type: 'code' or 'markdown'
-            index: Position reference (uses current if None)
-            position: 'before', 'after', or 'replace'
-        """
-        if index is None:
-            index = self.current_cell_index
+    end = _walk_json_array(text, pos, index_output)
+    return LazyOutputs(text, spans, layout), end
 
-        if cell_type not in ['code', 'markdown']:
-            print(f"❌ Invalid cell type: {cell_type}")
-            return False
 
-        self._save_state()
+def load_notebook_index(path) -> Dict:
+    """
+    Load a notebook, decoding everything except cell outputs.
 
-        # Create new cell
-        new_cell = {
-            'cell_type': cell_type,
-            'metadata': {},
-            'source': content.split('\n') if isinstance(content, str) else content
-        }
+    Cell sources, metadata and notebook-level fields are decoded normally;
+    each code cell's ``outputs`` becomes a LazyOutputs view over the file
+    text that records output offsets and types in the same pass.
 
-        # Add newlines to source lines
-        if new_cell['source']:
-            new_cell['source'] = [line + '\n' for line in new_cell['source'][:-1]] + [new_cell['source'][-1]]
+    Args:
+        path: Path to the .ipynb file
 
-        if cell_type == 'code':
-            new_cell['execution_count'] = None
-            new_cell['outputs'] = []
+    Returns:
+        Notebook dictionary in nbformat shape
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_notebook_index(f.read())
 
-        # Insert at position
-        if position == 'before':
-            insert_index = index
-        elif position == 'after':
-            insert_index = index + 1
-        elif position == 'replace':
-            self.notebook['cells'][index] = new_cell
-            print(f"✏️  Replaced cell {index} ({cell_type})")
-            return True
-        else:
-            print(f"❌ Invalid position: {position}")
-            return False
+
+def parse_notebook_index(text: str) -> Dict:
+    """Index notebook text as load_notebook_index does for a file."""
+    notebook = {}
+    cells = []
+    layout = _text_layout(text)
+
+    def load_cell(start: int) -> int:
+        cell = {}
+
+        def field(key: str, value_pos: int) -> int:
+            if key == 'outputs':
+                cell[key], end = _index_outputs(text, value_pos, layout)
+            else:
+                cell[key], end = _JSON_DECODER.raw_decode(text, value_pos)
+            return end
+
+        end = _walk_json_object(text, start, field)
+        cells.append(cell)
+        return end
+
+    def member(key: str, value_pos: int) -> int:
+        if key == 'cells':
+            notebook[key] = cells
+            return _walk_json_array(text, value_pos, load_cell)
+        notebook[key], end = _JSON_DECODER.raw_decode(text, value_pos)
+        return end
+
+    _walk_json_object(text, _JSON_SEPARATORS.match(text).end(), member)
+    return notebook
+
+
+def _json_default(obj: Any):
+    """JSON fallback that serializes lazily loaded outputs."""
+    if isinstance(obj, LazyOutputs):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# ==================== OUTPUT BLOB STORE ====================
+
+BLOB_REFS_KEY = 'blob_refs'
+
+# Mime types that may be moved out of the notebook, with their file extensions
+BLOB_MIME_TYPES = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/svg+xml': '.svg',
+    'text/html': '.html',
+}
+
+# Mime types stored base64-encoded in the notebook and decoded in the store
+BINARY_MIME_TYPES = {'image/png', 'image/jpeg'}
+
+
+class BlobStore:
+    """
+    Content-addressed sidecar store for large cell outputs.
+
+    Each blob is stored once under the SHA-256 of its content, so identical
+    figures or tables across cells, runs and notebooks are deduplicated.
+    Images are stored as raw decoded bytes, so exporters can copy the file
+    as-is instead of decoding base64 from the notebook.
+    """
+
+    def __init__(self, root):
+        """
+        Initialize the store.
+
+        Args:
+            root: Directory holding the blobs (created if missing)
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str, mime: str) -> Path:
+        """Path of the blob for a key and mime type."""
+        return self.root / key[:2] / (key + BLOB_MIME_TYPES.get(mime, ''))
+
+    def put(self, content: bytes, mime: str) -> str:
+        """Store content (if not already present) and return its key."""
+        key = hashlib.sha256(content).hexdigest()
+        path = self.path(key, mime)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            temp_path = path.with_name(path.name + '.tmp')
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        return key
+
+    def read_bytes(self, key: str, mime: str) -> bytes:
+        """Read a blob's raw content."""
+        return self.path(key, mime).read_bytes()
+
+    def externalize(self, output: Dict, threshold: int) -> Optional[Dict]:
+        """
+        Move large mime bundle entries of an output into the store.
+
+        Returns:
+            A new output dictionary holding references, or None if nothing
+            in the output exceeded the threshold
+        """
+        data = output.get('data')
+        if not data:
+            return None
+
+        moved = {}
+        for mime, value in data.items():
+            if mime not in BLOB_MIME_TYPES:
+                continue
+            text = value if isinstance(value, str) else ''.join(value)
+            if len(text) < threshold:
+                continue
+            if mime in BINARY_MIME_TYPES:
+                content = base64.b64decode(text)
+            else:
+                content = text.encode('utf-8')
+            moved[mime] = self.put(content, mime)
+
+        if not moved:
+            return None
+
+        new_output = dict(output)
+        new_output['data'] = {k: v for k, v in data.items() if k not in moved}
+        metadata = dict(output.get('metadata', {}))
+        metadata[BLOB_REFS_KEY] = {**metadata.get(BLOB_REFS_KEY, {}), **moved}
+        new_output['metadata'] = metadata
+        return new_output
+
+    def inline(self, output: Dict) -> Dict:
+        """Return a copy of an output with its blob references resolved."""
+        metadata = dict(output.get('metadata', {}))
+        refs = metadata.pop(BLOB_REFS_KEY, {})
+        data = dict(output.get('data', {}))
+        for mime, key in refs.items():
+            content = self.read_bytes(key, mime)
+            if mime in BINARY_MIME_TYPES:
+                data[mime] = base64.b64encode(content).decode('ascii')
+            else:
+                data[mime] = _to_source_lines(content.decode('utf-8'))
+        new_output = dict(output)
+        new_output['data'] = data
+        new_output['metadata'] = metadata
+        return new_output
+
+
+def output_blob_refs(output: Dict) -> Dict[str, str]:
+    """Blob references (mime type -> key) of an output, if any."""
+    return output.get('metadata', {}).get(BLOB_REFS_KEY, {})
+
+
+def save_blob_image(blobs: BlobStore, key: str, directory, number: int,
+                    mime: str = 'image/png') -> Path:
+    """
+    Copy an image straight from a blob store for an exporter (no base64 round trip).
+
+    Args:
+        blobs: Store holding the image
+        key: Blob key, from output_blob_refs
+        directory: Directory to write the image to
+        number: Image number, used in the ``image_NNN`` file name
+        mime: Image mime type
+
+    Returns:
+        Path of the written image
+    """
+    image_path = Path(directory) / f"image_{number:03d}{BLOB_MIME_TYPES.get(mime, '')}"
+    shutil.copyfile(blobs.path(key, mime), image_path)
+    return image_path
+
+
+# ==================== OUTPUT COMPACTION ====================
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_PNG_TEXT_CHUNKS = (b'tEXt', b'zTXt', b'iTXt')
+MIME_POLICIES = ('html', 'plain')
+
+
+def _multiline(value) -> str:
+    """An nbformat multiline string (a string or a list of lines) as one string."""
+    return value if isinstance(value, str) else ''.join(value)
+
+
+def _like(original, text: str):
+    """Give ``text`` the multiline shape of ``original``."""
+    return text if isinstance(original, str) else text.splitlines(keepends=True)
+
+
+def _cap_text(text: str, limit: int) -> str:
+    """Keep the head and tail of a long text, about ``limit`` characters in all."""
+    if len(text) <= limit:
+        return text
+    head = text[:limit // 2]
+    tail = text[len(text) - limit // 2:]
+    if '\n' in head:
+        head = head[:head.rfind('\n') + 1]
+    else:
+        head += '\n'
+    if '\n' in tail:
+        tail = tail[tail.find('\n') + 1:]
+    omitted = len(text) - len(head) - len(tail)
+    return f"{head}[... {omitted:,} characters omitted by vacuum ...]\n{tail}"
+
+
+def _png_chunk(kind: bytes, body: bytes) -> bytes:
+    return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+
+
+def _redeflate_png(data: bytes) -> bytes:
+    """
+    Recompress a PNG losslessly without Pillow.
+
+    The image data is re-deflated at the highest level into one IDAT chunk
+    and text chunks (e.g. the writing software) are dropped. Returns the
+    original bytes if that does not make the file smaller.
+    """
+    if not data.startswith(_PNG_SIGNATURE):
+        return data
+    chunks = []
+    idat = []
+    pos = len(_PNG_SIGNATURE)
+    try:
+        while pos < len(data):
+            length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+            body = data[pos + 8:pos + 8 + length]
+            pos += 12 + length
+            if kind == b'IDAT':
+                if not idat:
+                    chunks.append((b'IDAT', None))  # placeholder keeps the chunk order
+                idat.append(body)
+            elif kind not in _PNG_TEXT_CHUNKS:
+                chunks.append((kind, body))
+        pixels = zlib.compress(zlib.decompress(b''.join(idat)), 9)
+    except (struct.error, zlib.error):
+        return data
+
+    packed = _PNG_SIGNATURE + b''.join(_png_chunk(kind, pixels if body is None else body)
+                                       for kind, body in chunks)
+    return packed if len(packed) < len(data) else data
+
+
+def _encode_png(image, info: Dict) -> bytes:
+    """Encode an image as compactly as PNG allows without losing pixels."""
+    if image.mode == 'RGBA' and image.getextrema()[3][0] == 255:
+        image = image.convert('RGB')
+    if image.mode == 'RGB' and image.getcolors(256) is not None:
+        image = image.quantize(colors=256)
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', optimize=True, **info)
+    return buffer.getvalue()
+
+
+def _compact_png(data: bytes, dpi: Optional[float] = None) -> Tuple[bytes, Optional[Tuple[int, int]]]:
+    """
+    Recompress a PNG, downscaling it if it was rendered above ``dpi``.
+
+    With Pillow, an opaque image is stored as RGB, and as a palette image
+    when it has at most 256 colors (both lossless); without Pillow the
+    data is only re-deflated and ``dpi`` is ignored. A downscaled image is
+    used only if it is smaller than the lossless recompression (resampled
+    plots can compress worse than sharp ones), and the original is kept
+    whenever neither is smaller.
+
+    Returns:
+        (PNG bytes, original pixel size if the image was downscaled)
+    """
+    if Image is None:
+        return _redeflate_png(data), None
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception:
+        return data, None
+
+    source_dpi = image.info.get('dpi', (0, 0))[0]
+    info = {'dpi': image.info['dpi']} if source_dpi else {}
+    best, original = data, None
+
+    packed = _encode_png(image, info)
+    if len(packed) < len(best):
+        best = packed
+    if dpi and source_dpi > dpi * 1.01:
+        scale = dpi / source_dpi
+        resized = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                               Image.LANCZOS)
+        packed = _encode_png(resized, {'dpi': (dpi, dpi)})
+        if len(packed) < len(best):
+            best, original = packed, image.size
+    return best, original
+
+
+def _redundant_mimes(data: Dict, policy: Optional[str]) -> List[str]:
+    """Mime types of a bundle made redundant by another entry under ``policy``."""
+    if policy is None:
+        return []
+    redundant = []
+    if 'text/plain' in data and ('text/html' in data and policy == 'html'
+                                 or any(mime.startswith('image/') for mime in data)):
+        redundant.append('text/plain')
+    if policy == 'plain' and 'text/html' in data and 'text/plain' in data:
+        redundant.append('text/html')
+    return redundant
+
+
+def compact_output(output: Dict, max_text: Optional[int] = 10000, dpi: Optional[float] = None,
+                   recompress: bool = True, mime_policy: Optional[str] = None) -> Dict:
+    """
+    Shrink one cell output.
+
+    Args:
+        output: nbformat output dictionary
+        max_text: Keep about this many characters of a stream or text/plain
+            output (its head and tail); a longer text/html with a plain-text
+            alternative is dropped. None keeps all text
+        dpi: Downscale PNG images rendered above this resolution
+        recompress: Recompress PNG images
+        mime_policy: ``'html'`` drops text/plain next to text/html,
+            ``'plain'`` the reverse; both drop the text/plain of images.
+            None keeps every mime type
+
+    Returns:
+        The output itself if nothing changed, otherwise a new dictionary
+    """
+    if output.get('output_type') == 'stream':
+        if max_text is None or 'text' not in output:
+            return output
+        text = _multiline(output['text'])
+        capped = _cap_text(text, max_text)
+        return output if capped is text else dict(output, text=_like(output['text'], capped))
+
+    data = output.get('data')
+    if not data:
+        return output
+    new_data = dict(data)
+    metadata = output.get('metadata', {})
+    new_metadata = dict(metadata)
+
+    for mime in _redundant_mimes(data, mime_policy):
+        del new_data[mime]
+    if max_text is not None:
+        if ('text/html' in new_data and 'text/plain' in new_data
+                and len(_multiline(new_data['text/html'])) > max_text):
+            del new_data['text/html']
+        if 'text/plain' in new_data:
+            text = _multiline(new_data['text/plain'])
+            capped = _cap_text(text, max_text)
+            if capped is not text:
+                new_data['text/plain'] = _like(new_data['text/plain'], capped)
+
+    if (recompress or dpi) and isinstance(new_data.get('image/png'), (str, list)):
+        encoded = _multiline(new_data['image/png'])
+        png = base64.b64decode(encoded)
+        packed, original = _compact_png(png, dpi)
+        if packed is not png:
+            new_data['image/png'] = base64.b64encode(packed).decode('ascii') + ('\n' if encoded.endswith('\n') else '')
+        if original is not None:
+            # Keep the displayed size; only the pixel density drops
+            shown = dict(metadata.get('image/png') or {})
+            shown.setdefault('width', original[0])
+            shown.setdefault('height', original[1])
+            new_metadata['image/png'] = shown
+
+    for mime in data:
+        if mime not in new_data:
+            new_metadata.pop(mime, None)
+
+    if new_data == data and new_metadata == metadata:
+        return output
+    new_output = dict(output, data=new_data)
+    if new_metadata or 'metadata' in output:
+        new_output['metadata'] = new_metadata
+    return new_output
+
+
+# ==================== BACKUP STORE ====================
+
+class BackupStore:
+    """
+    Deduplicated, compressed backup points for one notebook.
+
+    A backup point is a small manifest listing the hashes of the notebook's
+    serialized cells; each distinct cell is stored once as a compressed
+    object. Backing up after a one-cell edit therefore writes one object and
+    a manifest, and restoring joins the objects back into the exact text
+    that was saved. Old points are pruned by a retention policy and objects
+    no manifest references are garbage-collected.
+    """
+
+    def __init__(self, root, keep_last: int = 20, max_age_days: Optional[float] = None):
+        """
+        Initialize the store.
+
+        Args:
+            root: Directory for manifests and objects (created on first backup)
+            keep_last: Number of most recent backup points to keep
+            max_age_days: Also drop points older than this (None keeps all
+                of the last ``keep_last``)
+        """
+        self.root = Path(root)
+        self.keep_last = keep_last
+        self.max_age_days = max_age_days
+        self._hashes = {}  # id(fragment) -> (fragment, hash)
+        self._stored = set()
+
+    @property
+    def manifest_dir(self) -> Path:
+        return self.root / 'manifests'
+
+    @property
+    def object_dir(self) -> Path:
+        return self.root / 'objects'
+
+    def _object_path(self, digest: str) -> Path:
+        return self.object_dir / digest[:2] / f"{digest}.gz"
+
+    def _put(self, text: str) -> str:
+        """Store a fragment once and return its hash."""
+        cached = self._hashes.get(id(text))
+        if cached is not None and cached[0] is text:
+            return cached[1]
+
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        if digest not in self._stored:
+            path = self._object_path(digest)
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                temp_path = path.with_name(path.name + '.tmp')
+                with gzip.open(temp_path, 'wb', compresslevel=6) as f:
+                    f.write(text.encode('utf-8'))
+                os.replace(temp_path, path)
+            self._stored.add(digest)
+        return digest
+
+    def create(self, template: str, fragments: List[str]) -> str:
+        """
+        Record a backup point.
+
+        Args:
+            template: Serialized notebook with a placeholder for the cells
+            fragments: Serialized cells, in order
+
+        Returns:
+            The backup id
+        """
+        hashes = {}
+        cells = []
+        for fragment in fragments:
+            digest = self._put(fragment)
+            hashes[id(fragment)] = (fragment, digest)
+            cells.append(digest)
+        self._hashes = hashes
+
+        now = datetime.now()
+        backup_id = now.strftime('%Y%m%d_%H%M%S_%f')
+        manifest = {
+            'id': backup_id,
+            'timestamp': now.isoformat(),
+            'template': self._put(template),
+            'cells': cells
+        }
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+        _atomic_write(self.manifest_dir / f"{backup_id}.json", json.dumps(manifest))
+
+        self.prune()
+        return backup_id
+
+    def _manifests(self) -> List[Dict]:
+        """All manifests, oldest first."""
+        if not self.manifest_dir.exists():
+            return []
+        manifests = []
+        for path in sorted(self.manifest_dir.glob('*.json')):
+            with open(path, 'r', encoding='utf-8') as f:
+                manifests.append(json.load(f))
+        return manifests
+
+    def list(self) -> List[Dict]:
+        """Backup points (id, timestamp, cell count), oldest first."""
+        return [{'id': m['id'], 'timestamp': m['timestamp'], 'cells': len(m['cells'])}
+                for m in self._manifests()]
+
+    def _read(self, digest: str) -> str:
+        with gzip.open(self._object_path(digest), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def restore_text(self, backup_id: Optional[str] = None) -> str:
+        """
+        Rebuild the notebook text of a backup point.
+
+        Args:
+            backup_id: Backup to restore (None for the most recent)
+        """
+        manifests = self._manifests()
+        if not manifests:
+            raise FileNotFoundError(f"No backups in {self.root}")
+        if backup_id is None:
+            manifest = manifests[-1]
+        else:
+            matches = [m for m in manifests if m['id'] == backup_id]
+            if not matches:
+                raise FileNotFoundError(f"Backup not found: {backup_id}")
+            manifest = matches[0]
+
+        parts = [self._read(digest) for digest in manifest['cells']]
+        return _join_serialized(self._read(manifest['template']), parts)
+
+    def prune(self) -> int:
+        """Apply the retention policy and delete unreferenced objects."""
+        manifests = self._manifests()
+        keep = manifests[-self.keep_last:] if self.keep_last > 0 else []
+        if self.max_age_days is not None:
+            cutoff = datetime.now().timestamp() - self.max_age_days * 86400
+            keep = [m for m in keep
+                    if datetime.fromisoformat(m['timestamp']).timestamp() >= cutoff]
+
+        kept_ids = {m['id'] for m in keep}
+        removed = 0
+        for manifest in manifests:
+            if manifest['id'] not in kept_ids:
+                (self.manifest_dir / f"{manifest['id']}.json").unlink(missing_ok=True)
+                removed += 1
+
+        if removed:
+            referenced = set()
+            for manifest in keep:
+                referenced.add(manifest['template'])
+                referenced.update(manifest['cells'])
+            for path in self.object_dir.glob('*/*.gz'):
+                digest = path.name[:-len('.gz')]
+                if digest not in referenced:
+                    path.unlink()
+                    self._stored.discard(digest)
+        return removed
+
+    def disk_usage(self) -> int:
+        """Total size of the store in bytes."""
+        if not self.root.exists():
+            return 0
+        return sum(path.stat().st_size for path in self.root.rglob('*') if path.is_file())
+
+
+# ==================== UNDO HISTORY ====================
+
+def _estimate_size(obj: Any) -> int:
+    """Approximate the in-memory payload of a JSON-like object in bytes."""
+    if isinstance(obj, str):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(len(k) + _estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sum(_estimate_size(item) for item in obj)
+    return 8
+
+
+def _format_bytes(size: float) -> str:
+    """Format a byte count for display."""
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{int(size)} B"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+class NotebookHistory:
+    """
+    Undo/redo history built from immutable per-cell versions.
+
+    Each state is a tuple of frozen cell copies. A live cell is only copied
+    again when it has changed since its last version (its source, outputs,
+    metadata, type or execution count were replaced, or it was marked
+    dirty), so unchanged cells - including their image outputs - are shared
+    between all states that contain them. Recording a state and restoring
+    one both cost O(changed cells) copies.
+
+    Memory is bounded by a byte budget over the distinct cell versions held
+    by resident states. When it is exceeded, the oldest states are spilled:
+    their cell versions are written once each to compressed files in a
+    scratch directory, and loaded back when undo or redo reaches them.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_states: int = 500,
+                 spill_dir: Optional[str] = None):
+        """
+        Initialize an empty history.
+
+        Args:
+            max_bytes: Memory budget for resident states
+            max_states: Maximum number of states to keep (resident or spilled)
+            spill_dir: Scratch directory for spilled states (default: a new
+                temporary directory)
+        """
+        self.max_bytes = max_bytes
+        self.max_states = max_states
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.states = []
+        self.position = -1
+        self.resident_bytes = 0
+        self._versions = {}  # id(live cell) -> (live cell, signature, frozen cell)
+        self._dirty = set()
+        self._refs = {}  # id(frozen cell) -> [frozen cell, size, reference count, key]
+        self._by_key = {}  # key -> resident frozen cell
+        self._disk = {}  # key -> [spill file, size, reference count]
+        self._next_key = 0
+        self._own_spill_dir = False
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    @property
+    def spilled_bytes(self) -> int:
+        """Compressed size of all spilled states on disk."""
+        return sum(entry[1] for entry in self._disk.values())
+
+    @property
+    def spilled_count(self) -> int:
+        """Number of states currently spilled to disk."""
+        return sum(1 for state in self.states if 'spilled' in state)
+
+    @staticmethod
+    def _signature(cell: Dict) -> Tuple:
+        """Identity of the parts of a cell that editing operations replace."""
+        return (cell.get('source'), cell.get('outputs'), cell.get('metadata'),
+                cell.get('cell_type'), cell.get('execution_count'))
+
+    @staticmethod
+    def _same_signature(a: Tuple, b: Tuple) -> bool:
+        return all(x is y or (isinstance(x, (str, int)) and x == y) for x, y in zip(a, b))
+
+    def mark_dirty(self, cell: Dict):
+        """Force a new version of a cell that was modified in place."""
+        self._dirty.add(id(cell))
+
+    def version(self, cell: Dict) -> Dict:
+        """
+        Frozen version of a live cell.
+
+        The same object is returned for as long as the cell is unchanged, so
+        callers can use it as a cheap change-detection key.
+        """
+        return self._freeze(cell)
+
+    def _freeze(self, cell: Dict) -> Dict:
+        """Return the frozen version of a live cell, copying only if it changed."""
+        key = id(cell)
+        signature = self._signature(cell)
+        entry = self._versions.get(key)
+        if (entry is not None and key not in self._dirty and entry[0] is cell
+                and self._same_signature(entry[1], signature)):
+            return entry[2]
+
+        frozen = copy.deepcopy(cell)
+        self._versions[key] = (cell, signature, frozen)
+        self._dirty.discard(key)
+        return frozen
+
+    def _snapshot(self, notebook: Dict, cell_index: int) -> Dict:
+        """Build a state sharing every unchanged cell with earlier states."""
+        cells = tuple(self._freeze(cell) for cell in notebook['cells'])
+
+        # Drop versions of cells that are no longer in the notebook
+        if len(self._versions) > len(cells):
+            live = {id(cell) for cell in notebook['cells']}
+            self._versions = {k: v for k, v in self._versions.items() if k in live}
+
+        return {
+            'cells': cells,
+            'notebook': copy.deepcopy({k: (None if k == 'cells' else v) for k, v in notebook.items()}),
+            'cell_index': cell_index,
+            'timestamp': datetime.now()
+        }
+
+    @staticmethod
+    def _same_state(a: Dict, b: Dict) -> bool:
+        return (len(a['cells']) == len(b['cells'])
+                and all(x is y for x, y in zip(a['cells'], b['cells']))
+                and a['notebook'] == b['notebook'])
+
+    # ---------- memory accounting ----------
+
+    def _retain(self, state: Dict, keys: Optional[List[int]] = None):
+        """Count a resident state's cell versions against the budget."""
+        for i, frozen in enumerate(state['cells']):
+            ref = self._refs.get(id(frozen))
+            if ref is None:
+                if keys is None:
+                    key = self._next_key
+                    self._next_key += 1
+                else:
+                    key = keys[i]
+                ref = self._refs[id(frozen)] = [frozen, _estimate_size(frozen), 0, key]
+                self._by_key[key] = frozen
+                self.resident_bytes += ref[1]
+            ref[2] += 1
+
+    def _release(self, state: Dict):
+        """Drop a state, freeing cell versions nothing else references."""
+        if 'spilled' in state:
+            for key in state['keys']:
+                entry = self._disk[key]
+                entry[2] -= 1
+                if entry[2] == 0:
+                    Path(entry[0]).unlink(missing_ok=True)
+                    del self._disk[key]
+            return
+        for frozen in state['cells']:
+            ref = self._refs[id(frozen)]
+            ref[2] -= 1
+            if ref[2] == 0:
+                del self._refs[id(frozen)]
+                del self._by_key[ref[3]]
+                self.resident_bytes -= ref[1]
+
+    def _truncate(self, length: int):
+        """Discard all states from ``length`` onwards."""
+        for state in self.states[length:]:
+            self._release(state)
+        del self.states[length:]
+
+    def _spill(self, index: int):
+        """Move a resident state to disk, writing each cell version at most once."""
+        if self.spill_dir is None:
+            self.spill_dir = Path(tempfile.mkdtemp(prefix='nb_history_'))
+            self._own_spill_dir = True
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+
+        state = self.states[index]
+        keys = []
+        for frozen in state['cells']:
+            key = self._refs[id(frozen)][3]
+            entry = self._disk.get(key)
+            if entry is None:
+                path = self.spill_dir / f"cell_{key:08d}.pkl.gz"
+                with gzip.open(path, 'wb', compresslevel=1) as f:
+                    pickle.dump(frozen, f, protocol=pickle.HIGHEST_PROTOCOL)
+                entry = self._disk[key] = [str(path), path.stat().st_size, 0]
+            entry[2] += 1
+            keys.append(key)
+
+        self._release(state)
+        self.states[index] = {
+            'spilled': True,
+            'keys': keys,
+            'notebook': state['notebook'],
+            'cell_count': len(keys),
+            'cell_index': state['cell_index'],
+            'timestamp': state['timestamp']
+        }
+
+    def _load(self, index: int) -> Dict:
+        """Return the state at ``index``, reloading it from disk if spilled."""
+        placeholder = self.states[index]
+        if 'spilled' not in placeholder:
+            return placeholder
+
+        cells = []
+        for key in placeholder['keys']:
+            frozen = self._by_key.get(key)
+            if frozen is None:
+                with gzip.open(self._disk[key][0], 'rb') as f:
+                    frozen = pickle.load(f)
+            cells.append(frozen)
+
+        state = {k: v for k, v in placeholder.items()
+                 if k not in ('spilled', 'keys', 'cell_count')}
+        state['cells'] = tuple(cells)
+        self._retain(state, placeholder['keys'])
+        self._release(placeholder)
+        self.states[index] = state
+        self._enforce_budget()
+        return state
+
+    def _enforce_budget(self):
+        """Spill the oldest resident states until the budget is met."""
+        for index in range(len(self.states)):
+            if self.resident_bytes <= self.max_bytes:
+                break
+            if index != self.position and 'spilled' not in self.states[index]:
+                self._spill(index)
+
+    # ---------- undo/redo ----------
+
+    def _sync(self, notebook: Dict, cell_index: int):
+        """Make sure the current position holds the live notebook state."""
+        state = self._snapshot(notebook, cell_index)
+        if self.position >= 0 and self._same_state(self.states[self.position], state):
+            return
+
+        self._truncate(self.position + 1)
+        self.states.append(state)
+        self._retain(state)
+
+        if len(self.states) > self.max_states:
+            self._release(self.states.pop(0))
+        self.position = len(self.states) - 1
+        self._enforce_budget()
+
+    def record(self, notebook: Dict, cell_index: int):
+        """Record the live state before a modification (drops redo states)."""
+        self._sync(notebook, cell_index)
+        self._truncate(self.position + 1)
+
+    def undo(self, notebook: Dict, cell_index: int) -> Optional[Dict]:
+        """Step back one state, returning it (None if nothing to undo)."""
+        self._sync(notebook, cell_index)
+        if self.position <= 0:
+            return None
+        self.position -= 1
+        return self._load(self.position)
+
+    def revert(self, position: int) -> Dict:
+        """Discard every state after ``position`` and return the state at it."""
+        self._truncate(position + 1)
+        self.position = position
+        return self._load(position)
+
+    def redo(self) -> Optional[Dict]:
+        """Step forward one state, returning it (None if nothing to redo)."""
+        if self.position >= len(self.states) - 1:
+            return None
+        self.position += 1
+        return self._load(self.position)
+
+    def restore(self, state: Dict, notebook: Dict) -> Dict:
+        """
+        Rebuild a live notebook from a state.
+
+        Live cells whose current version is already part of the state are
+        reused as-is; only cells that differ are copied out of the history.
+        """
+        reusable = {}
+        for cell in notebook['cells']:
+            entry = self._versions.get(id(cell))
+            if (entry is not None and id(cell) not in self._dirty and entry[0] is cell
+                    and self._same_signature(entry[1], self._signature(cell))):
+                reusable[id(entry[2])] = cell
+
+        cells = []
+        for frozen in state['cells']:
+            cell = reusable.pop(id(frozen), None)
+            if cell is None:
+                cell = copy.deepcopy(frozen)
+                self._versions[id(cell)] = (cell, self._signature(cell), frozen)
+            cells.append(cell)
+
+        restored = copy.deepcopy(state['notebook'])
+        restored['cells'] = cells
+        return restored
+
+    def close(self):
+        """Delete spilled states and the scratch directory."""
+        self._truncate(0)
+        self.position = -1
+        if self._own_spill_dir and self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+            self._own_spill_dir = False
+
+
+# ==================== CELL MODEL ====================
+
+class Cell(dict):
+    """
+    A notebook cell holding its source as a single string.
+
+    Behaves like the nbformat cell dictionary it was built from, except that
+    ``cell['source']`` is one string (an equally valid nbformat form) rather
+    than a list of lines, so reading and replacing the source never joins or
+    re-splits lines. Line offsets and a content hash are computed on demand
+    and cached until the source changes. ``dirty`` is set whenever a key is
+    assigned and cleared when the notebook is saved. The list-of-lines shape
+    is produced only when the cell is serialized; a cell whose source was
+    never replaced keeps the lines it was loaded with, so it is written back
+    unchanged.
+    """
+
+    __slots__ = ('_lines', '_offsets', '_hash', 'dirty')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        source = dict.get(self, 'source', '')
+        self._lines = None
+        if not isinstance(source, str):
+            self._lines = source
+            dict.__setitem__(self, 'source', ''.join(source))
+        self._offsets = None
+        self._hash = None
+        self.dirty = False
+
+    def __setitem__(self, key, value):
+        if key == 'source':
+            if not isinstance(value, str):
+                value = ''.join(value)
+            self._lines = None
+            self._offsets = None
+            self._hash = None
+        super().__setitem__(key, value)
+        self.dirty = True
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.dirty = True
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __reduce__(self):
+        state = dict(self)
+        if self._lines is not None:
+            state['source'] = self._lines
+        return (self.__class__, (state,))
+
+    @property
+    def text(self) -> str:
+        """The source as one string."""
+        return dict.__getitem__(self, 'source')
+
+    @property
+    def line_offsets(self) -> List[int]:
+        """Start offset of every line of the source."""
+        if self._offsets is None:
+            text = self.text
+            offsets = [0]
+            pos = text.find('\n')
+            while pos != -1:
+                offsets.append(pos + 1)
+                pos = text.find('\n', pos + 1)
+            self._offsets = offsets
+        return self._offsets
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines, counted as ``len(text.split('\\n'))``."""
+        return len(self.line_offsets)
+
+    def line(self, number: int) -> str:
+        """Line ``number`` (0-based) without its newline."""
+        offsets = self.line_offsets
+        end = offsets[number + 1] - 1 if number + 1 < len(offsets) else len(self.text)
+        return self.text[offsets[number]:end]
+
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 of the source text."""
+        if self._hash is None:
+            self._hash = hashlib.sha256(self.text.encode('utf-8')).hexdigest()
+        return self._hash
+
+    def source_lines(self) -> List[str]:
+        """The source in nbformat list-of-lines shape (newlines kept)."""
+        if self._lines is not None:
+            return self._lines
+        text = self.text
+        offsets = self.line_offsets
+        lines = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+        if offsets[-1] < len(text):
+            lines.append(text[offsets[-1]:])
+        return lines
+
+
+def cell_source(cell: Dict) -> str:
+    """Source text of a cell, whether it is a Cell or a raw nbformat dictionary."""
+    source = cell.get('source', '')
+    return source if isinstance(source, str) else ''.join(source)
+
+
+def new_cell_id(taken) -> str:
+    """A random 8-character nbformat cell id that is not in ``taken`` and not all digits."""
+    while True:
+        cell_id = uuid.uuid4().hex[:8]
+        if cell_id not in taken and not cell_id.isdigit():
+            return cell_id
+
+
+# ==================== SEARCH INDEX ====================
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    Inverted trigram index over cell sources.
+
+    Each cell's source is lowercased, split into lines and broken into
+    trigrams once; a literal query only scans the cells containing all of
+    its trigrams. Cells are re-indexed when their source object changes,
+    so the index follows edits, undo and every other operation that assigns
+    a new source. Compiled regexes are cached per pattern.
+    """
+
+    MAX_PATTERNS = 128
+
+    def __init__(self):
+        self._entries = {}   # id(cell) -> (cell, source, text, lowered, lines, lowered lines, trigrams)
+        self._postings = {}  # trigram -> set of id(cell)
+        self._patterns = {}  # pattern -> compiled regex
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def update(self, cell: Dict):
+        """Index a cell, or re-index it if its source changed."""
+        key = id(cell)
+        source = cell.get('source')
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] is cell and entry[1] is source:
+                return
+            self._unpost(key, entry[6])
+
+        text = cell_source(cell)
+        lowered = text.lower()
+        grams = _trigrams(lowered)
+        for gram in grams:
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = set()
+            postings.add(key)
+        self._entries[key] = (cell, source, text, lowered,
+                              text.split('\n'), lowered.split('\n'), grams)
+
+    def remove(self, cell: Dict):
+        """Drop a cell from the index."""
+        entry = self._entries.get(id(cell))
+        if entry is not None and entry[0] is cell:
+            self._unpost(id(cell), entry[6])
+            del self._entries[id(cell)]
+
+    def _unpost(self, key: int, grams: set):
+        for gram in grams:
+            postings = self._postings[gram]
+            postings.discard(key)
+            if not postings:
+                del self._postings[gram]
+
+    def sync(self, cells: List[Dict]):
+        """Bring the index in line with a list of cells."""
+        entries = self._entries
+        for cell in cells:
+            entry = entries.get(id(cell))
+            if entry is None or entry[0] is not cell or entry[1] is not cell.get('source'):
+                self.update(cell)
+
+        if len(entries) > len(cells):
+            live = {id(cell) for cell in cells}
+            for key in [k for k in entries if k not in live]:
+                self._unpost(key, entries.pop(key)[6])
+
+    def compile(self, pattern: str):
+        """Compile a case-insensitive regex, reusing earlier compilations."""
+        compiled = self._patterns.get(pattern)
+        if compiled is None:
+            if len(self._patterns) >= self.MAX_PATTERNS:
+                del self._patterns[next(iter(self._patterns))]
+            compiled = self._patterns[pattern] = re.compile(pattern, re.IGNORECASE)
+        return compiled
+
+    def search(self, cells: List[Dict], pattern: str, regex: bool = False,
+               cell_type: Optional[str] = None) -> List[Tuple[int, str, List[Tuple[int, str]]]]:
+        """
+        Find cells matching a pattern.
+
+        Args:
+            cells: The notebook's cells
+            pattern: Substring (case-insensitive) or regex
+            regex: Treat pattern as a regex
+            cell_type: Only search cells of this type
+
+        Returns:
+            (cell index, cell source, [(line number, line), ...]) per matching cell
+        """
+        self.sync(cells)
+
+        if regex:
+            compiled = self.compile(pattern)
+            candidates = None
+        else:
+            needle = pattern.lower()
+            grams = _trigrams(needle)
+            candidates = None
+            if grams:
+                postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+                if not candidates:
+                    return []
+
+        results = []
+        for i, cell in enumerate(cells):
+            key = id(cell)
+            if candidates is not None and key not in candidates:
+                continue
+            if cell_type and cell['cell_type'] != cell_type:
+                continue
+
+            _, _, text, lowered, lines, lowered_lines, _ = self._entries[key]
+            if regex:
+                if not compiled.search(text):
+                    continue
+                hits = [(n, line) for n, line in enumerate(lines, 1) if compiled.search(line)]
+            else:
+                if needle not in lowered:
+                    continue
+                hits = [(n, lines[n - 1]) for n, line in enumerate(lowered_lines, 1) if needle in line]
+            results.append((i, text, hits))
+
+        return results
+
+
+# ==================== MULTI-PATTERN REPLACE ====================
+
+def _trie_regex(words: List[str]) -> str:
+    """
+    Build a regex matching any of the words, factored on shared prefixes.
+
+    The result is a trie written as nested groups, so matching at a position
+    follows one branch per character instead of trying every word, and the
+    longest word wins.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node) -> str:
+        # Chains of single-child nodes become plain literals; only branch
+        # points nest, which keeps the recursion shallow for long words
+        prefix = []
+        while len(node) == 1 and '' not in node:
+            (char, node), = node.items()
+            prefix.append(re.escape(char))
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            body = ''
+        elif len(branches) == 1:
+            body = branches[0]
+        else:
+            body = '(?:' + '|'.join(branches) + ')'
+        if '' in node and body:
+            body = f'(?:{body})?'
+        return ''.join(prefix) + body
+
+    return build(trie)
+
+
+class MultiReplacer:
+    """
+    Applies many replacements in a single scan of a text.
+
+    Literal keys are compiled into one prefix-factored alternation; where
+    several keys match at a position, the longest wins. Regex patterns
+    follow as further alternatives, tried in order where no key matches.
+    Their replacements may use group references (``\\1``, ``\\g<name>``).
+    Regex patterns are combined into one expression, so they cannot use
+    backreferences to their own numbered groups or global inline flags.
+    """
+
+    def __init__(self, replacements: Dict[str, str], patterns: Optional[Dict[str, str]] = None):
+        """
+        Initialize the replacer.
+
+        Args:
+            replacements: Literal text -> replacement
+            patterns: Regex -> replacement template
+        """
+        if any(not key for key in replacements):
+            raise ValueError("Cannot replace an empty string")
+        self.replacements = dict(replacements)
+        self.patterns = []
+        for pattern, template in (patterns or {}).items():
+            try:
+                self.patterns.append((pattern, re.compile(pattern), template))
+            except re.error as e:
+                raise ValueError(f"Invalid pattern {pattern!r}: {e}") from None
+
+        alternatives = []
+        if self.replacements:
+            alternatives.append(f"(?P<_lit>{_trie_regex(list(self.replacements))})")
+        alternatives.extend(f"(?P<_re{k}>{pattern})" for k, (pattern, _, _) in enumerate(self.patterns))
+        if not alternatives:
+            raise ValueError("No replacements given")
+        try:
+            self.regex = re.compile('|'.join(alternatives))
+        except re.error as e:
+            raise ValueError(f"Cannot combine the patterns: {e}") from None
+
+        self.hits = dict.fromkeys(self.replacements, 0)
+        self.hits.update((pattern, 0) for pattern, _, _ in self.patterns)
+
+    def _substitute(self, match) -> str:
+        if self.replacements and match.group('_lit') is not None:
+            key = match.group()
+            self.hits[key] += 1
+            return self.replacements[key]
+        for k, (pattern, compiled, template) in enumerate(self.patterns):
+            if match.group(f'_re{k}') is not None:
+                self.hits[pattern] += 1
+                own = compiled.fullmatch(match.string, match.start(), match.end())
+                return own.expand(template) if own else template
+        return match.group()
+
+    def replace(self, text: str) -> Tuple[str, int]:
+        """Return the replaced text and the number of replacements made."""
+        return self.regex.subn(self._substitute, text)
+
+
+# ==================== DATAFLOW ====================
+
+_MAGIC_LINE = re.compile(r'^\s*[%!]', re.MULTILINE)
+
+# Methods that return a new object and leave the one they are called on as
+# it was (unless called with inplace=True). A call of any other method
+# counts as changing its object.
+PURE_METHODS = frozenset({
+    # pandas / numpy
+    'head', 'tail', 'describe', 'info', 'copy', 'sample', 'groupby', 'agg', 'aggregate',
+    'apply', 'applymap', 'map', 'filter', 'query', 'sort_values', 'sort_index', 'drop',
+    'dropna', 'fillna', 'replace', 'rename', 'astype', 'reset_index', 'set_index', 'merge',
+    'join', 'pivot', 'pivot_table', 'melt', 'stack', 'unstack', 'value_counts', 'unique',
+    'nunique', 'isna', 'isnull', 'notna', 'notnull', 'any', 'all', 'sum', 'mean', 'median',
+    'mode', 'std', 'var', 'min', 'max', 'idxmin', 'idxmax', 'count', 'quantile', 'corr',
+    'cov', 'skew', 'kurt', 'cumsum', 'abs', 'round', 'clip', 'diff', 'pct_change', 'shift',
+    'rolling', 'select_dtypes', 'duplicated', 'drop_duplicates', 'nlargest', 'nsmallest',
+    'isin', 'between', 'where', 'mask', 'equals', 'memory_usage', 'to_numpy', 'to_list',
+    'tolist', 'to_dict', 'to_frame', 'to_string', 'to_csv', 'to_excel', 'to_json',
+    'to_parquet', 'plot', 'hist', 'boxplot', 'reshape', 'flatten', 'ravel', 'argsort',
+    'argmax', 'argmin', 'dot', 'transpose', 'contains',
+    # dict / str
+    'get', 'keys', 'values', 'items', 'index', 'startswith', 'endswith', 'split', 'strip',
+    'lower', 'upper', 'format',
+    # fitted models
+    'predict', 'predict_proba', 'predict_log_proba', 'decision_function', 'score',
+    'transform', 'get_params', 'get_feature_names_out', 'summary', 'conf_int',
+})
+
+# Module functions that change module-wide state (np.random.seed, pd.set_option,
+# plt.style.use, warnings.filterwarnings, ...); other calls on a module do not
+_MODULE_STATE_CALL = re.compile(r'^(set|use|filterwarnings|simplefilter|rc|register|update|reset|enable|disable)'
+                                r'|seed')
+
+# Calls that act outside the kernel (writing files, running processes) or
+# reseed random number generators. A cell making one must run exactly once,
+# so parallel execution never replays it on a replica kernel.
+_SIDE_EFFECT_CALL = re.compile(r'^(to_(csv|excel|json|parquet|pickle|feather|hdf|sql|stata|html|latex|markdown|'
+                               r'clipboard|xml|orc)|save\w*|dump|write|writelines|write_text|write_bytes|mkdir|'
+                               r'makedirs|touch|remove|unlink|rmdir|rmtree|rename|copyfile|copy2|copytree|move|'
+                               r'system|popen|Popen|run|check_call|check_output|urlretrieve|imwrite|imsave|'
+                               r'\w*seed)$')
+_FILE_MODE = re.compile(r'^[rwaxbtU+]{1,4}$')
+_SHELL_LINE = re.compile(r'^\s*(!|%%?(system|sx|run|writefile|bash|sh|script|store)\b)', re.MULTILINE)
+
+
+class _NameCollector(ast.NodeVisitor):
+    """
+    Collect the global names a cell defines and the names it reads.
+
+    Only reads of names the cell has not already bound count as uses, so
+    ``for col in cols`` or ``fig, ax = plt.subplots()`` do not make a cell
+    depend on earlier cells that happened to use the same variable names.
+    Names local to functions, lambdas, classes and comprehensions are
+    ignored. Method calls that may change their object are kept apart in
+    ``calls``, since calls on modules mostly do not change them; ``names``
+    decides which count as definitions.
+    """
+
+    def __init__(self):
+        self.defs = set()
+        self.uses = set()
+        self.imports = set()  # global names bound by import statements
+        self.calls = {}  # name -> methods called on it (or on its attributes) that may change it
+        self.side_effects = False  # writes files, runs processes or reseeds random state
+        self._scopes = []  # local names of the enclosing function/class/comprehension scopes
+
+    def names(self, modules: frozenset = frozenset()) -> Tuple[frozenset, frozenset]:
+        """
+        Defined and used names.
+
+        A method call counts as (re)defining the object it is called on,
+        unless that object is a module - imported by this cell or named in
+        ``modules`` - and the method does not look like it sets module
+        state.
+
+        Args:
+            modules: Names imported as modules elsewhere in the notebook
+        """
+        modules = self.imports | modules
+        defs = set(self.defs)
+        for name, methods in self.calls.items():
+            if name not in modules or any(_MODULE_STATE_CALL.search(method) for method in methods):
+                defs.add(name)
+        return frozenset(defs), frozenset(self.uses)
+
+    def _is_local(self, name: str) -> bool:
+        return any(name in scope for scope in self._scopes)
+
+    def _define(self, name: str):
+        if self._scopes:
+            self._scopes[-1].add(name)
+        else:
+            self.defs.add(name)
+
+    def _use(self, name: str):
+        if not self._is_local(name) and name not in self.defs:
+            self.uses.add(name)
+
+    def _mutate(self, target):
+        """Define the object at the root of ``df['a']`` or ``df.loc[...]`` style targets."""
+        while isinstance(target, (ast.Attribute, ast.Subscript)):
+            target = target.value
+        if isinstance(target, ast.Name):
+            self._use(target.id)
+            if not self._is_local(target.id):
+                self.defs.add(target.id)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self._use(node.id)
+        else:
+            self._define(node.id)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            name = (alias.asname or alias.name).split('.')[0]
+            self._define(name)
+            if not self._scopes:
+                self.imports.add(name)
+
+    visit_ImportFrom = visit_Import
+
+    def visit_Global(self, node):
+        self.defs.update(node.names)
+        for scope in self._scopes:
+            scope.difference_update(node.names)
+
+    def _visit_scope(self, local: set, nodes: List[ast.AST]):
+        for node in nodes:
+            for child in ast.walk(node):
+                if isinstance(child, ast.Name) and not isinstance(child.ctx, ast.Load):
+                    local.add(child.id)
+        self._scopes.append(local)
+        for node in nodes:
+            self.visit(node)
+        self._scopes.pop()
+
+    @staticmethod
+    def _arg_names(args: ast.arguments) -> set:
+        names = {arg.arg for arg in args.posonlyargs + args.args + args.kwonlyargs}
+        names.update(arg.arg for arg in (args.vararg, args.kwarg) if arg is not None)
+        return names
+
+    def visit_FunctionDef(self, node):
+        for child in node.decorator_list + node.args.defaults + node.args.kw_defaults:
+            if child is not None:
+                self.visit(child)
+        self._define(node.name)
+        self._visit_scope(self._arg_names(node.args), node.body)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        for child in node.args.defaults + node.args.kw_defaults:
+            if child is not None:
+                self.visit(child)
+        self._visit_scope(self._arg_names(node.args), [node.body])
+
+    def visit_ClassDef(self, node):
+        for child in node.decorator_list + node.bases + node.keywords:
+            self.visit(child)
+        self._define(node.name)
+        self._visit_scope(set(), node.body)
+
+    def _visit_comprehension(self, node):
+        # The first iterable is evaluated in the enclosing scope
+        self.visit(node.generators[0].iter)
+        local = set()
+        for generator in node.generators:
+            for child in ast.walk(generator.target):
+                if isinstance(child, ast.Name):
+                    local.add(child.id)
+        self._scopes.append(local)
+        for i, generator in enumerate(node.generators):
+            if i:
+                self.visit(generator.iter)
+            for condition in generator.ifs:
+                self.visit(condition)
+        for field in ('elt', 'key', 'value'):
+            if hasattr(node, field):
+                self.visit(getattr(node, field))
+        self._scopes.pop()
+
+    visit_ListComp = visit_SetComp = visit_GeneratorExp = visit_DictComp = _visit_comprehension
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        for target in node.targets:
+            if isinstance(target, (ast.Attribute, ast.Subscript)):
+                self._mutate(target)
+            self.visit(target)
+
+    def visit_AnnAssign(self, node):
+        if node.value is not None:
+            self.visit(node.value)
+        self.visit(node.target)
+
+    def visit_AugAssign(self, node):
+        self.visit(node.value)
+        if isinstance(node.target, ast.Name):
+            self._use(node.target.id)
+        else:
+            self._mutate(node.target)
+        self.visit(node.target)
+
+    def visit_For(self, node):
+        self.visit(node.iter)
+        self.visit(node.target)
+        for child in node.body + node.orelse:
+            self.visit(child)
+
+    visit_AsyncFor = visit_For
+
+    def visit_ExceptHandler(self, node):
+        if node.type is not None:
+            self.visit(node.type)
+        if node.name:
+            self._define(node.name)
+        for child in node.body:
+            self.visit(child)
+
+    def visit_Delete(self, node):
+        for target in node.targets:
+            if isinstance(target, (ast.Attribute, ast.Subscript)):
+                self._mutate(target)
+        self.generic_visit(node)
+
+    @staticmethod
+    def _opens_for_writing(node: ast.Call) -> bool:
+        """Whether an ``open(...)`` call may open its file for writing."""
+        modes = [kw.value for kw in node.keywords if kw.arg == 'mode']
+        if isinstance(node.func, ast.Name):
+            modes.extend(node.args[1:2])  # open(path, mode)
+        else:
+            # path.open(mode), io.open(path, mode): only literals that look like a mode
+            modes.extend(arg for arg in node.args if isinstance(arg, ast.Constant)
+                         and isinstance(arg.value, str) and _FILE_MODE.match(arg.value))
+        return any(not (isinstance(mode, ast.Constant) and isinstance(mode.value, str))
+                   or set(mode.value) & set('wax+') for mode in modes)
+
+    def visit_Call(self, node):
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+        if name is not None and (_SIDE_EFFECT_CALL.match(name)
+                                 or name == 'open' and self._opens_for_writing(node)):
+            self.side_effects = True
+        if isinstance(func, ast.Attribute):
+            if any(kw.arg == 'inplace' and not (isinstance(kw.value, ast.Constant) and kw.value.value is False)
+                   for kw in node.keywords):
+                # df.fillna(..., inplace=True) changes df without assigning to it
+                self._mutate(func.value)
+            elif func.attr not in PURE_METHODS:
+                # df.append(...), model.fit(...), config.update(...) may change their object
+                root = func.value
+                while isinstance(root, (ast.Attribute, ast.Subscript)):
+                    root = root.value
+                if isinstance(root, ast.Name) and not self._is_local(root.id):
+                    self.calls.setdefault(root.id, set()).add(func.attr)
+        self.generic_visit(node)
+
+
+def _analyse_cell(source: str) -> Optional[_NameCollector]:
+    """Run the name collector over a cell (None if the cell does not parse)."""
+    try:
+        tree = ast.parse(_MAGIC_LINE.sub('pass  #', source))
+    except SyntaxError:
+        return None
+    collector = _NameCollector()
+    collector.visit(tree)
+    collector.side_effects = collector.side_effects or bool(_SHELL_LINE.search(source))
+    return collector
+
+
+def cell_names(source: str, modules: frozenset = frozenset()) -> Optional[Tuple[frozenset, frozenset]]:
+    """
+    Global names a code cell defines and reads.
+
+    IPython magics and shell lines are ignored. Assigning into an object
+    (``df['a'] = ...``), deleting from it, or calling one of its methods
+    counts as defining it, since later cells see the change. Methods in
+    PURE_METHODS, and calls on modules other than state setters such as
+    ``np.random.seed``, are the exceptions; with ``inplace=True`` even
+    those change their object.
+
+    Args:
+        source: Cell source
+        modules: Names imported as modules by other cells
+
+    Returns:
+        (defined names, used names), or None if the cell does not parse
+    """
+    collector = _analyse_cell(source)
+    return None if collector is None else collector.names(modules)
+
+
+DATA_FILE_EXTENSIONS = {'.csv', '.tsv', '.txt', '.json', '.parquet', '.feather', '.xlsx', '.xls',
+                        '.pkl', '.pickle', '.npy', '.npz', '.h5', '.hdf5', '.zip', '.gz'}
+
+
+def cell_data_files(source: str) -> List[str]:
+    """
+    Paths of data files a code cell may read.
+
+    Every string literal ending in a data file extension (``.csv``,
+    ``.parquet``, ``.txt``, ...) is a candidate; images and other outputs a
+    cell writes are not.
+
+    Args:
+        source: Cell source
+
+    Returns:
+        Candidate paths in order of appearance
+    """
+    try:
+        tree = ast.parse(_MAGIC_LINE.sub('pass  #', source))
+    except SyntaxError:
+        return []
+    paths = []
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Constant) and isinstance(node.value, str)
+                and '\n' not in node.value and len(node.value) < 4096
+                and os.path.splitext(node.value)[1].lower() in DATA_FILE_EXTENSIONS
+                and node.value not in paths):
+            paths.append(node.value)
+    return paths
+
+
+class DataflowGraph:
+    """
+    Def/use graph over a notebook's code cells.
+
+    Cells are analysed once per distinct source. A cell depends on the
+    closest earlier cell defining each name it reads, which mirrors what the
+    kernel sees when the notebook runs top to bottom. Calling a method that
+    may change an object counts as defining it, except on names some cell
+    imports as a module. Cells that do not parse are treated as reading and
+    defining everything.
+    """
+
+    def __init__(self):
+        self._names = {}  # source hash -> _NameCollector or None
+        self._files = {}  # source hash -> data file paths
+
+    def _collector(self, cell: Dict) -> Optional[_NameCollector]:
+        key = cell.content_hash if isinstance(cell, Cell) else cell_source(cell)
+        if key not in self._names:
+            self._names[key] = _analyse_cell(cell_source(cell))
+        return self._names[key]
+
+    def modules(self, cells: List[Dict]) -> frozenset:
+        """Names bound by import statements in any of the code cells."""
+        modules = set()
+        for cell in cells:
+            if cell['cell_type'] == 'code':
+                collector = self._collector(cell)
+                if collector is not None:
+                    modules |= collector.imports
+        return frozenset(modules)
+
+    def names(self, cell: Dict, modules: frozenset = frozenset()) -> Optional[Tuple[frozenset, frozenset]]:
+        """Cached ``cell_names`` of a cell."""
+        collector = self._collector(cell)
+        return None if collector is None else collector.names(modules)
+
+    def side_effects(self, cell: Dict) -> bool:
+        """
+        Whether running a cell may change anything outside its kernel.
+
+        Cells writing files, running shell commands or processes, or reseeding
+        random number generators count, as do cells that do not parse.
+        """
+        collector = self._collector(cell)
+        return collector is None or collector.side_effects
+
+    def data_files(self, cell: Dict) -> List[str]:
+        """Cached ``cell_data_files`` of a cell."""
+        key = cell.content_hash if isinstance(cell, Cell) else cell_source(cell)
+        if key not in self._files:
+            self._files[key] = cell_data_files(cell_source(cell))
+        return self._files[key]
+
+    def upstream(self, cells: List[Dict]) -> Dict[int, List[int]]:
+        """Map each code cell index to the indices of the cells it reads from."""
+        last_def = {}  # name -> index of the closest defining cell
+        opaque = []    # cells that did not parse
+        upstream = {}
+        modules = self.modules(cells)
+        for i, cell in enumerate(cells):
+            if cell['cell_type'] != 'code':
+                continue
+            names = self.names(cell, modules)
+            if names is None:
+                upstream[i] = sorted(set(last_def.values()) | set(opaque))
+                opaque.append(i)
+                continue
+
+            defs, uses = names
+            deps = {last_def[name] for name in uses if name in last_def}
+            upstream[i] = sorted(deps | set(opaque))
+            for name in defs:
+                last_def[name] = i
+        return upstream
+
+    def stale(self, cells: List[Dict], changed: set) -> List[int]:
+        """
+        Cells to re-run after some cells changed.
+
+        A cell must re-run if it changed or reads a name a re-run cell
+        defines. A clean cell that redefines such a name normally keeps its
+        result, but is re-run too if a later cell reads the name, since the
+        kernel would otherwise hold the earlier cell's value.
+
+        Args:
+            cells: The notebook's cells
+            changed: Indices of edited (or never executed) code cells
+
+        Returns:
+            Indices of the cells to execute, in notebook order
+        """
+        forced = set(changed)
+        modules = self.modules(cells)
+        while True:
+            dirty = set()
+            shadowed = {}  # dirty name -> clean cell that redefined it
+            everything = False
+            restore = set()
+            result = []
+            for i, cell in enumerate(cells):
+                if cell['cell_type'] != 'code':
+                    continue
+                names = self.names(cell, modules)
+                if names is None:
+                    if i in forced or everything or dirty or shadowed:
+                        result.append(i)
+                        everything = True
+                    continue
+
+                defs, uses = names
+                restore.update(shadowed[name] for name in uses if name in shadowed)
+                if i in forced or everything or not dirty.isdisjoint(uses):
+                    result.append(i)
+                    dirty |= defs
+                    for name in defs:
+                        shadowed.pop(name, None)
+                else:
+                    for name in defs & dirty:
+                        shadowed[name] = i
+                        dirty.discard(name)
+
+            if restore <= forced:
+                return result
+            forced |= restore
+
+
+# ==================== PROFILING ====================
+
+# Run in the kernel (with store_history=False) around a profiled cell. The
+# start code snapshots CPU time and peak RSS and optionally starts a thread
+# sampling the main thread's stack; the stop code prints the deltas (and the
+# collapsed stack samples if the cell ran longer than the threshold) as JSON.
+_PROFILE_START_CODE = """
+def _nbc_profile_start(interval):
+    import sys, threading, time
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        rss = None
+    state = {'cpu': time.process_time(), 'wall': time.perf_counter(), 'rss': rss,
+             'samples': {}, 'stop': threading.Event()}
+    if interval:
+        main = threading.main_thread().ident
+        def sample():
+            samples = state['samples']
+            while not state['stop'].wait(interval):
+                frame = sys._current_frames().get(main)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                key = ';'.join(reversed(stack))
+                samples[key] = samples.get(key, 0) + 1
+        state['thread'] = threading.Thread(target=sample, daemon=True)
+        state['thread'].start()
+    return state
+_nbc_profile = _nbc_profile_start(%r)
+del _nbc_profile_start
+"""
+
+_PROFILE_STOP_CODE = """
+def _nbc_profile_stop(state, threshold):
+    import json, sys, time
+    wall = time.perf_counter() - state['wall']
+    result = {'cpu': time.process_time() - state['cpu'], 'rss': None}
+    state['stop'].set()
+    if 'thread' in state:
+        state['thread'].join()
+    if state['rss'] is not None:
+        import resource
+        scale = 1 if sys.platform == 'darwin' else 1024
+        result['rss'] = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - state['rss']) * scale
+    if threshold is not None and wall >= threshold:
+        result['samples'] = state['samples']
+    print(json.dumps(result))
+_nbc_profile_stop(_nbc_profile, %r)
+del _nbc_profile, _nbc_profile_stop
+"""
+
+PROFILE_FIELDS = ('wall_time', 'cpu_time', 'peak_rss_delta', 'output_bytes', 'timestamp')
+
+
+def _kernel_probe(kernel: 'KernelSession', code: str) -> Optional[Dict]:
+    """Run profiling code in a kernel and decode the JSON it prints (None on failure)."""
+    outputs = []
+    status, _, _ = kernel.execute(code, outputs, timeout=30, store_history=False)
+    text = ''.join(output.get('text', '') for output in outputs if output['output_type'] == 'stream')
+    if status != 'ok':
+        return None
+    try:
+        return json.loads(text) if text.strip() else {}
+    except ValueError:
+        return None
+
+
+def _write_folded_stacks(path: Path, samples: Dict[str, int]):
+    """Write stack samples in collapsed ("folded") format, hottest first."""
+    lines = [f"{stack} {count}" for stack, count in sorted(samples.items(), key=lambda item: -item[1])]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _atomic_write(path, '\n'.join(lines) + '\n')
+
+
+# ==================== EXECUTION CACHE ====================
+
+class ExecutionCache:
+    """
+    On-disk cache of code cell results keyed by content hash.
+
+    The key of a cell covers its source, the keys of the cells it reads
+    from and the fingerprints of the data files it reads, so a hit means
+    the cell would see exactly the inputs it saw when it was cached. Each
+    entry (outputs and execution count) is a compressed JSON file; when the
+    cache grows past its byte budget the least recently used entries are
+    evicted.
+    """
+
+    def __init__(self, root, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Initialize the cache.
+
+        Args:
+            root: Cache directory (created on first write)
+            max_bytes: Size budget for all entries
+        """
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json.gz"
+
+    def __contains__(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Cached entry for a key, marking it as recently used (None if absent)."""
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, outputs: List[Dict], execution_count: Optional[int]):
+        """Store the result of a successful execution."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + '.tmp')
+        entry = {'outputs': list(outputs), 'execution_count': execution_count}
+        with gzip.open(temp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump(entry, f, ensure_ascii=False, default=_json_default)
+
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(temp_path, path)
+        if self._size is not None:
+            self._size += path.stat().st_size - old_size
+        self._evict()
+
+    def _entries(self) -> List[Path]:
+        return list(self.root.glob('*/*.json.gz')) if self.root.exists() else []
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits its budget."""
+        if self._size is None:
+            self._size = sum(path.stat().st_size for path in self._entries())
+        if self._size <= self.max_bytes:
+            return
+
+        entries = sorted((path.stat().st_mtime_ns, path.stat().st_size, path)
+                         for path in self._entries())
+        for _, size, path in entries:
+            if self._size <= self.max_bytes:
+                break
+            path.unlink()
+            self._size -= size
+
+    @property
+    def size(self) -> int:
+        """Total size of all entries in bytes."""
+        if self._size is None:
+            self._size = sum(path.stat().st_size for path in self._entries())
+        return self._size
+
+    def clear(self):
+        """Delete every entry."""
+        shutil.rmtree(self.root, ignore_errors=True)
+        self._size = 0
+
+
+def _to_source_lines(text: str) -> List[str]:
+    """Split text into the nbformat list-of-lines shape (newlines kept)."""
+    return text.splitlines(keepends=True)
+
+
+def _atomic_write(path: Path, text: str):
+    """
+    Write a file so that readers see either the old or the new content.
+
+    The text goes to a temporary file in the same directory, is fsynced,
+    and then renamed over the target.
+    """
+    path = Path(path)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists():
+            os.chmod(temp_path, path.stat().st_mode & 0o777)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # Persist the rename itself
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+# Placeholders spliced out of serialized JSON (they encode as "\u0000...\u0000")
+_CELLS_PLACEHOLDER = '\x00cells\x00'
+_OUTPUTS_PLACEHOLDER = '\x00outputs\x00'
+
+
+def _value_shape(value, shape: Optional[list] = None) -> list:
+    """
+    Cheap fingerprint of a nested JSON value, to detect in-place changes.
+
+    Lists every container with its length and every dictionary key and
+    leaf value, by reference: nothing is copied or encoded, so large
+    strings such as base64 images cost one entry each.
+    """
+    if shape is None:
+        shape = []
+    if isinstance(value, dict):
+        shape += (value, len(value))
+        for key, item in value.items():
+            shape.append(key)
+            _value_shape(item, shape)
+    elif isinstance(value, list):
+        shape += (value, len(value))
+        for item in value:
+            _value_shape(item, shape)
+    else:
+        shape.append(value)
+    return shape
+
+
+def _same_shape(a: list, b: list) -> bool:
+    """True if two fingerprints from _value_shape describe the same content."""
+    return len(a) == len(b) and all(x is y or (type(x) is type(y) and x == y) for x, y in zip(a, b))
+
+
+def _join_serialized(template: str, parts: List[str]) -> str:
+    """Splice serialized cells into a serialized notebook template (indented or minified)."""
+    if '\n' not in template:
+        cells_json = '[' + ','.join(parts) + ']'
+    else:
+        cells_json = '[\n  ' + ',\n  '.join(parts) + '\n ]' if parts else '[]'
+    return template.replace(json.dumps(_CELLS_PLACEHOLDER), cells_json, 1)
+
+
+class NotebookController:
+    """
+    Main controller class for Jupyter notebook automation.
+
+    Provides full control over notebook files including viewing, editing,
+    executing, and managing cells with undo/redo capabilities.
+    """
+
+    def __init__(self, notebook_path: str, auto_backup: bool = True,
+                 persistent_kernel: bool = False,
+                 kernel_pool: Optional[KernelPool] = None,
+                 history_budget: int = 256 * 1024 * 1024,
+                 lazy: bool = False,
+                 blob_store: Optional[str] = None,
+                 blob_threshold: int = 8192,
+                 backup_keep: int = 20,
+                 exec_cache: Optional[str] = None,
+                 exec_cache_bytes: int = 256 * 1024 * 1024,
+                 profile: bool = False,
+                 profile_threshold: Optional[float] = None,
+                 stream_outputs: Optional[bool] = None,
+                 stream_limit: Optional[int] = None,
+                 events=None):
+        """
+        Initialize the notebook controller.
+
+        Args:
+            notebook_path: Path to the .ipynb file
+            auto_backup: Automatically create backup before modifications
+            persistent_kernel: Execute cells in one live kernel instead of
+                running nbconvert per cell
+            kernel_pool: Take the persistent kernel from this warm pool
+                (implies persistent_kernel)
+            history_budget: Memory budget for undo history in bytes; older
+                states spill to compressed scratch files
+            lazy: Index the notebook on load and decode cell outputs only
+                when they are accessed
+            blob_store: Directory for a content-addressed store of large
+                outputs; on save, images and big HTML outputs are moved there
+                and the notebook keeps references. Reopened automatically for
+                notebooks saved with a store.
+            blob_threshold: Minimum size (characters) of an output to move
+                into the blob store
+            backup_keep: Number of backup points to retain in the backup store
+            exec_cache: Directory for an execution result cache; cells whose
+                source, upstream cells and data files are unchanged get their
+                cached outputs back instead of being executed
+            exec_cache_bytes: Size budget of the execution cache
+            profile: Record wall time, CPU time, peak RSS growth and output
+                size of every executed cell in ``cell['metadata']['profile']``
+            profile_threshold: With profiling, sample the stack of cells
+                running at least this many seconds and write the samples
+                next to the notebook (persistent kernel only)
+            stream_outputs: Print outputs as the kernel produces them; without
+                a persistent kernel, each cell then runs in a fresh kernel
+                instead of through nbconvert. None (the default) does not
+                stream, but lets the interactive CLI turn streaming on for
+                a persistent kernel
+            stream_limit: Characters of each stream output kept in the
+                notebook during kernel execution; the rest is written to
+                ``.<notebook>.outputs/``
+            events: Where status messages go: an EventSink, ``'console'``
+                (default), ``'null'``, ``'memory'`` or a JSON lines file path
+        """
+        self.events = make_sink(events)
+        self.error_count = 0  # 'error' events so far, also counted when the sink is quiet
+        self._op_depth = 0
+        self._op_name = 'load'
+        self._op_started = time.perf_counter()
+        self.notebook_path = Path(notebook_path)
+        self.auto_backup = auto_backup
+        self.persistent_kernel = persistent_kernel or kernel_pool is not None
+        self.kernel_pool = kernel_pool
+        self.kernel = None
+        self.lazy = lazy
+        self.minify = False  # save as compact JSON (kept for notebooks loaded minified)
+        self._fragments = {}  # id(cell version) -> (cell version, value shape, serialized cell)
+        self.backups = BackupStore(self.notebook_path.parent / f".{self.notebook_path.stem}.backups",
+                                   keep_last=backup_keep)
+        self.notebook = None
+        self.current_cell_index = 0
+        self.history = NotebookHistory(max_bytes=history_budget)  # For undo/redo
+        self.search_index = SearchIndex()
+        self._ids = {}  # cell id -> cell index (-1 while reserved for a cell not yet inserted)
+        self._transaction_depth = 0
+        self.dataflow = DataflowGraph()
+        self._kernel_runs = {}  # cell key -> source hash last executed in the live kernel
+        self.exec_cache = ExecutionCache(exec_cache, exec_cache_bytes) if exec_cache else None
+        self.profile = profile or profile_threshold is not None
+        self.profile_threshold = profile_threshold
+        self.stream_outputs = stream_outputs
+        self.stream_limit = stream_limit
+
+        if not self.notebook_path.exists():
+            raise FileNotFoundError(f"Notebook not found: {notebook_path}")
+
+        self._load_notebook()
+
+        self.blob_threshold = blob_threshold
+        self.blobs = None
+        store_path = blob_store or self.notebook.get('metadata', {}).get('blob_store')
+        if store_path:
+            store_path = Path(store_path)
+            if not store_path.is_absolute() and not blob_store:
+                store_path = self.notebook_path.parent / store_path
+            self.blobs = BlobStore(store_path)
+
+        self._save_state()  # Initial state for undo
+        self._op_name = None
+
+    def _emit(self, event: str, message: Optional[str] = None, **fields):
+        """Send a status event to the event sink."""
+        if event == 'error':
+            self.error_count += 1
+        sink = self.events
+        if sink.quiet:
+            return
+        record = {'event': event, 'message': message, 'op': self._op_name,
+                  'time': round(time.time(), 6),
+                  'elapsed': round(time.perf_counter() - self._op_started, 6) if self._op_name else None}
+        record.update(fields)
+        sink.emit(record)
+
+    def _emit_outputs(self, index: int, outputs: List[Dict]):
+        """Report the outputs of an executed cell."""
+        if self.events.quiet or not outputs:
+            return
+        types = [output.get('output_type') for output in outputs]
+        if not self.events.detail:
+            self._emit('outputs', index=index, output_types=types)
+            return
+        rendered = [self._format_output(output, i) for i, output in enumerate(outputs)]
+        self._emit('outputs', '\n'.join(["\nOutputs:"] + [text for text in rendered if text]),
+                   index=index, output_types=types)
+
+    def _emit_summary(self, success_count: int, fail_count: int, extra: Tuple[str, ...] = (),
+                      title: str = "Execution Summary", **fields):
+        """Report the result of a multi-cell execution."""
+        lines = [f"\n{'='*70}", f"{title}:",
+                 f"  ✅ Successful: {success_count}",
+                 f"  ❌ Failed: {fail_count}", *extra]
+        if self.exec_cache is not None:
+            cache = self.exec_cache
+            lines.append(f"  ♻️  Cache: {cache.hits} hits, {cache.misses} misses "
+                         f"({_format_bytes(cache.size)} of {_format_bytes(cache.max_bytes)})")
+            fields.update(cache_hits=cache.hits, cache_misses=cache.misses)
+        lines.append(f"{'='*70}\n")
+        self._emit('summary', '\n'.join(lines), succeeded=success_count, failed=fail_count, **fields)
+
+    # ==================== CORE OPERATIONS ====================
+
+    def _load_notebook(self, text: Optional[str] = None):
+        """
+        Load the notebook from file.
+
+        Args:
+            text: Serialized notebook to load instead (e.g. a backup point)
+        """
+        from_file = text is None
+        if from_file:
+            with open(self.notebook_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        self.minify = text[:2] not in ('{\n', '{\r')
+        self.notebook = parse_notebook_index(text) if self.lazy else json.loads(text)
+        self._adopt_cells()
+        if from_file:
+            self._emit('load', f"✅ Loaded notebook: {self.notebook_path.name}")
+            self._emit('load', f"   Cells: {len(self.notebook['cells'])}")
+
+    def _adopt_cells(self):
+        """
+        Convert the loaded nbformat cell dictionaries to Cells with unique ids.
+
+        Cells keep the ids they were saved with; a cell without a valid id,
+        or repeating an earlier cell's id, gets a fresh one, and
+        ``nbformat_minor`` is raised to 5 so the ids are valid in the file.
+        """
+        self._ids = {}
+        cells = []
+        for cell in self.notebook['cells']:
+            cell_id = cell.get('id')
+            if not isinstance(cell_id, str) or not _CELL_ID.fullmatch(cell_id) or cell_id in self._ids:
+                cell = dict(sorted({**cell, 'id': self._fresh_id()}.items()))
+            self._ids[cell['id']] = len(cells)
+            cells.append(Cell(cell))
+        self.notebook['cells'] = cells
+        if self.notebook.get('nbformat', 4) == 4 and self.notebook.get('nbformat_minor', 0) < 5:
+            self.notebook['nbformat_minor'] = 5
+
+    def _save_notebook(self, path: Optional[Path] = None):
+        """Save the notebook to file."""
+        save_path = path or self.notebook_path
+
+        if self.blobs is not None:
+            self._externalize_outputs(save_path)
+
+        template, parts = self._serialize_parts()
+
+        if self.auto_backup and path is None:
+            self._create_backup(template, parts)
+
+        _atomic_write(save_path, _join_serialized(template, parts))
+
+        self._emit('save', f"💾 Saved notebook: {save_path.name}")
+
+    def _serialize_notebook(self) -> str:
+        """Serialize the notebook as ``json.dump(indent=1)`` would."""
+        return _join_serialized(*self._serialize_parts())
+
+    def _serialize_parts(self) -> Tuple[str, List[str]]:
+        """
+        Serialize the notebook as a template plus one fragment per cell.
+
+        Each cell's serialized fragment is cached against its history
+        version and a fingerprint of its nested values, so only cells
+        changed since the last save are re-encoded - including cells edited
+        in place, such as ``cell['outputs'].clear()``, which also get a new
+        history version - and the rest are spliced in from the cache. Lazily loaded outputs are
+        copied from the source text without being decoded (re-indented, or
+        re-encoded if the file was minified or ASCII-escaped, see
+        LazyOutputs.saved_items).
+        """
+        fragments = {}
+        parts = []
+        for cell in self.notebook['cells']:
+            version = self.history.version(cell)
+            shape = _value_shape(cell)
+            cached = self._fragments.get(id(version))
+            if (cached is None or cached[0] is not version or getattr(cell, 'dirty', False)
+                    or not _same_shape(cached[1], shape)):
+                if cached is not None and cached[0] is version:
+                    # Changed without a key being replaced: give it a new version too
+                    self.history.mark_dirty(cell)
+                    version = self.history.version(cell)
+                cached = (version, shape, self._serialize_cell(cell, self.minify))
+            fragments[id(version)] = cached
+            parts.append(cached[2])
+            if isinstance(cell, Cell):
+                cell.dirty = False
+        self._fragments = fragments
+
+        top = {k: (_CELLS_PLACEHOLDER if k == 'cells' else v) for k, v in self.notebook.items()}
+        if self.minify:
+            template = json.dumps(top, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+        else:
+            template = json.dumps(top, indent=1, ensure_ascii=False, default=_json_default)
+        return template, parts
+
+    @staticmethod
+    def _serialize_cell(cell: Dict, minify: bool = False) -> str:
+        """Serialize one cell at the indentation it has inside the notebook (or minified)."""
+        outputs = cell.get('outputs')
+        if isinstance(cell, Cell):
+            cell = dict(cell, source=cell.source_lines())
+        if minify:
+            return json.dumps(cell, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+        if isinstance(outputs, LazyOutputs):
+            cell = dict(cell, outputs=_OUTPUTS_PLACEHOLDER)
+
+        text = json.dumps(cell, indent=1, ensure_ascii=False, default=_json_default)
+        text = text.replace('\n', '\n  ')
+
+        if isinstance(outputs, LazyOutputs):
+            raw = outputs.saved_items()
+            block = '[\n    ' + ',\n    '.join(raw) + '\n   ]' if raw else '[]'
+            text = text.replace(json.dumps(_OUTPUTS_PLACEHOLDER), block, 1)
+        return text
+
+    def _create_backup(self, template: Optional[str] = None, parts: Optional[List[str]] = None):
+        """Record a backup point of the notebook in the backup store."""
+        if template is None:
+            template, parts = self._serialize_parts()
+
+        backup_id = self.backups.create(template, parts)
+
+        self._emit('backup', f"📦 Backup created: {backup_id}")
+
+    def list_backups(self) -> List[Dict]:
+        """List the backup points of this notebook."""
+        try:
+            backups = self.backups.list()
+        except (OSError, ValueError, KeyError) as e:
+            self._emit('error', f"❌ Cannot read backups: {e}")
+            return []
+
+        if self.events.quiet:
+            return backups
+        lines = [f"\n📦 Backups ({len(backups)}, {_format_bytes(self.backups.disk_usage())} on disk):"]
+        for backup in backups:
+            timestamp = datetime.fromisoformat(backup['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
+            lines.append(f"   {backup['id']} | {timestamp} | {backup['cells']} cells")
+        self._emit('backups', '\n'.join(lines), backups=[backup['id'] for backup in backups])
+
+        return backups
+
+    @_operation
+    def restore_backup(self, backup_id: Optional[str] = None, path: Optional[str] = None):
+        """
+        Restore a backup point.
+
+        Args:
+            backup_id: Backup to restore (None for the most recent)
+            path: Write the backup to this file instead of loading it into
+                the controller
+        """
+        try:
+            text = self.backups.restore_text(backup_id)
+        except FileNotFoundError as e:
+            self._emit('error', f"❌ {e}")
+            return False
+
+        if path:
+            _atomic_write(Path(path), text)
+            self._emit('restore', f"📦 Restored backup {backup_id or 'latest'} to {path}")
+            return True
+
+        self._save_state()
+        self._load_notebook(text)
+        self.current_cell_index = min(self.current_cell_index, self.get_cell_count() - 1)
+        self._emit('restore', f"📦 Restored backup {backup_id or 'latest'} ({self.get_cell_count()} cells)")
+        return True
+
+    def _externalize_outputs(self, save_path: Path):
+        """Move large outputs into the blob store, keeping references in the cells."""
+        moved = 0
+        for cell in self.notebook['cells']:
+            outputs = cell.get('outputs')
+            if not outputs:
+                continue
+            # Lazily loaded outputs that are all small never need decoding
+            if isinstance(outputs, LazyOutputs) and outputs.max_raw_size < self.blob_threshold:
+                continue
+
+            new_outputs = []
+            changed = False
+            for output in outputs:
+                new_output = self.blobs.externalize(output, self.blob_threshold)
+                if new_output is not None:
+                    changed = True
+                    moved += 1
+                new_outputs.append(new_output or output)
+            if changed:
+                cell['outputs'] = new_outputs
+
+        relative = os.path.relpath(self.blobs.root.resolve(), save_path.parent.resolve())
+        self.notebook.setdefault('metadata', {})['blob_store'] = relative
+
+        if moved:
+            self._emit('blob', f"🗃️  Moved {moved} outputs to blob store: {self.blobs.root}")
+
+    @_operation
+    def inline_outputs(self):
+        """Resolve all blob references back into the notebook (disables the store)."""
+        if self.blobs is None:
+            self._emit('error', "❌ No blob store in use")
+            return False
+
+        self._save_state()
+
+        for cell in self.notebook['cells']:
+            outputs = cell.get('outputs')
+            if outputs and any(output_blob_refs(output) for output in outputs):
+                cell['outputs'] = [self.blobs.inline(output) if output_blob_refs(output) else output
+                                   for output in outputs]
+
+        self.notebook.get('metadata', {}).pop('blob_store', None)
+        self.blobs = None
+        self._emit('blob', "📥 Inlined all blob store outputs")
+        return True
+
+    def _save_state(self):
+        """Save current state for undo functionality."""
+        if self._transaction_depth:
+            return  # The state before the transaction is already recorded
+        self.history.record(self.notebook, self.current_cell_index)
+
+    def _validate_notebook(self):
+        """Check the notebook structure, raising ValueError on the first problem."""
+        cells = self.notebook.get('cells')
+        if not isinstance(cells, list):
+            raise ValueError("Notebook has no cell list")
+
+        for i, cell in enumerate(cells):
+            cell_type = cell.get('cell_type')
+            if cell_type not in ('code', 'markdown', 'raw'):
+                raise ValueError(f"Cell {i}: invalid cell type {cell_type!r}")
+            source = cell.get('source')
+            if not isinstance(source, str) and not (
+                    isinstance(source, list) and all(isinstance(line, str) for line in source)):
+                raise ValueError(f"Cell {i}: source must be a string or a list of strings")
+            if not isinstance(cell.get('metadata', {}), dict):
+                raise ValueError(f"Cell {i}: metadata must be a dictionary")
+            if cell_type == 'code' and ('outputs' not in cell or 'execution_count' not in cell):
+                raise ValueError(f"Cell {i}: code cell is missing outputs or execution_count")
+
+        if cells and not (0 <= self.current_cell_index < len(cells)):
+            self.current_cell_index = len(cells) - 1
+
+    @contextmanager
+    def transaction(self, save: bool = False):
+        """
+        Group several edits into a single undoable change.
+
+        Edits inside the block share one history entry. When the block
+        finishes the notebook is validated once and, if requested, saved
+        once. If the block raises, or validation fails, every edit made in
+        it is rolled back and the exception is re-raised. Nested
+        transactions join the outermost one.
+
+        Args:
+            save: Save the notebook when the transaction commits
+
+        Example:
+            with nb.transaction(save=True):
+                nb.insert_cell("## Summary", cell_type='markdown', index=20)
+                nb.edit_cell("df.describe()", index=22)
+        """
+        if self._transaction_depth:
+            self._transaction_depth += 1
+            try:
+                yield self
+            finally:
+                self._transaction_depth -= 1
+            return
+
+        self._save_state()
+        checkpoint = self.history.position
+        cursor = self.current_cell_index  # not recorded if only the cursor moved since the last state
+        self._transaction_depth = 1
+        try:
+            yield self
+            self._validate_notebook()
+        except BaseException:
+            self._transaction_depth = 0
+            state = self.history.revert(checkpoint)
+            self.notebook = self.history.restore(state, self.notebook)
+            self._reset_ids()
+            self.current_cell_index = cursor
+            self._emit('rollback', "↩️  Transaction rolled back")
+            raise
+        finally:
+            self._transaction_depth = 0
+
+        if save:
+            self.save()
+
+    # ==================== CELL IDS ====================
+
+    def _fresh_id(self) -> str:
+        """A random nbformat cell id not used in the notebook (never all digits)."""
+        cell_id = new_cell_id(self._ids)
+        self._ids[cell_id] = -1  # reserved until the cell is inserted
+        return cell_id
+
+    def _claim_id(self, cell_id: Any) -> str:
+        """Keep a copied cell's id if it is valid and unused, else make a fresh one."""
+        if isinstance(cell_id, str) and _CELL_ID.fullmatch(cell_id) and cell_id not in self._ids:
+            self._ids[cell_id] = -1
+            return cell_id
+        return self._fresh_id()
+
+    def _lookup(self, cell_id: str) -> Optional[int]:
+        """Index of the cell with ``cell_id``, or None (a dict lookup; see ``_reindex``)."""
+        index = self._ids.get(cell_id)
+        return index if index is not None and index >= 0 else None
+
+    def _reindex(self, start: int = 0, removed: Iterable[Dict] = ()):
+        """
+        Bring the id map up to date after a structural change.
+
+        Every operation that inserts, removes or reorders cells calls this
+        with the first position that changed and the cells it took out, so
+        only the positions from there on are rewritten.
+        """
+        for cell in removed:
+            self._ids.pop(cell.get('id'), None)
+        cells = self.notebook['cells']
+        for i in range(start, len(cells)):
+            self._ids[cells[i]['id']] = i
+
+    def _reset_ids(self):
+        """Rebuild the id map after the whole cell list was replaced (undo, redo, rollback)."""
+        self._ids = {}
+        self._reindex()
+
+    def index_of(self, cell_id: str) -> int:
+        """
+        Get the index of a cell from its id.
+
+        Args:
+            cell_id: nbformat cell id
+
+        Returns:
+            Cell index
+
+        Raises:
+            ValueError: If no cell has this id
+        """
+        index = self._lookup(cell_id)
+        if index is None:
+            raise ValueError(f"Unknown cell id: {cell_id}")
+        return index
+
+    def get_cell_id(self, index: Optional[CellRef] = None) -> Optional[str]:
+        """Get the nbformat id of a cell (uses current if None), or None if there is no such cell."""
+        index = self._cell_index(index)
+        if index is None:
+            return None
+        if not (0 <= index < self.get_cell_count()):
+            self._emit('error', f"❌ Invalid cell index: {index}", index=index)
+            return None
+        return self.notebook['cells'][index]['id']
+
+    def _cell_index(self, ref: Optional[CellRef]) -> Optional[int]:
+        """
+        Resolve a cell reference: None (the current cell), an index or a cell id.
+
+        Returns:
+            Cell index, or None after reporting an error if no cell has the id
+        """
+        if ref is None:
+            return self.current_cell_index
+        if isinstance(ref, str):
+            index = self._lookup(ref)
+            if index is None:
+                self._emit('error', f"❌ Unknown cell id: {ref}", id=ref)
+            return index
+        return ref
+
+    # ==================== CELL NAVIGATION ====================
+
+    def get_cell_count(self) -> int:
+        """Get total number of cells."""
+        return len(self.notebook['cells'])
+
+    @_operation
+    def jump_to_cell(self, index: CellRef) -> bool:
+        """
+        Jump to a specific cell by index or id.
+
+        Args:
+            index: Cell index (0-based or negative for reverse indexing) or cell id
+
+        Returns:
+            True if successful, False otherwise
+        """
+        index = self._cell_index(index)
+        if index is None:
+            return False
+        cell_count = self.get_cell_count()
+
+        # Handle negative indexing
+        if index < 0:
+            index = cell_count + index
+
+        if 0 <= index < cell_count:
+            self.current_cell_index = index
+            self._emit('navigate', f"📍 Jumped to cell {index}", index=index)
+            return True
+        else:
+            self._emit('error', f"❌ Invalid cell index: {index} (total cells: {cell_count})", index=index)
+            return False
+
+    @_operation
+    def next_cell(self) -> bool:
+        """Move to next cell."""
+        if self.current_cell_index < self.get_cell_count() - 1:
+            self.current_cell_index += 1
+            self._emit('navigate', f"➡️  Moved to cell {self.current_cell_index}")
+            return True
+        else:
+            self._emit('error', "❌ Already at last cell")
+            return False
+
+    @_operation
+    def prev_cell(self) -> bool:
+        """Move to previous cell."""
+        if self.current_cell_index > 0:
+            self.current_cell_index -= 1
+            self._emit('navigate', f"⬅️  Moved to cell {self.current_cell_index}")
+            return True
+        else:
+            self._emit('error', "❌ Already at first cell")
+            return False
+
+    @_operation
+    def first_cell(self):
+        """Jump to first cell."""
+        self.current_cell_index = 0
+        self._emit('navigate', "⏮️  Moved to first cell")
+
+    @_operation
+    def last_cell(self):
+        """Jump to last cell."""
+        self.current_cell_index = self.get_cell_count() - 1
+        self._emit('navigate', "⏭️  Moved to last cell")
+
+    # ==================== CELL VIEWING ====================
+
+    def view_cell(self, index: Optional[CellRef] = None, show_output: bool = True) -> Dict:
+        """
+        View a cell's content.
+
+        Args:
+            index: Cell index or id (uses current if None)
+            show_output: Print the cell content
+
+        Returns:
+            Cell dictionary
+        """
+        index = self._cell_index(index)
+        if index is None:
+            return {}
+
+        if not (0 <= index < self.get_cell_count()):
+            self._emit('error', f"❌ Invalid cell index: {index}", index=index)
+            return {}
+
+        cell = self.notebook['cells'][index]
+
+        if show_output and not self.events.quiet:
+            self._emit('view', self._render_cell(cell, index), index=index,
+                       cell_type=cell['cell_type'], id=cell.get('id'))
+
+        return cell
+
+    def _render_cell(self, cell: Dict, index: int) -> str:
+        """Render a cell as console text."""
+        cell_type = cell['cell_type']
+        lines = [f"\n{'='*70}",
+                 f"Cell {index} | Type: {cell_type.upper()} | Id: {cell.get('id')}",
+                 f"{'='*70}",
+                 cell.text]
+
+        # Show outputs for code cells
+        if cell_type == 'code' and cell.get('outputs') and self.events.detail:
+            lines.extend([f"\n{'-'*70}", "OUTPUTS:", f"{'-'*70}"])
+            for i, output in enumerate(cell['outputs']):
+                text = self._format_output(output, i)
+                if text:
+                    lines.append(text)
+
+        lines.append(f"{'='*70}\n")
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _format_output(output: Dict, index: int) -> str:
+        """Render a cell output as console text."""
+        output_type = output.get('output_type', 'unknown')
+        parts = []
+
+        if output_type == 'stream':
+            text = ''.join(output.get('text', []))
+            parts.append(f"[Stream {index}]:\n{text}")
+
+        elif output_type == 'execute_result' or output_type == 'display_data':
+            data = output.get('data', {})
+            if 'text/plain' in data:
+                text = ''.join(data['text/plain'])
+                parts.append(f"[Result {index}]:\n{text}")
+            if 'image/png' in data or 'image/png' in output_blob_refs(output):
+                parts.append(f"[Image {index}]: <PNG image data>")
+
+        elif output_type == 'error':
+            ename = output.get('ename', 'Error')
+            evalue = output.get('evalue', '')
+            parts.append(f"[Error {index}]: {ename}: {evalue}")
+
+        return '\n'.join(parts)
+
+    def list_all_cells(self, show_content: bool = False):
+        """
+        List all cells in the notebook.
+
+        Args:
+            show_content: Show first 100 chars of each cell
+        """
+        if self.events.quiet:
+            return
+        lines = [f"\n📓 Notebook: {self.notebook_path.name}",
+                 f"Total cells: {self.get_cell_count()}\n"]
+
+        for i, cell in enumerate(self.notebook['cells']):
+            marker = "👉" if i == self.current_cell_index else "  "
+            line = f"{marker} Cell {i:3d} | {cell['cell_type']:8s} | {cell.get('id', ''):8s} |"
+
+            if show_content:
+                source = cell.text
+                preview = source[:100].replace('\n', ' ')
+                if len(source) > 100:
+                    preview += "..."
+                lines.append(f"{line} {preview}")
+            else:
+                lines.append(f"{line} {cell.line_count} lines")
+
+        self._emit('list', '\n'.join(lines), cells=self.get_cell_count(), current=self.current_cell_index)
+
+    @_operation
+    def search_cells(self, pattern: str, regex: bool = False, cell_type: Optional[str] = None):
+        """
+        Search for pattern in cells.
+
+        Args:
+            pattern: Search pattern
+            regex: Use regex matching
+            cell_type: Filter by cell type ('code' or 'markdown')
+        """
+        results = self.search_index.search(self.notebook['cells'], pattern, regex, cell_type)
+        matches = [(i, source) for i, source, _ in results]
+
+        if self.events.quiet:
+            return matches
+        lines = [f"\n🔍 Searching for: '{pattern}'"]
+        if cell_type:
+            lines.append(f"   Filter: {cell_type} cells only")
+        lines.append(f"\n✅ Found {len(matches)} matches\n")
+        if self.events.detail:
+            for i, _, hits in results:
+                lines.append(f"Cell {i} ({self.notebook['cells'][i]['cell_type']}):")
+                lines.extend(f"  Line {line_num}: {line.strip()}" for line_num, line in hits)
+                lines.append('')
+        self._emit('search', '\n'.join(lines), pattern=pattern, matches=[i for i, _ in matches])
+
+        return matches
+
+    # ==================== CELL EDITING ====================
+
+    @_operation
+    def edit_cell(self, content: str, index: Optional[CellRef] = None, cell_type: Optional[str] = None):
+        """
+        Edit a cell's content.
+
+        Args:
+            content: New content (string or list of strings)
+            index: Cell index or id (uses current if None)
+            cell_type: Change cell type ('code' or 'markdown')
+        """
+        index = self._cell_index(index)
+        if index is None:
+            return False
+
+        if not (0 <= index < self.get_cell_count()):
+            self._emit('error', f"❌ Invalid cell index: {index}", index=index)
+            return False
+
+        self._save_state()
+
+        cell = self.notebook['cells'][index]
+
+        # Update content (a list of lines is joined by the Cell)
+        cell['source'] = content
+        self.search_index.update(cell)
+
+        # Update cell type if specified
+        if cell_type:
+            if cell_type not in ['code', 'markdown']:
+                self._emit('error', f"❌ Invalid cell type: {cell_type}")
+                return False
+
+            old_type = cell['cell_type']
+            cell['cell_type'] = cell_type
+
+            # Update metadata based on type
+            if cell_type == 'code':
+                if 'execution_count' not in cell:
+                    cell['execution_count'] = None
+                if 'outputs' not in cell:
+                    cell['outputs'] = []
+            else:
+                # Remove code-specific fields from markdown
+                cell.pop('execution_count', None)
+                cell.pop('outputs', None)
+
+            self._emit('edit', f"✏️  Changed cell {index} type: {old_type} → {cell_type}", index=index)
+
+        self._emit('edit', f"✏️  Edited cell {index}", index=index)
+        return True
+
+    @_operation
+    def append_to_cell(self, content: str, index: Optional[CellRef] = None):
+        """Append content to a cell."""
+        index = self._cell_index(index)
+        if index is None:
+            return False
+
+        if not (0 <= index < self.get_cell_count()):
+            self._emit('error', f"❌ Invalid cell index: {index}", index=index)
+            return False
+
+        cell = self.notebook['cells'][index]
+        current_source = cell.text
+        new_source = current_source + '\n' + content
+
+        return self.edit_cell(new_source, index)
+
+    @_operation
+    def clear_cell(self, index: Optional[CellRef] = None):
+        """Clear a cell's content."""
+        index = self._cell_index(index)
+        if index is None:
+            return False
+
+        return self.edit_cell("", index)
+
+    @_operation
+    def clear_outputs(self, index: Optional[CellRef] = None):
+        """Clear outputs from a code cell."""
+        index = self._cell_index(index)
+        if index is None:
+            return False
+
+        if not (0 <= index < self.get_cell_count()):
+            self._emit('error', f"❌ Invalid cell index: {index}", index=index)
+            return False
+
+        cell = self.notebook['cells'][index]
+
+        if cell['cell_type'] != 'code':
+            self._emit('error', f"❌ Cell {index} is not a code cell", index=index)
+            return False
+
+        self._save_state()
+
+        cell['outputs'] = []
+        cell['execution_count'] = None
+
+        self._emit('clear', f"🧹 Cleared outputs from cell {index}", index=index)
+        return True
+
+    @_operation
+    def clear_all_outputs(self) -> int:
+        """Clear all outputs from all code cells and return how many were cleared."""
+        self._save_state()
+
+        count = 0
+        for cell in self.notebook['cells']:
+            if cell['cell_type'] == 'code':
+                cell['outputs'] = []
+                cell['execution_count'] = None
+                count += 1
+
+        self._emit('clear', f"🧹 Cleared outputs from {count} code cells")
+        return count
+
+    # ==================== CELL INSERTION/DELETION ====================
+
+    @_operation
+    def insert_cell(self, content: str, cell_type: str = 'code',
+                   index: Optional[CellRef] = None, position: str = 'after'):
+        """
+        Insert a new cell.
+
+        Args:
+            content: Cell content
+            cell_type: 'code' or 'markdown'
+            index: Position reference, an index or id (uses current if None)
+            position: 'before', 'after', or 'replace'
+        """
+        index = self._cell_index(index)
+        if index is None:
+            return False
+
+        if cell_type not in ['code', 'markdown']:
+            self._emit('error', f"❌ Invalid cell type: {cell_type}")
+            return False
+
+        self._save_state()
+
+        # Create new cell
+        new_cell = self._new_cell(content, cell_type)
+
+        # Insert at position
+        if position == 'before':
+            insert_index = index
+        elif position == 'after':
+            insert_index = index + 1
+        elif position == 'replace':
+            replaced = self.notebook['cells'][index]
+            self.search_index.remove(replaced)
+            self.notebook['cells'][index] = new_cell
+            self._reindex(index, [replaced])
+            self.search_index.update(new_cell)
+            self._emit('insert', f"✏️  Replaced cell {index} ({cell_type})", index=index)
+            return True
+        else:
+            self._emit('error', f"❌ Invalid position: {position}")
+            return False
 
         self.notebook['cells'].insert(insert_index, new_cell)
-        print(f"➕ Inserted {cell_type} cell at position {insert_index}")
+        self._reindex(insert_index)
+        self.search_index.update(new_cell)
+        self._emit('insert', f"➕ Inserted {cell_type} cell at position {insert_index}")
+
+        # Update current position
+        if position == 'before' or position == 'replace':
+            self.current_cell_index = insert_index
+        else:
+            self.current_cell_index = insert_index
+
+        return True
+
+    def _new_cell(self, content: str, cell_type: str = 'code') -> Cell:
+        """Create an empty-output cell of the given type with a fresh id."""
+        new_cell = Cell({
+            'cell_type': cell_type,
+            'id': self._fresh_id(),
+            'metadata': {},
+            'source': content
+        })
+
+        if cell_type == 'code':
+            new_cell['execution_count'] = None
+            new_cell['outputs'] = []
+        return new_cell
+
+    @_operation
+    def delete_cell(self, index: Optional[CellRef] = None):
+        """Delete a cell."""
+        index = self._cell_index(index)
+        if index is None:
+            return False
+
+        if not (0 <= index < self.get_cell_count()):
+            self._emit('error', f"❌ Invalid cell index: {index}", index=index)
+            return False
+
+        if self.get_cell_count() == 1:
+            self._emit('error', "❌ Cannot delete the only cell in the notebook")
+            return False
+
+        self._save_state()
+
+        deleted_cell = self.notebook['cells'].pop(index)
+        self._reindex(index, [deleted_cell])
+        self.search_index.remove(deleted_cell)
+        self._emit('delete', f"🗑️  Deleted cell {index} ({deleted_cell['cell_type']})", index=index)
+
+        # Adjust current position
+        if self.current_cell_index >= self.get_cell_count():
+            self.current_cell_index = self.get_cell_count() - 1
+
+        return True
+
+    @_operation
+    def duplicate_cell(self, index: Optional[CellRef] = None):
+        """Duplicate a cell."""
+        index = self._cell_index(index)
+        if index is None:
+            return False
+
+        cell = self.view_cell(index, show_output=False)
+        if not cell:
+            return False
+
+        self.insert_cell(cell.text, cell['cell_type'], index, 'after')
+
+        return True
+
+    # ==================== CELL EXECUTION ====================
+
+    @_operation
+    def execute_cell(self, index: Optional[CellRef] = None, timeout: int = 60) -> Tuple[bool, str]:
+        """
+        Execute a code cell and capture output.
+
+        Args:
+            index: Cell index or id (uses current if None)
+            timeout: Execution timeout in seconds
+
+        Returns:
+            (success, output_message)
+        """
+        ref, index = index, self._cell_index(index)
+        if index is None:
+            return False, f"Unknown cell id: {ref}"
+
+        if not (0 <= index < self.get_cell_count()):
+            self._emit('error', f"❌ Invalid cell index: {index}", index=index)
+            return False, f"Invalid cell index: {index}"
+
+        cell = self.notebook['cells'][index]
+
+        if cell['cell_type'] != 'code':
+            self._emit('error', f"❌ Cell {index} is not a code cell", index=index)
+            return False, f"Cell {index} is not a code cell"
+
+        key = self._cache_lookup(index)
+        if key is True:
+            return True, "Restored from cache"
+
+        return self._run_cell(index, timeout, key)
+
+    def _cache_lookup(self, index: int):
+        """
+        Restore a cell from the execution cache if possible.
+
+        Returns:
+            True if the cell was restored, otherwise its cache key (None without a cache)
+        """
+        if self.exec_cache is None:
+            return None
+        keys, upstream = self._cache_keys()
+        key = keys[index]
+        needed_later = self.persistent_kernel and any(
+            index in deps for j, deps in upstream.items() if j > index)
+        if not needed_later and self._restore_cached(index, key):
+            return True
+        return key
+
+    def _run_cell(self, index: int, timeout: int, cache_key: Optional[str] = None) -> Tuple[bool, str]:
+        """Execute a code cell, storing the result in the execution cache on success."""
+        cell = self.notebook['cells'][index]
+
+        self._emit('execute', f"▶️  Executing cell {index}...", index=index)
+
+        probe = self._profile_start() if self.profile else None
+        started = time.perf_counter()
+
+        if self.persistent_kernel:
+            success, message = self._execute_in_kernel(index, cell.text, timeout)
+        elif self.stream_outputs:
+            success, message = self._execute_in_fresh_kernel(index, cell.text, timeout)
+        else:
+            success, message = self._execute_with_nbconvert(index, timeout)
+
+        self._finish_run(index, cache_key, probe, time.perf_counter() - started, success)
+        return success, message
+
+    def _finish_run(self, index: int, cache_key: Optional[str], probe: Optional[Dict],
+                    wall_time: float, success: bool):
+        """Record the profile and cache entry of a cell that just ran."""
+        if probe is not None:
+            self._profile_stop(index, probe, wall_time)
+
+        if cache_key is not None:
+            self.exec_cache.misses += 1
+        if success and cache_key is not None:
+            cell = self.notebook['cells'][index]
+            self.exec_cache.put(cache_key, cell.get('outputs', []), cell.get('execution_count'))
+
+    def _execute_with_nbconvert(self, index: int, timeout: int) -> Tuple[bool, str]:
+        """Execute a code cell in a fresh kernel through ``jupyter nbconvert``."""
+        temp_path, command = self._nbconvert_job(index, timeout)
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=timeout + 10)
+            return self._finish_nbconvert(index, temp_path, result.returncode, result.stderr)
+
+        except subprocess.TimeoutExpired:
+            self._emit('error', f"❌ Execution timed out after {timeout} seconds")
+            return False, "Timeout"
+
+        except Exception as e:
+            self._emit('error', f"❌ Execution error: {str(e)}")
+            return False, str(e)
+
+        finally:
+            # Clean up temp file
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _nbconvert_job(self, index: int, timeout: int) -> Tuple[str, List[str]]:
+        """Write a single-cell notebook for ``nbconvert`` and return its path and command."""
+        cell = self.notebook['cells'][index]
+
+        # Create temporary notebook with single cell
+        temp_nb = {
+            'cells': [copy.deepcopy(cell)],
+            'metadata': self.notebook.get('metadata', {}),
+            'nbformat': self.notebook.get('nbformat', 4),
+            'nbformat_minor': self.notebook.get('nbformat_minor', 0)
+        }
+
+        # Execute using jupyter nbconvert
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.ipynb', delete=False) as f:
+            temp_path = f.name
+            json.dump(temp_nb, f, default=_json_default)
+
+        command = ['jupyter', 'nbconvert', '--to', 'notebook', '--execute',
+                   '--ExecutePreprocessor.timeout=' + str(timeout),
+                   '--output', temp_path, temp_path]
+        return temp_path, command
+
+    def _finish_nbconvert(self, index: int, temp_path: str, returncode: int,
+                          stderr: str) -> Tuple[bool, str]:
+        """Copy the outputs of a finished ``nbconvert`` run back into the cell."""
+        if returncode != 0:
+            self._emit('error', f"❌ Execution failed:\n{stderr}")
+            return False, stderr
+
+        # Read executed notebook
+        with open(temp_path, 'r') as f:
+            executed_nb = json.load(f)
+
+        # Update cell with outputs
+        self._save_state()
+        executed_cell = executed_nb['cells'][0]
+        if self.stream_limit is not None:
+            self._cap_streams(index, executed_cell.get('outputs', []))
+        self.notebook['cells'][index]['outputs'] = executed_cell.get('outputs', [])
+        self.notebook['cells'][index]['execution_count'] = executed_cell.get('execution_count')
+
+        self._emit('executed', f"✅ Cell {index} executed successfully", index=index)
+
+        # Show outputs
+        self._emit_outputs(index, self.notebook['cells'][index]['outputs'])
+
+        return True, "Execution successful"
+
+    def _stream_spill(self, index: int) -> StreamSpill:
+        """A spill applying ``stream_limit`` to the streams of a cell."""
+        cell = self.notebook['cells'][index]
+        return StreamSpill(self.notebook_path.parent / f".{self.notebook_path.stem}.outputs",
+                           f"cell_{cell.get('id') or index}", self.stream_limit)
+
+    def _report_spill(self, spill: Optional[StreamSpill]):
+        if spill is not None and spill.paths:
+            self._emit('spill', f"💾 Spilled {len(spill.paths)} oversized stream(s) to {spill.directory.name}/")
+
+    def _cap_streams(self, index: int, outputs: List[Dict]):
+        """Apply ``stream_limit`` to stream outputs collected all at once (by nbconvert)."""
+        spill = self._stream_spill(index)
+        for output in outputs:
+            if output.get('output_type') == 'stream':
+                output['text'] = [spill.accept(output, cell_source({'source': output.get('text', '')}))]
+        spill.close()
+        for output in outputs:
+            if output.get('output_type') == 'stream':
+                output['text'] = _to_source_lines(''.join(output['text']))
+        self._report_spill(spill)
+
+    def _execute_in_fresh_kernel(self, index: int, source: str, timeout: int) -> Tuple[bool, str]:
+        """Execute a code cell in a kernel started for it alone, streaming its outputs."""
+        try:
+            kernel = self._new_kernel()
+        except Exception as e:
+            self._emit('error', f"❌ Execution error: {str(e)}")
+            return False, str(e)
+        try:
+            return self._execute_in_kernel(index, source, timeout, kernel)
+        finally:
+            kernel.shutdown()
+
+    def _execute_in_kernel(self, index: int, source: str, timeout: int,
+                           kernel: Optional[KernelSession] = None) -> Tuple[bool, str]:
+        """Execute a code cell in the persistent kernel (or the given one)."""
+        if kernel is None:
+            try:
+                kernel = self._get_kernel()
+            except Exception as e:
+                self._emit('error', f"❌ Execution error: {str(e)}")
+                return False, str(e)
+
+        self._save_state()
+        cell = self.notebook['cells'][index]
+        cell['outputs'] = []
+        cell['execution_count'] = None
+
+        spill = self._stream_spill(index) if self.stream_limit is not None else None
+
+        streaming = self.stream_outputs and not self.events.quiet
+        if streaming:
+            self._emit('outputs', "\nOutputs:", index=index)
+
+        status, execution_count, message = kernel.execute(
+            source, cell['outputs'], timeout,
+            on_output=self._output_reporter(index, cell['outputs']) if streaming else None, spill=spill)
+        cell['execution_count'] = execution_count
+        for output in cell['outputs']:
+            if output['output_type'] == 'stream':
+                output['text'] = _to_source_lines(output['text'])
+        self.history.mark_dirty(cell)
+        if kernel is self.kernel:
+            if status == 'ok':
+                self._kernel_runs[self._cell_key(cell)] = cell.content_hash
+            else:
+                self._kernel_runs.pop(self._cell_key(cell), None)
+        self._report_spill(spill)
+
+        if status == 'timeout':
+            self._emit('error', f"❌ Execution timed out after {timeout} seconds")
+            return False, "Timeout"
+
+        if status == 'ok':
+            self._emit('executed', f"✅ Cell {index} executed successfully", index=index)
+        else:
+            self._emit('error', f"❌ Execution failed:\n{message}")
+
+        if not self.stream_outputs:
+            self._emit_outputs(index, cell['outputs'])
+
+        return status == 'ok', message
+
+    def _output_reporter(self, index: int, outputs: List[Dict]) -> Callable[[Dict, Optional[str]], None]:
+        """The ``on_output`` callback reporting outputs of a cell as they arrive in ``outputs``."""
+        def show_output(output, text):
+            if text is not None:
+                if self.events.detail:
+                    self._emit('stream', text, index=index, name=output['name'])
+            else:
+                position = len(outputs) - 1
+                self._emit('output', self._format_output(output, position) if self.events.detail else None,
+                           index=index, output_type=output['output_type'], position=position)
+
+        return show_output
+
+    def _get_kernel(self) -> KernelSession:
+        """Return the live kernel, starting it on first use."""
+        if self.kernel is not None and self.kernel.is_alive:
+            return self.kernel
+
+        self._emit('kernel', "🚀 Using warm kernel from pool" if self.kernel_pool is not None else "🚀 Starting kernel...")
+        kernel = self._new_kernel()
+        self.kernel = kernel
+        self._kernel_runs = {}
+        return kernel
+
+    @_operation
+    def restart_kernel(self):
+        """Restart the persistent kernel, clearing its namespace."""
+        if self.kernel is None or not self.kernel.is_alive:
+            self._emit('error', "❌ No kernel running")
+            return False
+        self.kernel.restart()
+        self._kernel_runs = {}
+        self._emit('kernel', "🔄 Kernel restarted")
+        return True
+
+    @_operation
+    def shutdown_kernel(self):
+        """Shut down the persistent kernel if one is running."""
+        if self.kernel is not None:
+            self.kernel.shutdown()
+            self.kernel = None
+            self._kernel_runs = {}
+            self._emit('kernel', "⏹️  Kernel shut down")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """Shut down the kernel and remove spilled undo history."""
+        self.shutdown_kernel()
+        self.history.close()
+
+    @_operation
+    def execute_all_cells(self, start_index: CellRef = 0, end_index: Optional[CellRef] = None,
+                          timeout: int = 60, workers: int = 1) -> bool:
+        """
+        Execute all cells in range.
+
+        Args:
+            start_index: Start from this cell (index or id)
+            end_index: End at this cell (inclusive, index or id, None = end)
+            timeout: Per-cell execution timeout in seconds
+            workers: Number of kernels; above 1, read-only cells run
+                concurrently on replica kernels (see ``_execute_parallel``)
+
+        Returns:
+            True if every code cell executed successfully
+        """
+        start_index = self._cell_index(start_index)
+        end_index = self.get_cell_count() - 1 if end_index is None else self._cell_index(end_index)
+        if start_index is None or end_index is None:
+            return False
+
+        if workers > 1:
+            return self._execute_parallel(list(range(start_index, end_index + 1)), workers, timeout)
+
+        self._emit('execute', f"\n▶️  Executing cells {start_index} to {end_index}...")
+
+        if self.persistent_kernel:
+            try:
+                self._get_kernel()
+            except Exception as e:
+                self._emit('error', f"❌ Execution error: {str(e)}")
+                return False
+
+        success_count = 0
+        fail_count = 0
+
+        keys = {}
+        cached = set()
+        if self.exec_cache is not None:
+            keys, upstream = self._cache_keys()
+            cached = self._cache_plan(range(start_index, end_index + 1), keys, upstream)
+
+        for i in range(start_index, end_index + 1):
+            cell = self.notebook['cells'][i]
+
+            if cell['cell_type'] == 'code':
+                if i in cached and self._restore_cached(i, keys[i]):
+                    success_count += 1
+                    continue
+                success, msg = self._run_cell(i, timeout, keys.get(i))
+                if success:
+                    success_count += 1
+                else:
+                    fail_count += 1
+                    self._emit('warning', f"\n⚠️  Failed at cell {i}, stopping execution", index=i)
+                    break
+
+        self._emit_summary(success_count, fail_count)
+
+        return fail_count == 0
+
+    def _new_kernel(self) -> KernelSession:
+        """Start a kernel for this notebook, taking it from the pool if there is one."""
+        cwd = str(self.notebook_path.parent.resolve())
+        if self.kernel_pool is not None:
+            kernel = self.kernel_pool.acquire()
+            kernel.set_cwd(cwd)
+            return kernel
+        kernelspec = self.notebook.get('metadata', {}).get('kernelspec', {})
+        kernel = KernelSession(kernelspec.get('name', 'python3'), cwd=cwd)
+        kernel.start()
+        return kernel
+
+    def _parallel_plan(self, indices: List[int], workers: int) -> Tuple[Dict[int, int], List[List[int]]]:
+        """
+        Split code cells between kernels.
+
+        Cells that no later cell reads from ("leaves", such as plots and
+        summaries) can run on any kernel; the remaining cells form the spine
+        and run on kernel 0. Each leaf goes to the kernel where it adds the
+        fewest cells to run, counting the spine cells that kernel has to
+        replay to reach the leaf's inputs. A leaf stays on kernel 0 when it,
+        or any cell a replica would replay for it, has side effects (see
+        ``DataflowGraph.side_effects``), so those cells run exactly once.
+
+        Returns:
+            (cell index -> owning kernel, cells each kernel runs in order)
+        """
+        cells = self.notebook['cells']
+        upstream = self.dataflow.upstream(cells)
+        code = [i for i in indices if cells[i]['cell_type'] == 'code']
+
+        read_from = set()
+        for deps in upstream.values():
+            read_from.update(deps)
+
+        def closure(targets) -> set:
+            needed = set(targets)
+            stack = list(targets)
+            while stack:
+                for j in upstream.get(stack.pop(), ()):
+                    if j not in needed:
+                        needed.add(j)
+                        stack.append(j)
+            return needed
+
+        leaves = [i for i in code if i not in read_from
+                  and not any(self.dataflow.side_effects(cells[j]) for j in closure([i]))]
+        spine = [i for i in code if i not in set(leaves)]
+
+        owner = {i: 0 for i in spine}
+        runs = [closure(spine)] + [set() for _ in range(workers - 1)]
+        for leaf in leaves:
+            needed = closure([leaf])
+            worker = min(range(workers), key=lambda w: (len(runs[w] | needed), w))
+            runs[worker] |= needed
+            owner[leaf] = worker
+        return owner, [sorted(run) for run in runs]
+
+    def _execute_parallel(self, indices: List[int], workers: int, timeout: int) -> bool:
+        """
+        Execute code cells on several kernels at once.
+
+        Kernel 0 (the persistent kernel, if enabled) runs every cell that
+        later cells depend on; replica kernels replay just the cells their
+        leaves need and run the leaves concurrently. Cells with cached
+        results are restored instead of run. Once a cell fails, no kernel
+        starts a later cell; outputs of every cell that ran are merged back
+        in notebook order with the execution counts their kernels gave them,
+        so wall time follows the dependency chain rather than the number of
+        cells. Profiling needs one kernel per run and is rejected here.
+        """
+        if self.profile:
+            self._emit('error', "❌ Profiling measures one kernel at a time; run with workers=1 to profile")
+            return False
+
+        cells = self.notebook['cells']
+        keys = {}
+        restored = set()
+        if self.exec_cache is not None:
+            # Replicas replay whatever inputs they need, so any cached cell can be restored
+            keys, _ = self._cache_keys()
+            restored = {i for i in indices if i in keys and keys[i] in self.exec_cache
+                        and self._restore_cached(i, keys[i])}
+
+        owner, runs = self._parallel_plan([i for i in indices if i not in restored], workers)
+        if not owner:
+            self._emit_summary(len(restored), 0)
+            return True
+        workers = len([run for run in runs if run]) or 1
+        runs = runs[:workers]
+
+        self._emit('execute', f"\n▶️  Executing {len(owner)} cells on {workers} kernels "
+                              f"({len([i for i in owner if owner[i] == 0])} on the main kernel)...")
+
+        kernels = [None] * workers
+        errors = []
+        replay_dir = None
+
+        def start(w):
+            try:
+                kernels[w] = self._get_kernel() if w == 0 and self.persistent_kernel else self._new_kernel()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=start, args=(w,), daemon=True) for w in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        try:
+            if errors:
+                self._emit('error', f"❌ Execution error: {str(errors[0])}")
+                return False
+
+            # Cells outside the range that the persistent kernel already holds need no replay
+            if self.persistent_kernel:
+                runs[0] = [i for i in runs[0] if i in owner
+                           or self._kernel_runs.get(self._cell_key(cells[i])) != cells[i].content_hash]
+
+            results = [{} for _ in range(workers)]  # cell index -> (status, execution count, outputs, message)
+            spills = {}  # cell index -> spill of an owned cell
+            failed = [len(cells)]  # lowest index that failed on any kernel
+            lock = threading.Lock()
+            streaming = self.stream_outputs and not self.events.quiet
+            reporting = [None]  # cell whose outputs were reported last
+            if self.stream_limit is not None:
+                # Replayed cells spill apart from the notebook's spill files; their outputs are dropped
+                replay_dir = Path(tempfile.mkdtemp(prefix='nb_replay_'))
+            started = time.time()
+
+            def on_output(index, outputs):
+                report = self._output_reporter(index, outputs)
+
+                def show_output(output, text):
+                    with lock:
+                        if reporting[0] != index:
+                            reporting[0] = index
+                            self._emit('outputs', f"\nOutputs (cell {index}):", index=index)
+                        report(output, text)
+
+                return show_output
+
+            def work(w):
+                for i in runs[w]:
+                    with lock:
+                        if i > failed[0]:
+                            return
+                    outputs = []
+                    spill = None
+                    if self.stream_limit is not None:
+                        if owner.get(i) == w:
+                            spill = spills[i] = self._stream_spill(i)
+                        else:
+                            spill = StreamSpill(replay_dir / str(w), f"cell_{i}", self.stream_limit)
+                    status, execution_count, message = kernels[w].execute(
+                        cells[i].text, outputs, timeout,
+                        on_output=on_output(i, outputs) if streaming and owner.get(i) == w else None,
+                        spill=spill)
+                    results[w][i] = (status, execution_count, outputs, message)
+                    if status != 'ok':
+                        with lock:
+                            failed[0] = min(failed[0], i)
+                        return
+
+            threads = [threading.Thread(target=work, args=(w,), daemon=True) for w in range(workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.time() - started
+
+            if self.persistent_kernel:
+                for i, (status, _, _, _) in results[0].items():
+                    if status == 'ok':
+                        self._kernel_runs[self._cell_key(cells[i])] = cells[i].content_hash
+                    else:
+                        self._kernel_runs.pop(self._cell_key(cells[i]), None)
+        finally:
+            for w, kernel in enumerate(kernels):
+                if kernel is not None and not (w == 0 and self.persistent_kernel):
+                    kernel.shutdown()
+            if replay_dir is not None:
+                shutil.rmtree(replay_dir, ignore_errors=True)
+
+        # Merge outputs back in notebook order; cells after a failure did not start
+        self._save_state()
+        success_count = len(restored)
+        fail_count = 0
+        for i in sorted(owner):
+            result = results[owner[i]].get(i)
+            if result is None:
+                continue
+            status, execution_count, outputs, message = result
+            for output in outputs:
+                if output['output_type'] == 'stream':
+                    output['text'] = _to_source_lines(output['text'])
+            cell = cells[i]
+            cell['outputs'] = outputs
+            cell['execution_count'] = execution_count
+            self._report_spill(spills.get(i))
+
+            if status == 'ok':
+                success_count += 1
+                self._emit('executed', f"✅ Cell {i} executed successfully (kernel {owner[i]})", index=i)
+            elif status == 'timeout':
+                fail_count += 1
+                self._emit('error', f"❌ Cell {i} timed out after {timeout} seconds", index=i)
+            else:
+                fail_count += 1
+                self._emit('error', f"❌ Cell {i} failed:\n{message or status}", index=i)
+            if not self.stream_outputs:
+                self._emit_outputs(i, outputs)
+            self._finish_run(i, keys.get(i), None, 0.0, status == 'ok')
+
+        if failed[0] < len(cells):
+            self._emit('warning', f"\n⚠️  Failed at cell {failed[0]}, stopping execution", index=failed[0])
+
+        self._emit_summary(success_count, fail_count, (f"  🧵 Kernels: {workers} ({elapsed:.1f}s)",),
+                           kernels=workers)
+
+        return failed[0] == len(cells)
+
+    # ==================== PROFILING ====================
+
+    def _profile_start(self) -> Dict:
+        """Snapshot resource usage before a profiled cell runs."""
+        probe = {}
+        if self.persistent_kernel:
+            try:
+                kernel = self._get_kernel()
+            except Exception:
+                return probe  # _execute_in_kernel reports the error
+            interval = 0.005 if self.profile_threshold is not None else None
+            if _kernel_probe(kernel, _PROFILE_START_CODE % (interval,)) is not None:
+                probe['kernel'] = kernel
+        elif resource is not None:
+            # nbconvert runs in a child process; its usage shows up once it is reaped
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            probe['children_cpu'] = usage.ru_utime + usage.ru_stime
+        return probe
+
+    def _profile_stop(self, index: int, probe: Dict, wall_time: float):
+        """Record the profile of a cell that just ran into its metadata."""
+        cell = self.notebook['cells'][index]
+        cpu_time = None
+        rss_delta = None
+        samples = None
+
+        kernel = probe.get('kernel')
+        if kernel is not None and kernel.is_alive:
+            result = _kernel_probe(kernel, _PROFILE_STOP_CODE % (self.profile_threshold,))
+            if result:
+                cpu_time = result.get('cpu')
+                rss_delta = result.get('rss')
+                samples = result.get('samples')
+        elif 'children_cpu' in probe:
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu_time = usage.ru_utime + usage.ru_stime - probe['children_cpu']
+
+        outputs = cell.get('outputs', [])
+        profile = {
+            'wall_time': round(wall_time, 4),
+            'cpu_time': None if cpu_time is None else round(cpu_time, 4),
+            'peak_rss_delta': rss_delta,
+            'output_bytes': len(json.dumps(outputs, ensure_ascii=False, default=_json_default)),
+            'timestamp': datetime.now().isoformat(timespec='seconds')
+        }
+        previous = cell.get('metadata', {}).get('profile')
+        if previous:
+            profile['previous'] = {k: previous.get(k) for k in PROFILE_FIELDS}
+
+        if samples:
+            name = f"cell_{cell.get('id') or index}.folded"
+            dump = self.notebook_path.parent / f".{self.notebook_path.stem}.profiles" / name
+            _write_folded_stacks(dump, samples)
+            profile['samples'] = str(dump.relative_to(self.notebook_path.parent))
+            self._emit('profile', f"🔬 Stack samples for cell {index}: {profile['samples']}", index=index)
+
+        cell['metadata'] = dict(cell.get('metadata', {}), profile=profile)
+
+    def _profiled_cells(self) -> List[Tuple[int, Dict]]:
+        return [(i, cell['metadata']['profile']) for i, cell in enumerate(self.notebook['cells'])
+                if 'profile' in cell.get('metadata', {})]
+
+    def profile_report(self, top: int = 10) -> List[Tuple[int, Dict]]:
+        """
+        Rank the slowest cells of the last profiled run.
+
+        Args:
+            top: Number of cells to show
+
+        Returns:
+            (cell index, profile) pairs, slowest first
+        """
+        ranked = sorted(self._profiled_cells(), key=lambda item: -(item[1].get('wall_time') or 0))
+        if not ranked:
+            self._emit('warning', "⚠️  No profiled cells (execute with profile=True or --profile)")
+            return []
+        if self.events.quiet:
+            return ranked
+
+        total = sum(profile.get('wall_time') or 0 for _, profile in ranked)
+        lines = [f"\n⏱️  Profile ({len(ranked)} cells, {total:.2f}s total)",
+                 f"{'='*70}",
+                 f"{'Cell':>5} {'Wall':>9} {'CPU':>9} {'Peak RSS+':>10} {'Output':>9} {'vs. previous':>14}"]
+        for i, profile in ranked[:top]:
+            wall = profile.get('wall_time') or 0
+            cpu = profile.get('cpu_time')
+            rss = profile.get('peak_rss_delta')
+            previous = (profile.get('previous') or {}).get('wall_time')
+            change = f"{(wall - previous) / previous:+.0%}" if previous else "-"
+            lines.append(f"{i:>5} {wall:>8.2f}s {'-' if cpu is None else f'{cpu:.2f}s':>9} "
+                         f"{'-' if rss is None else _format_bytes(rss):>10} "
+                         f"{_format_bytes(profile.get('output_bytes') or 0):>9} {change:>14}")
+            if profile.get('samples'):
+                lines.append(f"      🔬 {profile['samples']}")
+        lines.append(f"{'='*70}\n")
+        self._emit('profile', '\n'.join(lines), cells=[i for i, _ in ranked[:top]], total_time=round(total, 6))
+        return ranked
+
+    # ==================== EXECUTION CACHE ====================
+
+    def _file_fingerprint(self, path: str) -> str:
+        """Fingerprint of a data file (size and mtime), resolved like the kernel's cwd."""
+        full_path = Path(path).expanduser()
+        if not full_path.is_absolute():
+            full_path = self.notebook_path.parent / full_path
+        try:
+            stat = full_path.stat()
+        except OSError:
+            return f"{path}:missing"
+        return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _cache_keys(self) -> Tuple[Dict[int, str], Dict[int, List[int]]]:
+        """
+        Execution cache keys of all code cells.
+
+        Returns:
+            (cell index -> key, cell index -> upstream cell indices)
+        """
+        cells = self.notebook['cells']
+        upstream = self.dataflow.upstream(cells)
+        kernel_name = self.notebook.get('metadata', {}).get('kernelspec', {}).get('name', 'python3')
+
+        keys = {}
+        for i in sorted(upstream):
+            cell = cells[i]
+            parts = [kernel_name, cell.content_hash]
+            parts.extend(keys[j] for j in upstream[i])
+            parts.extend(self._file_fingerprint(path) for path in self.dataflow.data_files(cell))
+            keys[i] = hashlib.sha256('\x00'.join(parts).encode('utf-8')).hexdigest()
+        return keys, upstream
+
+    def _cache_plan(self, indices, keys: Dict[int, str], upstream: Dict[int, List[int]]) -> set:
+        """
+        Cells in a run that can be restored from the cache.
+
+        With a persistent kernel a cached cell still has to run when a cell
+        that does execute reads from it, since the kernel needs its names.
+        """
+        indices = [i for i in indices if i in keys]
+        cached = {i for i in indices if keys[i] in self.exec_cache}
+        if self.persistent_kernel:
+            for i in reversed(indices):
+                if i not in cached:
+                    cached.difference_update(upstream[i])
+        return cached
+
+    def _restore_cached(self, index: int, key: str) -> bool:
+        """Give a cell its cached outputs; False on a cache miss."""
+        entry = self.exec_cache.get(key)
+        if entry is None:
+            return False
+
+        self._save_state()
+        cell = self.notebook['cells'][index]
+        cell['outputs'] = entry['outputs']
+        cell['execution_count'] = entry['execution_count']
+        self._emit('cache', f"♻️  Cell {index} restored from cache", index=index)
+        return True
+
+    @_operation
+    def clear_cache(self):
+        """Delete every entry of the execution cache."""
+        if self.exec_cache is None:
+            self._emit('error', "❌ No execution cache configured")
+            return False
+        self.exec_cache.clear()
+        self._emit('cache', "🧹 Execution cache cleared")
+        return True
 
-        # Update current position
-        if position == 'before' or position == 'replace':
-            self.current_cell_index = insert_index
-        else:
-            self.current_cell_index = insert_index
+    @staticmethod
+    def _cell_key(cell: Dict):
+        """Key identifying a cell across edits (its nbformat id if it has one)."""
+        return cell.get('id') or id(cell)
+
+    def stale_cells(self) -> List[int]:
+        """
+        Code cells whose results in the live kernel are out of date.
+
+        A cell is stale if it was edited (or never run) since the kernel last
+        executed it, or if it depends on a stale cell through the names it
+        reads or redefines.
+
+        Returns:
+            Stale cell indices in notebook order
+        """
+        cells = self.notebook['cells']
+        changed = {i for i, cell in enumerate(cells)
+                   if cell['cell_type'] == 'code'
+                   and self._kernel_runs.get(self._cell_key(cell)) != cell.content_hash}
+        return self.dataflow.stale(cells, changed)
+
+    @_operation
+    def run_stale(self, timeout: int = 60) -> bool:
+        """
+        Re-execute only the stale cells in the persistent kernel.
+
+        Args:
+            timeout: Per-cell execution timeout in seconds
+
+        Returns:
+            True if every stale cell executed successfully
+        """
+        if not self.persistent_kernel:
+            self._emit('error', "❌ run_stale needs a persistent kernel (persistent_kernel=True or --kernel)")
+            return False
+
+        try:
+            self._get_kernel()
+        except Exception as e:
+            self._emit('error', f"❌ Execution error: {str(e)}")
+            return False
+
+        stale = self.stale_cells()
+        if not stale:
+            self._emit('execute', "✅ All cells are up to date")
+            return True
+
+        self._emit('execute', f"\n▶️  Executing {len(stale)} stale cells: {', '.join(map(str, stale))}")
+
+        success_count = 0
+        fail_count = 0
+
+        for i in stale:
+            success, msg = self.execute_cell(i, timeout)
+            if success:
+                success_count += 1
+            else:
+                fail_count += 1
+                self._emit('warning', f"\n⚠️  Failed at cell {i}, stopping execution", index=i)
+                break
 
+        code_count = len(self.filter_cells('code'))
+
+        self._emit_summary(success_count, fail_count, (f"  ⏭️  Up to date: {code_count - len(stale)}",),
+                           up_to_date=code_count - len(stale))
+
+        return fail_count == 0
+
+    # ==================== UNDO/REDO ====================
+
+    @_operation
+    def undo(self):
+        """Undo last change."""
+        if self._transaction_depth:
+            self._emit('error', "❌ Cannot undo inside a transaction")
+            return False
+
+        state = self.history.undo(self.notebook, self.current_cell_index)
+        if state is None:
+            self._emit('error', "❌ Nothing to undo")
+            return False
+
+        self.notebook = self.history.restore(state, self.notebook)
+        self._reset_ids()
+        self.current_cell_index = state['cell_index']
+
+        self._emit('undo', f"↶  Undo successful (position {self.history.position + 1}/{len(self.history)})")
         return True
 
-    def delete_cell(self, index: Optional[int] = None):
-        """Delete a cell."""
+    @_operation
+    def redo(self):
+        """Redo last undone change."""
+        if self._transaction_depth:
+            self._emit('error', "❌ Cannot redo inside a transaction")
+            return False
+
+        state = self.history.redo()
+        if state is None:
+            self._emit('error', "❌ Nothing to redo")
+            return False
+
+        self.notebook = self.history.restore(state, self.notebook)
+        self._reset_ids()
+        self.current_cell_index = state['cell_index']
+
+        self._emit('redo', f"↷  Redo successful (position {self.history.position + 1}/{len(self.history)})")
+        return True
+
+    def show_history(self):
+        """Show undo/redo history."""
+        if self.events.quiet:
+            return
+        lines = [f"\n📜 History ({len(self.history)} states):",
+                 f"   Current position: {self.history.position + 1}",
+                 f"   Resident: {_format_bytes(self.history.resident_bytes)} "
+                 f"(budget {_format_bytes(self.history.max_bytes)})",
+                 f"   Spilled: {_format_bytes(self.history.spilled_bytes)} "
+                 f"({self.history.spilled_count} states on disk)\n"]
+
+        for i, state in enumerate(self.history.states):
+            marker = "👉" if i == self.history.position else "  "
+            timestamp = state['timestamp'].strftime('%H:%M:%S')
+            if 'spilled' in state:
+                lines.append(f"{marker} {i+1}. {timestamp} - {state['cell_count']} cells 💾")
+            else:
+                lines.append(f"{marker} {i+1}. {timestamp} - {len(state['cells'])} cells")
+
+        self._emit('history', '\n'.join(lines), states=len(self.history),
+                   position=self.history.position)
+
+    # ==================== BATCH OPERATIONS ====================
+
+    def filter_cells(self, cell_type: str) -> List[int]:
+        """Get indices of cells by type."""
+        indices = []
+        for i, cell in enumerate(self.notebook['cells']):
+            if cell['cell_type'] == cell_type:
+                indices.append(i)
+        return indices
+
+    @_operation
+    def replace_in_all_cells(self, old: str, new: str, cell_type: Optional[str] = None) -> int:
+        """Replace text in all cells and return the number of cells changed."""
+        if not old:
+            self._emit('error', "❌ Cannot replace an empty string")
+            return 0
+        changed = self._replace_cells(MultiReplacer({old: new}), cell_type)
+
+        self._emit('replace', f"🔄 Replaced '{old}' with '{new}' in {len(changed)} cells",
+                   cells=changed)
+        return len(changed)
+
+    @_operation
+    def replace_many(self, replacements: Dict[str, str], patterns: Optional[Dict[str, str]] = None,
+                     cell_type: Optional[str] = None) -> Dict[str, int]:
+        """
+        Apply many replacements in one pass over each cell.
+
+        Every cell is scanned once for all keys and patterns together (see
+        MultiReplacer), so earlier replacements are never rescanned. Only
+        cells whose text changes are touched, and the whole call is one
+        undo step.
+
+        Args:
+            replacements: Literal text -> replacement
+            patterns: Regex -> replacement template (may use group references)
+            cell_type: Only replace in cells of this type
+
+        Returns:
+            Number of replacements per key and pattern
+        """
+        try:
+            replacer = MultiReplacer(replacements, patterns)
+        except ValueError as e:
+            self._emit('error', f"❌ {e}")
+            return {}
+
+        changed = self._replace_cells(replacer, cell_type)
+
+        total = sum(replacer.hits.values())
+        self._emit('replace', f"🔄 Made {total} replacements ({len(replacer.hits)} patterns) "
+                              f"in {len(changed)} cells",
+                   cells=changed, hits=replacer.hits)
+        return replacer.hits
+
+    def _replace_cells(self, replacer: 'MultiReplacer', cell_type: Optional[str]) -> List[int]:
+        """Run a replacer over the cells, recording one undo state if any change."""
+        updates = []
+        for i, cell in enumerate(self.notebook['cells']):
+            if cell_type and cell['cell_type'] != cell_type:
+                continue
+            source = cell.text
+            text, count = replacer.replace(source)
+            if count and text != source:
+                updates.append((i, text))
+
+        if updates:
+            self._save_state()
+            cells = self.notebook['cells']
+            for i, text in updates:
+                cells[i]['source'] = text
+        return [i for i, _ in updates]
+
+    @_operation
+    def merge_cells(self, start_index: CellRef, end_index: CellRef, separator: str = '\n\n'):
+        """Merge multiple cells into one."""
+        start_index, end_index = self._cell_index(start_index), self._cell_index(end_index)
+        if start_index is None or end_index is None:
+            return False
+        if not (0 <= start_index < end_index < self.get_cell_count()):
+            self._emit('error', "❌ Invalid range")
+            return False
+
+        self._save_state()
+
+        cells = self.notebook['cells']
+        merged = cells[start_index]
+        removed = cells[start_index + 1:end_index + 1]
+        merged['source'] = separator.join(cell.text for cell in cells[start_index:end_index + 1])
+        self.search_index.update(merged)
+
+        cells[start_index + 1:end_index + 1] = []
+        self._reindex(start_index + 1, removed)
+        self._forget_cells(removed)
+        self._clamp_current()
+
+        self._emit('merge', f"🔗 Merged cells {start_index}-{end_index}", index=start_index)
+        return True
+
+    # ==================== RANGE OPERATIONS ====================
+
+    def _forget_cells(self, removed: List[Dict]):
+        for cell in removed:
+            self.search_index.remove(cell)
+
+    def _clamp_current(self):
+        self.current_cell_index = max(0, min(self.current_cell_index, self.get_cell_count() - 1))
+
+    @_operation
+    def delete_cells(self, start_index: CellRef, end_index: CellRef) -> bool:
+        """
+        Delete a range of cells.
+
+        Args:
+            start_index: First cell to delete (index or id)
+            end_index: Last cell to delete, inclusive (index or id)
+
+        Returns:
+            True if the cells were deleted
+        """
+        start_index, end_index = self._cell_index(start_index), self._cell_index(end_index)
+        if start_index is None or end_index is None:
+            return False
+        count = self.get_cell_count()
+        if not (0 <= start_index <= end_index < count):
+            self._emit('error', "❌ Invalid range")
+            return False
+        if end_index - start_index + 1 == count:
+            self._emit('error', "❌ Cannot delete every cell in the notebook")
+            return False
+
+        self._save_state()
+
+        cells = self.notebook['cells']
+        removed = cells[start_index:end_index + 1]
+        cells[start_index:end_index + 1] = []
+        self._reindex(start_index, removed)
+        self._forget_cells(removed)
+        self._clamp_current()
+
+        self._emit('delete', f"🗑️  Deleted cells {start_index}-{end_index} ({len(removed)} cells)",
+                   index=start_index, count=len(removed))
+        return True
+
+    @_operation
+    def move_cells(self, start_index: CellRef, end_index: CellRef, to: int) -> bool:
+        """
+        Move a range of cells.
+
+        Args:
+            start_index: First cell to move (index or id)
+            end_index: Last cell to move, inclusive (index or id)
+            to: Index of the first moved cell after the move
+
+        Returns:
+            True if the cells were moved
+        """
+        start_index, end_index = self._cell_index(start_index), self._cell_index(end_index)
+        if start_index is None or end_index is None:
+            return False
+        count = self.get_cell_count()
+        size = end_index - start_index + 1
+        if not (0 <= start_index <= end_index < count) or not (0 <= to <= count - size):
+            self._emit('error', "❌ Invalid range")
+            return False
+        if to == start_index:
+            return True
+
+        self._save_state()
+
+        cells = self.notebook['cells']
+        block = cells[start_index:end_index + 1]
+        rest = cells[:start_index] + cells[end_index + 1:]
+        cells[:] = rest[:to] + block + rest[to:]
+        self._reindex(min(start_index, to))
+        self.current_cell_index = to
+
+        self._emit('move', f"↕️  Moved cells {start_index}-{end_index} to position {to}",
+                   index=start_index, to=to, count=size)
+        return True
+
+    @_operation
+    def split_cell(self, index: Optional[CellRef] = None, at: Optional[List[int]] = None) -> bool:
+        """
+        Split a cell into several cells of the same type.
+
+        Args:
+            index: Cell index or id to split (uses current if None)
+            at: Line numbers (0-based) where new cells start; None splits at
+                every blank line between blocks of code or text
+
+        Returns:
+            True if the cell was split
+        """
+        index = self._cell_index(index)
         if index is None:
-            index = self.current_cell_index
+            return False
 
         if not (0 <= index < self.get_cell_count()):
-            print(f"❌ Invalid cell index: {index}")
+            self._emit('error', f"❌ Invalid cell index: {index}", index=index)
             return False
 
-        if self.get_cell_count() == 1:
-            print("❌ Cannot delete the only cell in the notebook")
+        cell = self.notebook['cells'][index]
+        lines = cell.text.splitlines(keepends=True)
+
+        if at is None:
+            at = [n for n in range(1, len(lines))
+                  if lines[n].strip() and not lines[n - 1].strip()]
+        bounds = [0] + sorted(set(n for n in at if 0 < n < len(lines))) + [len(lines)]
+        parts = [''.join(lines[a:b]).strip('\n') for a, b in zip(bounds, bounds[1:])]
+        parts = [part for part in parts if part.strip()]
+        if len(parts) < 2:
+            self._emit('error', f"❌ Nothing to split in cell {index}", index=index)
+            return False
+
+        self._save_state()
+
+        first = cell
+        first['source'] = parts[0]
+        if first['cell_type'] == 'code':
+            first['outputs'] = []
+            first['execution_count'] = None
+        self.search_index.update(first)
+        new_cells = [self._new_cell(part, cell['cell_type']) for part in parts[1:]]
+        for new_cell in new_cells:
+            self.search_index.update(new_cell)
+        self.notebook['cells'][index + 1:index + 1] = new_cells
+        self._reindex(index + 1)
+
+        self._emit('split', f"✂️  Split cell {index} into {len(parts)} cells", index=index, count=len(parts))
+        return True
+
+    @_operation
+    def insert_cells(self, contents: List, index: Optional[CellRef] = None,
+                     position: str = 'after', cell_type: str = 'code') -> bool:
+        """
+        Insert many cells at one position.
+
+        Args:
+            contents: Cell sources, ``(source, cell_type)`` pairs or cell
+                dictionaries (copied as they are, outputs included; a copy
+                whose id is already in use gets a fresh one)
+            index: Position reference, an index or id (uses current if None)
+            position: 'before' or 'after'
+            cell_type: Type of cells given as plain sources
+
+        Returns:
+            True if the cells were inserted
+        """
+        index = self._cell_index(index)
+        if index is None:
+            return False
+
+        if position not in ('before', 'after'):
+            self._emit('error', f"❌ Invalid position: {position}")
+            return False
+        if not (0 <= index < self.get_cell_count()) and self.get_cell_count():
+            self._emit('error', f"❌ Invalid cell index: {index}", index=index)
+            return False
+
+        new_cells = []
+        for item in contents:
+            if isinstance(item, dict):
+                new_cell = Cell(copy.deepcopy(item))
+                new_cell['id'] = self._claim_id(item.get('id'))
+            else:
+                source, kind = (item, cell_type) if isinstance(item, str) else item
+                new_cell = self._new_cell(source, kind)
+            if new_cell.get('cell_type') not in ('code', 'markdown', 'raw'):
+                for claimed in new_cells + [new_cell]:
+                    self._ids.pop(claimed['id'], None)  # release the reserved ids
+                self._emit('error', f"❌ Invalid cell type: {new_cell.get('cell_type')}")
+                return False
+            new_cells.append(new_cell)
+        if not new_cells:
+            return True
+
+        self._save_state()
+
+        insert_index = index if position == 'before' else min(index + 1, self.get_cell_count())
+        self.notebook['cells'][insert_index:insert_index] = new_cells
+        self._reindex(insert_index)
+        for new_cell in new_cells:
+            self.search_index.update(new_cell)
+        self.current_cell_index = insert_index + len(new_cells) - 1
+
+        self._emit('insert', f"➕ Inserted {len(new_cells)} cells at position {insert_index}",
+                   index=insert_index, count=len(new_cells))
+        return True
+
+    # ==================== DIFF/MERGE ====================
+
+    def _load_version(self, ref: Optional[str]) -> Dict:
+        """Load another version of the notebook: a file, a backup id or (None) the latest backup."""
+        if ref is not None and Path(ref).is_file():
+            return load_notebook_index(ref)
+        return parse_notebook_index(self.backups.restore_text(ref))
+
+    @_operation
+    def diff(self, other: Optional[str] = None, show: bool = True,
+             source: bool = True) -> Union[List[Dict], bool]:
+        """
+        Compare another version of the notebook with the current one.
+
+        Args:
+            other: Notebook path or backup id (None for the latest backup)
+            show: Report the differences
+            source: Include source diffs of changed cells when reporting
+
+        Returns:
+            Changes as returned by diff_notebooks, with ``a`` indexes in
+            the other version and ``b`` indexes in the current notebook,
+            or False if the other version could not be loaded
+        """
+        try:
+            old = self._load_version(other)
+        except FileNotFoundError as e:
+            self._emit('error', f"❌ {e}")
+            return False
+
+        changes = diff_notebooks(old, self.notebook)
+        if show and not self.events.quiet:
+            self._emit('diff', f"\n🔍 {other or 'latest backup'} → {self.notebook_path.name}\n"
+                       + format_diff(changes, old, self.notebook, source=source),
+                       other=other, changes=len(changes))
+        return changes
+
+    @_operation
+    def merge(self, theirs: str, base: Optional[str] = None) -> Optional[List[Dict]]:
+        """
+        Three-way merge another version into the notebook as one undoable change.
+
+        Args:
+            theirs: Notebook path or backup id holding the other changes
+            base: Common ancestor, a notebook path or backup id (None for
+                the latest backup)
+
+        Returns:
+            Conflicts as returned by merge_notebooks, or None if a version
+            could not be loaded. Conflicting cells hold both sources
+            between conflict markers.
+        """
+        try:
+            base_notebook = self._load_version(base)
+            their_notebook = self._load_version(theirs)
+        except FileNotFoundError as e:
+            self._emit('error', f"❌ {e}")
+            return None
+
+        merged, conflicts = merge_notebooks(base_notebook, self.notebook, their_notebook)
+
+        self._save_state()
+        self.notebook = merged
+        self._adopt_cells()
+        self._clamp_current()
+
+        self._emit('merge', f"🔀 Merged {theirs}: {self.get_cell_count()} cells, "
+                            f"{len(conflicts)} conflicts", conflicts=len(conflicts))
+        for conflict in conflicts:
+            self._emit('conflict', f"   ⚠️  Cell {conflict['index']}: {conflict['message']}",
+                       index=conflict['index'], field=conflict['field'])
+        return conflicts
+
+    # ==================== VACUUM ====================
+
+    @_operation
+    def vacuum(self, max_text: Optional[int] = 10000, dpi: Optional[float] = None,
+               recompress: bool = True, mime_policy: Optional[str] = None,
+               minify: Optional[bool] = None) -> Dict:
+        """
+        Shrink the notebook's outputs as one undoable change (save to write it).
+
+        Args:
+            max_text: Keep about this many characters of each stream or
+                text/plain output, head and tail (None keeps all text); a
+                longer text/html with a plain-text alternative is dropped
+            dpi: Downscale PNG outputs rendered above this resolution
+                (requires Pillow), keeping their displayed size
+            recompress: Recompress PNG outputs (losslessly)
+            mime_policy: 'html' keeps text/html over text/plain, 'plain' the
+                reverse; both drop the text/plain repr of images. None keeps
+                every mime type
+            minify: Save the notebook as compact JSON (True) or indented
+                (False) from now on; None keeps its current format
+
+        Returns:
+            {'cells': {cell index: bytes saved}, 'saved': total bytes saved}
+        """
+        if mime_policy is not None and mime_policy not in MIME_POLICIES:
+            self._emit('error', f"❌ Invalid mime policy: {mime_policy} (choose from {', '.join(MIME_POLICIES)})")
+            return {'cells': {}, 'saved': 0}
+        if dpi and Image is None:
+            self._emit('warning', "⚠️  Pillow is not installed: PNG outputs are recompressed but not downscaled")
+
+        updates = []
+        for i, cell in enumerate(self.notebook['cells']):
+            outputs = cell.get('outputs')
+            if not outputs:
+                continue
+            compacted = [compact_output(output, max_text, dpi, recompress, mime_policy)
+                         for output in outputs]
+            if any(new is not old for new, old in zip(compacted, outputs)):
+                updates.append((i, compacted))
+
+        cells = self.notebook['cells']
+        reformat = minify is not None and minify != self.minify
+        measured = range(len(cells)) if reformat else [i for i, _ in updates]
+        before = {i: len(self._serialize_cell(cells[i], self.minify).encode('utf-8')) for i in measured}
+
+        if updates or reformat:
+            self._save_state()
+        for i, compacted in updates:
+            cells[i]['outputs'] = compacted
+        if reformat:
+            self.minify = minify
+            self._fragments = {}
+
+        saved = {}
+        for i in measured:
+            size = len(self._serialize_cell(cells[i], self.minify).encode('utf-8'))
+            if before[i] != size:
+                saved[i] = before[i] - size
+        total = sum(saved.values())
+
+        for i, compacted in updates:
+            if saved.get(i):
+                self._emit('vacuum', f"   Cell {i}: {_format_bytes(before[i])} → "
+                                     f"{_format_bytes(before[i] - saved[i])}", index=i, saved=saved[i])
+        self._emit('vacuum', f"🧽 Vacuumed {len(updates)} cells{' and minified' if reformat and minify else ''}: "
+                             f"saved {_format_bytes(total)}", cells=len(updates), saved=total)
+        return {'cells': saved, 'saved': total}
+
+    # ==================== EXPORT/IMPORT ====================
+
+    @_operation
+    def save(self):
+        """Save notebook to original file."""
+        self._save_notebook()
+
+    @_operation
+    def save_as(self, path: str):
+        """Save notebook to a different file."""
+        self._save_notebook(Path(path))
+
+    @_operation
+    def export_cell(self, index: Optional[CellRef] = None, output_file: Optional[str] = None):
+        """Export cell content to a file."""
+        index = self._cell_index(index)
+        if index is None:
+            return False
+
+        cell = self.view_cell(index, show_output=False)
+        if not cell:
             return False
 
-        self._save_state()
+        source = cell.text
+
+        if output_file:
+            with open(output_file, 'w') as f:
+                f.write(source)
+            self._emit('export', f"📤 Exported cell {index} to {output_file}", index=index)
+        else:
+            return source
+
+    @_operation
+    def import_from_file(self, file_path: str, cell_type: str = 'code',
+                        position: str = 'after'):
+        """Import content from file as a new cell."""
+        with open(file_path, 'r') as f:
+            content = f.read()
+
+        self.insert_cell(content, cell_type, position=position)
+        self._emit('import', f"📥 Imported {file_path} as new {cell_type} cell")
+
+    # ==================== STATISTICS & INFO ====================
+
+    def get_stats(self) -> Dict:
+        """
+        Get notebook statistics.
+
+        Returns:
+            Cell counts, total lines, current cell and history size
+        """
+        code_cells = len([c for c in self.notebook['cells'] if c['cell_type'] == 'code'])
+        markdown_cells = len([c for c in self.notebook['cells'] if c['cell_type'] == 'markdown'])
+
+        total_lines = sum(cell.line_count for cell in self.notebook['cells'])
+        stats = {'cells': self.get_cell_count(), 'code_cells': code_cells,
+                 'markdown_cells': markdown_cells, 'lines': total_lines,
+                 'current_cell': self.current_cell_index, 'history_states': len(self.history)}
+
+        if self.events.quiet:
+            return stats
+        lines = ["\n📊 Notebook Statistics",
+                 f"{'='*70}",
+                 f"File: {self.notebook_path.name}",
+                 f"Total cells: {stats['cells']}",
+                 f"  - Code cells: {code_cells}",
+                 f"  - Markdown cells: {markdown_cells}",
+                 f"Total lines: {total_lines}",
+                 f"Current cell: {self.current_cell_index}",
+                 f"History states: {stats['history_states']}"]
+
+        profiled = self._profiled_cells()
+        if profiled:
+            total = sum(profile.get('wall_time') or 0 for _, profile in profiled)
+            hottest, profile = max(profiled, key=lambda item: item[1].get('wall_time') or 0)
+            lines.append(f"Profiled cells: {len(profiled)} ({total:.2f}s total, "
+                         f"slowest: cell {hottest} at {profile.get('wall_time') or 0:.2f}s)")
+        lines.append(f"{'='*70}\n")
+        self._emit('stats', '\n'.join(lines), **stats)
+        return stats
+
+
+# ==================== NOTEBOOK DIFF ====================
+
+def _diff_key(cell: Dict) -> str:
+    """Alignment key of a cell: its type and a hash of its source."""
+    if isinstance(cell, Cell):
+        digest = cell.content_hash
+    else:
+        digest = hashlib.sha256(cell_source(cell).encode('utf-8')).hexdigest()
+    return f"{cell.get('cell_type')}:{digest}"
+
+
+def _outputs_digest(cell: Dict) -> str:
+    """
+    Hash of a cell's outputs in the form they are serialized in the file.
+
+    Lazily loaded outputs are hashed from the file text without being
+    decoded; decoded outputs are serialized the way a save would write
+    them, so both forms of the same outputs hash alike.
+    """
+    outputs = cell.get('outputs')
+    if not outputs:
+        return ''
+    if isinstance(outputs, LazyOutputs):
+        items = outputs.saved_items()
+    else:
+        items = [json.dumps(output, indent=1, ensure_ascii=False).replace('\n', '\n    ')
+                 for output in outputs]
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update(item.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def _same_outputs(a: Dict, b: Dict) -> bool:
+    """Compare two cells' outputs; lazily loaded ones by their file text, the rest by hash."""
+    x, y = a.get('outputs'), b.get('outputs')
+    if isinstance(x, LazyOutputs) and isinstance(y, LazyOutputs):
+        return x.same_text(y)
+    return _outputs_digest(a) == _outputs_digest(b)
+
+
+def _lcs_pairs(a: List[str], b: List[str]) -> List[Tuple[int, int]]:
+    """
+    Longest common subsequence of two key lists, as matched index pairs.
+
+    Common leading and trailing runs are matched directly. The middle uses
+    Hunt-Szymanski, which costs O((n + r) log n) for r pairs of equal keys;
+    cell keys are content hashes and rarely repeat, so r stays close to n.
+    """
+    start = 0
+    limit = min(len(a), len(b))
+    while start < limit and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+
+    positions = {}
+    for j in range(start, end_b):
+        positions.setdefault(b[j], []).append(j)
+
+    thresholds = []  # thresholds[k]: smallest j ending a common subsequence of length k + 1
+    links = []  # links[k]: (i, j, link of the shorter subsequence) for thresholds[k]
+    for i in range(start, end_a):
+        for j in reversed(positions.get(a[i], ())):
+            k = bisect.bisect_left(thresholds, j)
+            if k == len(thresholds):
+                thresholds.append(j)
+                links.append(None)
+            elif j < thresholds[k]:
+                thresholds[k] = j
+            else:
+                continue
+            links[k] = (i, j, links[k - 1] if k else None)
+
+    middle = []
+    node = links[-1] if links else None
+    while node is not None:
+        middle.append((node[0], node[1]))
+        node = node[2]
+    middle.reverse()
 
-        deleted_cell = self.notebook['cells'].pop(index)
-        print(f"🗑️  Deleted cell {index} ({deleted_cell['cell_type']})")
+    return ([(n, n) for n in range(start)] + middle
+            + [(end_a + n, end_b + n) for n in range(len(a) - end_a)])
 
-        # Adjust current position
-        if self.current_cell_index >= self.get_cell_count():
-            self.current_cell_index = self.get_cell_count() - 1
 
-        return True
+def _similar(a: str, b: str) -> bool:
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).quick_ratio() >= 0.5
 
-    def duplicate_cell(self, index: Optional[int] = None):
-        """Duplicate a cell."""
-        if index is None:
-            index = self.current_cell_index
 
-        cell = self.view_cell(index, show_output=False)
-        if not cell:
-            return False
+def _match_cells(cells_a: List[Dict], cells_b: List[Dict]) -> Dict[int, Tuple[int, bool]]:
+    """
+    Pair the cells of two versions of a notebook.
 
-        source = ''.join(cell.get('source', []))
-        self.insert_cell(source, cell['cell_type'], index, 'after')
+    Cells with equal keys are aligned by LCS. Of the rest, a cell whose
+    content reappears elsewhere is a move; then cells keeping their
+    nbformat id are paired, and finally similar cells of the same type
+    between the same two aligned cells.
 
-        return True
+    Returns:
+        Mapping from index in ``cells_a`` to (index in ``cells_b``, moved)
+    """
+    keys_a = [_diff_key(cell) for cell in cells_a]
+    keys_b = [_diff_key(cell) for cell in cells_b]
+    pairs = _lcs_pairs(keys_a, keys_b)
+    matched = {i: (j, False) for i, j in pairs}
+    taken = {j for _, j in pairs}
+
+    # Gaps between aligned cells; a pair inside the same gap is an in-place edit
+    anchors_a = [i for i, _ in pairs]
+    anchors_b = [j for _, j in pairs]
+
+    def same_gap(i: int, j: int) -> bool:
+        return bisect.bisect(anchors_a, i) == bisect.bisect(anchors_b, j)
+
+    free_b = {}
+    for j, key in enumerate(keys_b):
+        if j not in taken:
+            free_b.setdefault(key, []).append(j)
+    for i, key in enumerate(keys_a):
+        if i not in matched and free_b.get(key):
+            j = free_b[key].pop(0)
+            matched[i] = (j, True)
+            taken.add(j)
+
+    # Only ids unique in both versions identify a cell (copied cells may share one)
+    counts = Counter(cell.get('id') for cell in cells_a)
+    counts.update(cell.get('id') for cell in cells_b)
+    ids_b = {cells_b[j].get('id'): j for j in range(len(cells_b)) if j not in taken}
+    for i, cell in enumerate(cells_a):
+        cell_id = cell.get('id')
+        j = ids_b.get(cell_id) if i not in matched and cell_id is not None else None
+        if j is not None and counts[cell_id] == 2:
+            matched[i] = (j, not same_gap(i, j))
+            taken.add(j)
+
+    gaps_b = {}
+    for j in range(len(cells_b)):
+        if j not in taken:
+            gaps_b.setdefault(bisect.bisect(anchors_b, j), []).append(j)
+    for i in range(len(cells_a)):
+        if i in matched:
+            continue
+        candidates = gaps_b.get(bisect.bisect(anchors_a, i))
+        if not candidates:
+            continue
+        for n, j in enumerate(candidates):
+            if (cells_a[i].get('cell_type') == cells_b[j].get('cell_type')
+                    and _similar(cell_source(cells_a[i]), cell_source(cells_b[j]))):
+                matched[i] = (j, False)
+                del candidates[:n + 1]  # keep pairs in order
+                break
+    return matched
 
-    # ==================== CELL EXECUTION ====================
 
-    def execute_cell(self, index: Optional[int] = None, timeout: int = 60) -> Tuple[bool, str]:
-        """
-        Execute a code cell and capture output.
+def diff_notebooks(a: Dict, b: Dict, include_equal: bool = False) -> List[Dict]:
+    """
+    Compare two versions of a notebook cell by cell.
+
+    Each change is a dictionary with ``op``, ``a`` and ``b`` (the cell's
+    index in each version, None where it does not exist), ``cell_type``,
+    ``id`` and the flags ``source``, ``outputs`` and ``metadata`` telling
+    which parts differ. Operations:
+
+    - ``inserted`` / ``deleted``: the cell exists in one version only
+    - ``moved``: the cell changed position (its flags tell if it changed too)
+    - ``modified``: the source or cell type changed in place
+    - ``outputs``: only the outputs changed (execution counts are ignored)
+    - ``metadata``: only the cell metadata changed
+    - ``equal``: unchanged (only with ``include_equal``)
+
+    Outputs are compared by their serialized text (or a hash of it), so
+    lazily loaded notebooks (see load_notebook_index) are diffed without
+    decoding any output.
+
+    Args:
+        a: Old notebook
+        b: New notebook
+        include_equal: Also report unchanged cells
+
+    Returns:
+        Changes in the order of the new notebook, deletions before the
+        next cell that both versions share
+    """
+    cells_a, cells_b = a['cells'], b['cells']
+    matched = _match_cells(cells_a, cells_b)
+    changes = []
+
+    for i, (j, moved) in matched.items():
+        old, new = cells_a[i], cells_b[j]
+        source = old.get('cell_type') != new.get('cell_type') or cell_source(old) != cell_source(new)
+        outputs = not _same_outputs(old, new)
+        metadata = old.get('metadata', {}) != new.get('metadata', {})
+        if moved:
+            op = 'moved'
+        elif source:
+            op = 'modified'
+        elif outputs:
+            op = 'outputs'
+        elif metadata:
+            op = 'metadata'
+        elif include_equal:
+            op = 'equal'
+        else:
+            continue
+        changes.append({'op': op, 'a': i, 'b': j, 'cell_type': new.get('cell_type'),
+                        'id': new.get('id'), 'source': source, 'outputs': outputs,
+                        'metadata': metadata})
+
+    paired_b = {j for j, _ in matched.values()}
+    for j, cell in enumerate(cells_b):
+        if j not in paired_b:
+            changes.append({'op': 'inserted', 'a': None, 'b': j, 'cell_type': cell.get('cell_type'),
+                            'id': cell.get('id'), 'source': True, 'outputs': bool(cell.get('outputs')),
+                            'metadata': False})
+
+    # A deleted cell is listed before the next new-version cell paired with a later old cell
+    following = sorted((i, j) for i, (j, moved) in matched.items() if not moved)
+    firsts = [i for i, _ in following]
+    order = [(change['b'], 1, 0) for change in changes]
+    for i, cell in enumerate(cells_a):
+        if i not in matched:
+            n = bisect.bisect(firsts, i)
+            order.append((following[n][1] if n < len(following) else len(cells_b), 0, i))
+            changes.append({'op': 'deleted', 'a': i, 'b': None, 'cell_type': cell.get('cell_type'),
+                            'id': cell.get('id'), 'source': True, 'outputs': bool(cell.get('outputs')),
+                            'metadata': False})
+
+    return [change for _, change in sorted(zip(order, changes), key=lambda pair: pair[0])]
+
+
+def summarize_diff(changes: List[Dict]) -> Dict[str, int]:
+    """Count changes by operation."""
+    counts = {}
+    for change in changes:
+        counts[change['op']] = counts.get(change['op'], 0) + 1
+    return counts
+
+
+_DIFF_LABELS = {
+    'inserted': '➕ Inserted', 'deleted': '🗑️  Deleted', 'moved': '↕️  Moved',
+    'modified': '✏️  Modified', 'outputs': '📊 Outputs changed in', 'metadata': '🏷️  Metadata changed in',
+    'equal': '   Unchanged'
+}
+
+
+def format_diff(changes: List[Dict], a: Dict, b: Dict, source: bool = True) -> str:
+    """
+    Render changes as text.
 
-        Args:
-            index: Cell index (uses current if None)
-            timeout: Execution timeout in seconds
+    Args:
+        changes: Result of diff_notebooks(a, b)
+        a: Old notebook
+        b: New notebook
+        source: Include a unified diff of every changed source
 
-        Returns:
-            (success, output_message)
-        """
-        if index is None:
-            index = self.current_cell_index
+    Returns:
+        One line per change (plus source diffs) and a summary line
+    """
+    lines = []
+    for change in changes:
+        i, j = change['a'], change['b']
+        where = f"a[{i}]" if j is None else f"b[{j}]" if i is None else f"a[{i}] → b[{j}]"
+        notes = [name for name in ('source', 'outputs', 'metadata')
+                 if change['op'] == 'moved' and change[name]]
+        note = f" ({', '.join(notes)} changed)" if notes else ''
+        lines.append(f"{_DIFF_LABELS[change['op']]} {change['cell_type']} cell {where}{note}")
+
+        if source and change['source'] and change['op'] != 'equal':
+            old = cell_source(a['cells'][i]) if i is not None else ''
+            new = cell_source(b['cells'][j]) if j is not None else ''
+            for line in difflib.unified_diff(old.splitlines(), new.splitlines(),
+                                             'a', 'b', n=2, lineterm=''):
+                if not line.startswith(('---', '+++')):
+                    lines.append(f"    {line}")
+
+    counts = summarize_diff(changes)
+    counts.pop('equal', None)
+    if counts:
+        lines.append("Changes: " + ', '.join(f"{count} {op}" for op, count in counts.items()))
+    else:
+        lines.append("No changes")
+    return '\n'.join(lines)
 
-        if not (0 <= index < self.get_cell_count()):
-            return False, f"Invalid cell index: {index}"
 
-        cell = self.notebook['cells'][index]
+# ==================== NOTEBOOK MERGE ====================
 
-        if cell['cell_type'] != 'code':
-            return False, f"Cell {index} is not a code cell"
+_MISSING = object()
 
-        source = ''.join(cell.get('source', []))
 
-        print(f"▶️  Executing cell {index}...")
+def _merge_value(base: Any, ours: Any, theirs: Any) -> Tuple[Any, bool]:
+    """Three-way merge of one value; on a conflict ours is kept and flagged."""
+    if ours == base:
+        return theirs, False
+    if theirs == base or theirs == ours:
+        return ours, False
+    return ours, True
 
-        # Create temporary notebook with single cell
-        temp_nb = {
-            'cells': [copy.deepcopy(cell)],
-            'metadata': self.notebook.get('metadata', {}),
-            'nbformat': self.notebook.get('nbformat', 4),
-            'nbformat_minor': self.notebook.get('nbformat_minor', 0)
-        }
 
-        # Execute using jupyter nbconvert
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.ipynb', delete=False) as f:
-            temp_path = f.name
-            json.dump(temp_nb, f)
+def _merge_dicts(base: Dict, ours: Dict, theirs: Dict) -> Dict:
+    """Three-way merge of a dictionary key by key (ours wins conflicts, in our key order)."""
+    merged = {}
+    for key in list(ours) + [key for key in theirs if key not in ours]:
+        value, _ = _merge_value(base.get(key, _MISSING), ours.get(key, _MISSING), theirs.get(key, _MISSING))
+        if value is not _MISSING:
+            merged[key] = copy.deepcopy(value)
+    return merged
 
-        try:
-            result = subprocess.run(
-                ['jupyter', 'nbconvert', '--to', 'notebook', '--execute',
-                 '--ExecutePreprocessor.timeout=' + str(timeout),
-                 '--output', temp_path, temp_path],
-                capture_output=True,
-                text=True,
-                timeout=timeout + 10
-            )
 
-            if result.returncode == 0:
-                # Read executed notebook
-                with open(temp_path, 'r') as f:
-                    executed_nb = json.load(f)
+def _merge_cell(base: Dict, ours: Dict, theirs: Dict) -> Tuple[Dict, List[str]]:
+    """
+    Three-way merge of one cell, field by field.
 
-                # Update cell with outputs
-                self._save_state()
-                executed_cell = executed_nb['cells'][0]
-                self.notebook['cells'][index]['outputs'] = executed_cell.get('outputs', [])
-                self.notebook['cells'][index]['execution_count'] = executed_cell.get('execution_count')
+    Returns:
+        (merged cell, names of the fields in conflict)
+    """
+    cell = copy.deepcopy(dict(ours))
+    conflicts = []
+
+    src_base, src_ours, src_theirs = cell_source(base), cell_source(ours), cell_source(theirs)
+    side = None  # the version whose source is taken, None if neither changed it
+    if src_ours == src_base:
+        if src_theirs != src_base:
+            side = theirs
+            cell['source'] = copy.deepcopy(theirs['source'])
+    elif src_theirs == src_base or src_theirs == src_ours:
+        side = ours
+    else:
+        conflicts.append('source')
+        cell['source'] = f"<<<<<<< ours\n{src_ours}\n=======\n{src_theirs}\n>>>>>>> theirs"
+
+    cell_type, conflict = _merge_value(base.get('cell_type'), ours.get('cell_type'), theirs.get('cell_type'))
+    cell['cell_type'] = cell_type
+    if conflict:
+        conflicts.append('cell_type')
+
+    if cell_type != 'code':
+        cell.pop('outputs', None)
+        cell.pop('execution_count', None)
+    elif 'source' in conflicts:
+        cell['outputs'], cell['execution_count'] = [], None
+    else:
+        if side is None:  # outputs of whichever side re-ran the unchanged source
+            side = theirs if _same_outputs(ours, base) else ours
+        cell['outputs'] = copy.deepcopy(side.get('outputs', []))
+        cell['execution_count'] = side.get('execution_count')
 
-                print(f"✅ Cell {index} executed successfully")
+    cell['metadata'] = _merge_dicts(base.get('metadata', {}), ours.get('metadata', {}),
+                                    theirs.get('metadata', {}))
 
-                # Show outputs
-                if executed_cell.get('outputs'):
-                    print("\nOutputs:")
-                    for i, output in enumerate(executed_cell['outputs']):
-                        self._print_output(output, i)
+    return cell, conflicts
 
-                return True, "Execution successful"
-            else:
-                error_msg = result.stderr
-                print(f"❌ Execution failed:\n{error_msg}")
-                return False, error_msg
 
-        except subprocess.TimeoutExpired:
-            print(f"❌ Execution timed out after {timeout} seconds")
-            return False, "Timeout"
+def merge_notebooks(base: Dict, ours: Dict, theirs: Dict) -> Tuple[Dict, List[Dict]]:
+    """
+    Three-way merge of two versions of a notebook with their common ancestor.
+
+    Both versions are aligned with the base as in diff_notebooks. Cells
+    follow our order, with cells only their side inserted or moved placed
+    after the cell they follow in their version. Each cell present in all
+    three is merged field by field: a field changed on one side takes
+    that side's value. Diverging sources are a conflict and get git-style
+    ``<<<<<<< ours`` / ``>>>>>>> theirs`` markers and no outputs; other
+    diverging fields keep our value. A cell deleted on one side and
+    changed on the other is kept and reported as a conflict.
+
+    Args:
+        base: Common ancestor
+        ours: Our version (its notebook-level fields and cell order win)
+        theirs: Their version
+
+    Returns:
+        (merged notebook, conflicts); each conflict is a dictionary with
+        ``index`` (in the merged notebook), ``field`` (``'source'``,
+        ``'cell_type'`` or ``'deleted'``), ``base``, ``ours``, ``theirs``
+        (cell indexes or None) and ``message``
+    """
+    cells_base, cells_ours, cells_theirs = base['cells'], ours['cells'], theirs['cells']
+    match_ours = _match_cells(cells_base, cells_ours)
+    match_theirs = _match_cells(cells_base, cells_theirs)
+    base_of_ours = {j: i for i, (j, _) in match_ours.items()}
+    base_of_theirs = {k: i for i, (k, _) in match_theirs.items()}
+
+    def unchanged(i: int, cell: Dict) -> bool:
+        original = cells_base[i]
+        return (_diff_key(original) == _diff_key(cell)
+                and _same_outputs(original, cell)
+                and original.get('metadata', {}) == cell.get('metadata', {}))
+
+    # Cells they moved and we left in place are placed at their new position
+    relocated = {i for i, (_, moved) in match_theirs.items()
+                 if moved and i in match_ours and not match_ours[i][1]}
+
+    merged = []  # (cell, base index or None for our insertions)
+    pending = []  # (cell, conflict fields, base, ours, theirs) for conflict records
+    position = {}  # base index -> position in merged
+    for j, cell in enumerate(cells_ours):
+        i = base_of_ours.get(j)
+        if i is None:
+            merged.append((copy.deepcopy(dict(cell)), None))
+            continue
+        if i in relocated:
+            continue
+        if i not in match_theirs:
+            if unchanged(i, cell):
+                continue  # deleted on their side
+            kept = copy.deepcopy(dict(cell))
+            merged.append((kept, i))
+            pending.append((kept, ['deleted'], i, j, None))
+        else:
+            k = match_theirs[i][0]
+            kept, fields = _merge_cell(cells_base[i], cell, cells_theirs[k])
+            merged.append((kept, i))
+            if fields:
+                pending.append((kept, fields, i, j, k))
+        position[i] = len(merged) - 1
+
+    # Their insertions, relocations and cells we deleted but they changed
+    placements = {}  # merged position to insert after -> cells
+    last = -1
+    for k, cell in enumerate(cells_theirs):
+        i = base_of_theirs.get(k)
+        if i is not None and i in position:
+            last = position[i]
+            continue
+        if i is None:
+            placed = copy.deepcopy(dict(cell))
+        elif i in relocated:
+            j = match_ours[i][0]
+            placed, fields = _merge_cell(cells_base[i], cells_ours[j], cell)
+            if fields:
+                pending.append((placed, fields, i, j, k))
+        elif i not in match_ours and not unchanged(i, cell):
+            placed = copy.deepcopy(dict(cell))
+            pending.append((placed, ['deleted'], i, None, k))
+        else:
+            continue  # deleted on our side
+        placements.setdefault(last, []).append(placed)
+
+    cells = []
+    for n in range(-1, len(merged)):
+        if n >= 0:
+            cells.append(merged[n][0])
+        placed = placements.get(n)
+        if not placed:
+            continue
+        # Skip their insertions identical to ones we made at the same spot
+        ours_next = set()
+        m = n + 1
+        while m < len(merged) and merged[m][1] is None:
+            ours_next.add(_diff_key(merged[m][0]))
+            m += 1
+        cells.extend(cell for cell in placed if _diff_key(cell) not in ours_next)
+
+    seen = set()
+    taken = {cell.get('id') for cell in cells}
+    for cell in cells:
+        if cell.get('id') in seen:
+            cell['id'] = new_cell_id(taken)
+            taken.add(cell['id'])
+        seen.add(cell.get('id'))
+
+    notebook = {key: (None if key == 'cells' else copy.deepcopy(value)) for key, value in ours.items()}
+    notebook['cells'] = [Cell(cell) for cell in cells]
+    notebook['metadata'] = _merge_dicts(base.get('metadata', {}), ours.get('metadata', {}),
+                                        theirs.get('metadata', {}))
+
+    index = {id(cell): n for n, cell in enumerate(cells)}
+    messages = {'source': "both sides changed the source",
+                'cell_type': "both sides changed the cell type",
+                'deleted': "deleted on one side, changed on the other"}
+    conflicts = []
+    for cell, fields, i, j, k in pending:
+        for field in fields:
+            conflicts.append({'index': index[id(cell)], 'field': field, 'base': i, 'ours': j,
+                              'theirs': k, 'message': messages[field]})
+    conflicts.sort(key=lambda conflict: conflict['index'])
+    return notebook, conflicts
+
+
+def dump_notebook(notebook: Dict) -> str:
+    """Serialize a notebook as Jupyter does, copying lazily loaded outputs from their text."""
+    top = {k: (_CELLS_PLACEHOLDER if k == 'cells' else v) for k, v in notebook.items()}
+    template = json.dumps(top, indent=1, ensure_ascii=False, default=_json_default)
+    return _join_serialized(template, [NotebookController._serialize_cell(cell)
+                                       for cell in notebook['cells']])
+
+
+# ==================== ASYNC API ====================
+
+class AsyncNotebookController:
+    """
+    Asyncio front-end for NotebookController.
 
-        except Exception as e:
-            print(f"❌ Execution error: {str(e)}")
-            return False, str(e)
+    Cells executed through ``nbconvert`` run as asyncio subprocesses, so one
+    event loop can drive many notebooks without a thread each. Persistent
+    kernel execution, saving and PDF export are blocking and run in the
+    loop's default executor. Every operation on one notebook holds that
+    notebook's lock, so they apply in the order they were awaited or
+    submitted; operations on different notebooks overlap freely.
 
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+    Attributes not defined here (``edit_cell``, ``search_cells``,
+    ``notebook``, ...) are forwarded to the wrapped controller.
+    """
 
-    def execute_all_cells(self, start_index: int = 0, end_index: Optional[int] = None):
+    def __init__(self, notebook_path: str, **kwargs):
         """
-        Execute all cells in range.
+        Initialize the async controller.
 
         Args:
-            start_index: Start from this cell
-            end_index: End at this cell (inclusive, None = end)
+            notebook_path: Path to .ipynb file
+            **kwargs: Passed on to NotebookController
         """
-        if end_index is None:
-            end_index = self.get_cell_count() - 1
-
-        print(f"\n▶️  Executing cells {start_index} to {end_index}...")
-
-        success_count = 0
-        fail_count = 0
-
-        for i in range(start_index, end_index + 1):
-            cell = self.notebook['cells'][i]
+        self.controller = NotebookController(notebook_path, **kwargs)
+        self._lock = asyncio.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
 
-            if cell['cell_type'] == 'code':
-                success, msg = self.execute_cell(i)
-                if success:
-                    success_count += 1
-                else:
-                    fail_count += 1
-                    print(f"\n⚠️  Failed at cell {i}, stopping execution")
-                    break
+    def __getattr__(self, name):
+        return getattr(self.controller, name)
 
-        print(f"\n{'='*70}")
-        print(f"Execution Summary:")
-        print(f"  ✅ Successful: {success_count}")
-        print(f"  ❌ Failed: {fail_count}")
-        print(f"{'='*70}\n")
+    async def __aenter__(self):
+        return self
 
-    # ==================== UNDO/REDO ====================
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
 
-    def undo(self):
-        """Undo last change."""
-        if self.history_position <= 0:
-            print("❌ Nothing to undo")
-            return False
+    async def _blocking(self, func, *args):
+        """Run a blocking controller call in the default executor."""
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
 
-        self.history_position -= 1
-        state = self.history[self.history_position]
+    # ==================== EXECUTION ====================
 
-        self.notebook = copy.deepcopy(state['notebook'])
-        self.current_cell_index = state['cell_index']
+    @_async_operation
+    async def execute_cell(self, index: Optional[CellRef] = None, timeout: int = 60) -> Tuple[bool, str]:
+        """
+        Execute a code cell and capture output.
 
-        print(f"↶  Undo successful (position {self.history_position + 1}/{len(self.history)})")
-        return True
+        Args:
+            index: Cell index or id (uses current if None)
+            timeout: Execution timeout in seconds
 
-    def redo(self):
-        """Redo last undone change."""
-        if self.history_position >= len(self.history) - 1:
-            print("❌ Nothing to redo")
-            return False
+        Returns:
+            (success, output_message)
+        """
+        nb = self.controller
+        ref, index = index, nb._cell_index(index)
+        if index is None:
+            return False, f"Unknown cell id: {ref}"
 
-        self.history_position += 1
-        state = self.history[self.history_position]
+        if not (0 <= index < nb.get_cell_count()):
+            nb._emit('error', f"❌ Invalid cell index: {index}", index=index)
+            return False, f"Invalid cell index: {index}"
+        if nb.notebook['cells'][index]['cell_type'] != 'code':
+            nb._emit('error', f"❌ Cell {index} is not a code cell", index=index)
+            return False, f"Cell {index} is not a code cell"
 
-        self.notebook = copy.deepcopy(state['notebook'])
-        self.current_cell_index = state['cell_index']
+        if nb.persistent_kernel or nb.stream_outputs:
+            # Kernel execution (persistent, or a fresh kernel to stream from) blocks
+            return await self._blocking(nb.execute_cell, index, timeout)
 
-        print(f"↷  Redo successful (position {self.history_position + 1}/{len(self.history)})")
-        return True
+        key = nb._cache_lookup(index)
+        if key is True:
+            return True, "Restored from cache"
+        return await self._run_cell(index, timeout, key)
 
-    def show_history(self):
-        """Show undo/redo history."""
-        print(f"\n📜 History ({len(self.history)} states):")
-        print(f"   Current position: {self.history_position + 1}\n")
+    async def _run_cell(self, index: int, timeout: int, cache_key: Optional[str]) -> Tuple[bool, str]:
+        """Execute a code cell through ``nbconvert`` in an asyncio subprocess."""
+        nb = self.controller
+        nb._emit('execute', f"▶️  Executing cell {index}...", index=index)
 
-        for i, state in enumerate(self.history):
-            marker = "👉" if i == self.history_position else "  "
-            timestamp = state['timestamp'].strftime('%H:%M:%S')
-            cell_count = len(state['notebook']['cells'])
-            print(f"{marker} {i+1}. {timestamp} - {cell_count} cells")
+        # Child rusage cannot be attributed to one notebook when several run
+        # at once, so profiles from this path record wall time only
+        probe = {} if nb.profile else None
+        started = time.perf_counter()
 
-    # ==================== BATCH OPERATIONS ====================
+        temp_path, command = nb._nbconvert_job(index, timeout)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            try:
+                _, stderr = await asyncio.wait_for(process.communicate(), timeout + 10)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                nb._emit('error', f"❌ Execution timed out after {timeout} seconds")
+                success, message = False, "Timeout"
+            else:
+                success, message = nb._finish_nbconvert(
+                    index, temp_path, process.returncode, stderr.decode(errors='replace'))
 
-    def filter_cells(self, cell_type: str) -> List[int]:
-        """Get indices of cells by type."""
-        indices = []
-        for i, cell in enumerate(self.notebook['cells']):
-            if cell['cell_type'] == cell_type:
-                indices.append(i)
-        return indices
+        except Exception as e:
+            nb._emit('error', f"❌ Execution error: {str(e)}")
+            success, message = False, str(e)
 
-    def replace_in_all_cells(self, old: str, new: str, cell_type: Optional[str] = None):
-        """Replace text in all cells."""
-        self._save_state()
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
 
-        count = 0
-        for i, cell in enumerate(self.notebook['cells']):
-            if cell_type and cell['cell_type'] != cell_type:
-                continue
+        nb._finish_run(index, cache_key, probe, time.perf_counter() - started, success)
+        return success, message
 
-            source = ''.join(cell.get('source', []))
-            if old in source:
-                new_source = source.replace(old, new)
-                cell['source'] = new_source.split('\n')
-                # Add newlines
-                cell['source'] = [line + '\n' for line in cell['source'][:-1]] + [cell['source'][-1]]
-                count += 1
+    @_async_operation
+    async def execute_all_cells(self, start_index: CellRef = 0, end_index: Optional[CellRef] = None,
+                                timeout: int = 60, workers: int = 1) -> bool:
+        """
+        Execute all cells in range, stopping at the first failure.
 
-        print(f"🔄 Replaced '{old}' with '{new}' in {count} cells")
+        Args:
+            start_index: Start from this cell (index or id)
+            end_index: End at this cell (inclusive, index or id, None = end)
+            timeout: Per-cell execution timeout in seconds
+            workers: Number of kernels (see NotebookController.execute_all_cells)
 
-    def merge_cells(self, start_index: int, end_index: int, separator: str = '\n\n'):
-        """Merge multiple cells into one."""
-        if not (0 <= start_index < end_index < self.get_cell_count()):
-            print("❌ Invalid range")
+        Returns:
+            True if every code cell executed successfully
+        """
+        nb = self.controller
+        if nb.persistent_kernel or nb.stream_outputs or workers > 1:
+            return await self._blocking(nb.execute_all_cells, start_index, end_index,
+                                        timeout, workers)
+
+        start_index = nb._cell_index(start_index)
+        end_index = nb.get_cell_count() - 1 if end_index is None else nb._cell_index(end_index)
+        if start_index is None or end_index is None:
             return False
+        nb._emit('execute', f"\n▶️  Executing cells {start_index} to {end_index} of {nb.notebook_path.name}...")
 
-        self._save_state()
-
-        # Get all cell contents
-        merged_content = []
-        cell_type = self.notebook['cells'][start_index]['cell_type']
+        keys = {}
+        cached = set()
+        if nb.exec_cache is not None:
+            keys, upstream = nb._cache_keys()
+            cached = nb._cache_plan(range(start_index, end_index + 1), keys, upstream)
 
+        success_count = 0
+        fail_count = 0
         for i in range(start_index, end_index + 1):
-            cell = self.notebook['cells'][i]
-            source = ''.join(cell.get('source', []))
-            merged_content.append(source)
-
-        # Create merged cell
-        merged_text = separator.join(merged_content)
-
-        # Delete cells from end to start (to maintain indices)
-        for i in range(end_index, start_index, -1):
-            self.notebook['cells'].pop(i)
-
-        # Update first cell
-        self.edit_cell(merged_text, start_index, cell_type)
+            if nb.notebook['cells'][i]['cell_type'] != 'code':
+                continue
+            if i in cached and nb._restore_cached(i, keys[i]):
+                success_count += 1
+                continue
+            success, _ = await self._run_cell(i, timeout, keys.get(i))
+            if success:
+                success_count += 1
+            else:
+                fail_count += 1
+                nb._emit('warning', f"\n⚠️  Failed at cell {i}, stopping execution", index=i)
+                break
 
-        print(f"🔗 Merged cells {start_index}-{end_index}")
-        return True
+        nb._emit_summary(success_count, fail_count, title=f"Execution Summary ({nb.notebook_path.name})")
+        return fail_count == 0
 
-    # ==================== EXPORT/IMPORT ====================
+    # ==================== SAVE/EXPORT ====================
 
-    def save(self):
+    @_async_operation
+    async def save(self):
         """Save notebook to original file."""
-        self._save_notebook()
+        await self._blocking(self.controller.save)
 
-    def save_as(self, path: str):
+    @_async_operation
+    async def save_as(self, path: str):
         """Save notebook to a different file."""
-        self._save_notebook(Path(path))
+        await self._blocking(self.controller.save_as, path)
 
-    def export_cell(self, index: Optional[int] = None, output_file: Optional[str] = None):
-        """Export cell content to a file."""
-        if index is None:
-            index = self.current_cell_index
+    @_async_operation
+    async def export_pdf(self, output_pdf: str, html: bool = False) -> bool:
+        """
+        Convert the saved notebook file to PDF.
 
-        cell = self.view_cell(index, show_output=False)
-        if not cell:
-            return False
+        The converter reads the notebook from disk, so save first to include
+        unsaved changes.
 
-        source = ''.join(cell.get('source', []))
+        Args:
+            output_pdf: Path of the PDF to write
+            html: Use the HTML-based converter instead of LaTeX
 
-        if output_file:
-            with open(output_file, 'w') as f:
-                f.write(source)
-            print(f"📤 Exported cell {index} to {output_file}")
+        Returns:
+            True if the PDF was written
+        """
+        pdf_export = str(Path(__file__).resolve().parent.parent / 'pdf_export')
+        if pdf_export not in sys.path:
+            sys.path.insert(0, pdf_export)
+        if html:
+            from notebook_to_html_pdf import NotebookToHTMLPDFConverter as Converter
         else:
-            return source
+            from notebook_to_pdf import NotebookToPDFConverter as Converter
+
+        converter = Converter(str(self.controller.notebook_path), output_pdf)
+        return await self._blocking(converter.convert)
+
+    # ==================== SUBMISSION QUEUE ====================
+
+    def _submit(self, operation, *args) -> asyncio.Future:
+        """Queue an operation for this notebook's worker and return its future."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._drain_queue())
+        future = loop.create_future()
+        self._queue.put_nowait((operation, args, future))
+        return future
+
+    async def _drain_queue(self):
+        while True:
+            operation, args, future = await self._queue.get()
+            try:
+                if not future.cancelled():
+                    result = await operation(*args)
+                    if not future.cancelled():
+                        future.set_result(result)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
 
-    def import_from_file(self, file_path: str, cell_type: str = 'code',
-                        position: str = 'after'):
-        """Import content from file as a new cell."""
-        with open(file_path, 'r') as f:
-            content = f.read()
+    def submit(self, index: Optional[CellRef] = None, timeout: int = 60) -> asyncio.Future:
+        """
+        Queue a cell for execution.
 
-        self.insert_cell(content, cell_type, position=position)
-        print(f"📥 Imported {file_path} as new {cell_type} cell")
+        Queued operations of one notebook run one at a time in submission
+        order, while the caller carries on.
 
-    # ==================== STATISTICS & INFO ====================
+        Args:
+            index: Cell index or id (uses current if None)
+            timeout: Execution timeout in seconds
 
-    def get_stats(self):
-        """Get notebook statistics."""
-        code_cells = len([c for c in self.notebook['cells'] if c['cell_type'] == 'code'])
-        markdown_cells = len([c for c in self.notebook['cells'] if c['cell_type'] == 'markdown'])
+        Returns:
+            Future resolving to (success, output_message)
+        """
+        return self._submit(self.execute_cell, index, timeout)
 
-        total_lines = 0
-        for cell in self.notebook['cells']:
-            source = ''.join(cell.get('source', []))
-            total_lines += len(source.split('\n'))
+    def submit_all(self, start_index: CellRef = 0, end_index: Optional[CellRef] = None,
+                   timeout: int = 60) -> List[asyncio.Future]:
+        """
+        Queue every code cell in range, one future per cell.
 
-        print(f"\n📊 Notebook Statistics")
-        print(f"{'='*70}")
-        print(f"File: {self.notebook_path.name}")
-        print(f"Total cells: {self.get_cell_count()}")
-        print(f"  - Code cells: {code_cells}")
-        print(f"  - Markdown cells: {markdown_cells}")
-        print(f"Total lines: {total_lines}")
-        print(f"Current cell: {self.current_cell_index}")
-        print(f"History states: {len(self.history)}")
-        print(f"{'='*70}\n")
+        Unlike execute_all_cells, later cells still run after a failure;
+        cancel their futures to skip them.
+
+        Returns:
+            Futures in cell order (none if a cell id is unknown)
+        """
+        nb = self.controller
+        start_index = nb._cell_index(start_index)
+        end_index = nb.get_cell_count() - 1 if end_index is None else nb._cell_index(end_index)
+        if start_index is None or end_index is None:
+            return []
+        return [self.submit(i, timeout) for i in range(start_index, end_index + 1)
+                if nb.notebook['cells'][i]['cell_type'] == 'code']
+
+    def submit_save(self, path: Optional[str] = None) -> asyncio.Future:
+        """Queue a save (to ``path`` if given) after everything submitted so far."""
+        if path is None:
+            return self._submit(self.save)
+        return self._submit(self.save_as, path)
+
+    def submit_export(self, output_pdf: str, html: bool = False) -> asyncio.Future:
+        """Queue a PDF export after everything submitted so far."""
+        return self._submit(self.export_pdf, output_pdf, html)
+
+    async def drain(self):
+        """Wait until every submitted operation has finished."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def aclose(self):
+        """Cancel pending submissions and shut down the persistent kernel."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            while not self._queue.empty():
+                _, _, future = self._queue.get_nowait()
+                future.cancel()
+            self._worker = None
+        await self._blocking(self.controller.close)
 
 
 # ==================== CLI INTERFACE ====================
 
+def parse_cell_ref(token: str) -> CellRef:
+    """Read a command-line cell reference: digits are an index, anything else an id."""
+    return int(token) if re.fullmatch(r'-?\d+', token) else token
+
+
+def _parse_cell_range(token: str) -> Tuple[CellRef, CellRef]:
+    """Read ``a-b`` as an index range, or a single index or id as a one-cell range."""
+    match = re.fullmatch(r'(\d+)-(\d+)', token)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    ref = parse_cell_ref(token)
+    return ref, ref
+
+
 class NotebookCLI:
     """Interactive CLI for notebook controller."""
 
     def __init__(self, controller: NotebookController):
         self.controller = controller
         self.running = True
+        self._script = None  # remaining script lines while run_script is active
+        if controller.persistent_kernel and controller.stream_outputs is None:
+            # Show output of long cells while they run, unless the caller chose
+            controller.stream_outputs = True
+
+    def _read_line(self) -> str:
+        """
+        Read one line of cell content for 'edit' and 'insert'.
+
+        Interactively this reads the terminal until Ctrl+D; in a script the
+        content is the lines following the command, up to a line holding
+        only '.'.
+        """
+        if self._script is None:
+            return input()
+        for _, line in self._script:
+            line = line.rstrip('\r\n')
+            if line == '.':
+                break
+            return line
+        raise EOFError
 
     def run(self):
         """Start interactive CLI."""
@@ -846,8 +5896,64 @@ class NotebookCLI:
 
         print("\n👋 Goodbye!\n")
 
-    def execute_command(self, cmd: str):
-        """Execute a CLI command."""
+    def run_script(self, lines: Iterable[str], save: bool = True) -> bool:
+        """
+        Run commands non-interactively against the loaded notebook.
+
+        One command per line; blank lines and lines starting with '#' are
+        skipped, and 'exit' ends the script early. Content for 'edit' and
+        'insert' follows the command and ends with a line holding only '.'.
+        The script stops at the first command that fails (an unknown
+        command, a usage error, an exception or a reported error such as a
+        failed cell), and the notebook is then left unsaved.
+
+        Args:
+            lines: Script lines, e.g. an open file or sys.stdin
+            save: Save the notebook once after the last command
+
+        Returns:
+            True if every command succeeded
+        """
+        controller = self.controller
+        self._script = enumerate(lines, 1)
+        try:
+            for number, line in self._script:
+                cmd = line.strip()
+                if not cmd or cmd.startswith('#'):
+                    continue
+                controller._emit('command', f"\n[{number}] > {cmd}", line=number, command=cmd)
+                errors = controller.error_count
+                try:
+                    ok = self.execute_command(cmd)
+                except Exception as e:
+                    controller._emit('error', f"❌ Error: {str(e)}")
+                    ok = False
+                if ok is False or controller.error_count > errors:
+                    controller._emit('error', f"❌ Script stopped at line {number}: {cmd}",
+                                     line=number, command=cmd)
+                    return False
+                if not self.running:
+                    break
+        finally:
+            self._script = None
+
+        if save:
+            controller.save()
+        return True
+
+    def _usage(self, text: str) -> bool:
+        """Report the usage of a command given bad arguments."""
+        self.controller._emit('error', f"Usage: {text}", usage=text)
+        return False
+
+    def execute_command(self, cmd: str) -> bool:
+        """
+        Execute a CLI command.
+
+        Returns:
+            False if the command was unknown, its arguments were invalid or
+            the cells it ran failed
+        """
         parts = cmd.split()
         command = parts[0].lower()
         args = parts[1:] if len(parts) > 1 else []
@@ -861,9 +5967,9 @@ class NotebookCLI:
 
         elif command == 'jump' or command == 'j':
             if args:
-                self.controller.jump_to_cell(int(args[0]))
+                self.controller.jump_to_cell(parse_cell_ref(args[0]))
             else:
-                print("Usage: jump <index>")
+                return self._usage("jump <index>")
 
         elif command == 'first':
             self.controller.first_cell()
@@ -873,7 +5979,7 @@ class NotebookCLI:
 
         # Viewing commands
         elif command == 'view' or command == 'v':
-            index = int(args[0]) if args else None
+            index = parse_cell_ref(args[0]) if args else None
             self.controller.view_cell(index)
 
         elif command == 'list' or command == 'ls':
@@ -885,15 +5991,16 @@ class NotebookCLI:
                 pattern = ' '.join(args)
                 self.controller.search_cells(pattern)
             else:
-                print("Usage: search <pattern>")
+                return self._usage("search <pattern>")
 
         # Editing commands
         elif command == 'edit' or command == 'e':
-            print("Enter new content (Ctrl+D or Ctrl+Z to finish):")
+            if self._script is None:
+                print("Enter new content (Ctrl+D or Ctrl+Z to finish):")
             lines = []
             try:
                 while True:
-                    line = input()
+                    line = self._read_line()
                     lines.append(line)
             except EOFError:
                 pass
@@ -902,21 +6009,45 @@ class NotebookCLI:
             self.controller.edit_cell(content)
 
         elif command == 'clear':
-            index = int(args[0]) if args else None
+            index = parse_cell_ref(args[0]) if args else None
             self.controller.clear_cell(index)
 
         elif command == 'delete' or command == 'del':
-            index = int(args[0]) if args else None
-            self.controller.delete_cell(index)
+            if args:
+                start, end = _parse_cell_range(args[0])
+                if start == end:
+                    self.controller.delete_cell(start)
+                else:
+                    self.controller.delete_cells(start, end)
+            else:
+                self.controller.delete_cell()
+
+        elif command == 'move':
+            if len(args) < 2:
+                return self._usage("move <start>[-<end>] <to>")
+            else:
+                start, end = _parse_cell_range(args[0])
+                self.controller.move_cells(start, end, int(args[1]))
+
+        elif command == 'merge':
+            if len(args) < 2:
+                return self._usage("merge <start> <end>")
+            else:
+                self.controller.merge_cells(parse_cell_ref(args[0]), parse_cell_ref(args[1]))
+
+        elif command == 'split':
+            index = parse_cell_ref(args[0]) if args else None
+            self.controller.split_cell(index)
 
         elif command == 'insert':
             if args:
                 cell_type = args[0] if args[0] in ['code', 'markdown'] else 'code'
-                print(f"Enter content for new {cell_type} cell (Ctrl+D to finish):")
+                if self._script is None:
+                    print(f"Enter content for new {cell_type} cell (Ctrl+D to finish):")
                 lines = []
                 try:
                     while True:
-                        line = input()
+                        line = self._read_line()
                         lines.append(line)
                 except EOFError:
                     pass
@@ -924,18 +6055,40 @@ class NotebookCLI:
                 content = '\n'.join(lines)
                 self.controller.insert_cell(content, cell_type)
             else:
-                print("Usage: insert [code|markdown]")
+                return self._usage("insert [code|markdown]")
 
         elif command == 'duplicate' or command == 'dup':
             self.controller.duplicate_cell()
 
+        elif command == 'id':
+            index = parse_cell_ref(args[0]) if args else None
+            cell_id = self.controller.get_cell_id(index)
+            if cell_id is None:
+                return False
+            self.controller._emit('id', f"🆔 {cell_id}", id=cell_id)
+
         # Execution commands
         elif command == 'run' or command == 'r':
-            index = int(args[0]) if args else None
-            self.controller.execute_cell(index)
+            index = parse_cell_ref(args[0]) if args else None
+            return self.controller.execute_cell(index)[0]
 
         elif command == 'runall':
-            self.controller.execute_all_cells()
+            workers = int(args[0]) if args else 1
+            return self.controller.execute_all_cells(workers=workers)
+
+        elif command == 'stale':
+            stale = self.controller.stale_cells()
+            self.controller._emit('stale', f"🕒 Stale cells: {', '.join(map(str, stale)) if stale else 'none'}",
+                                  cells=stale)
+
+        elif command == 'runstale':
+            return self.controller.run_stale()
+
+        elif command == 'restart':
+            self.controller.restart_kernel()
+
+        elif command == 'clearcache':
+            self.controller.clear_cache()
 
         elif command == 'clearoutputs':
             if args and args[0] == 'all':
@@ -961,12 +6114,37 @@ class NotebookCLI:
             if args:
                 self.controller.save_as(args[0])
             else:
-                print("Usage: saveas <path>")
+                return self._usage("saveas <path>")
+
+        elif command == 'backups':
+            self.controller.list_backups()
+
+        elif command == 'restore':
+            self.controller.restore_backup(args[0] if args else None)
+
+        elif command == 'vacuum':
+            options = dict(arg.partition('=')[::2] for arg in args)
+            self.controller.vacuum(max_text=int(options['text']) if options.get('text') else 10000,
+                                   dpi=float(options['dpi']) if options.get('dpi') else None,
+                                   mime_policy=options.get('mime') or None,
+                                   minify=True if 'minify' in options else None)
+
+        elif command == 'diff':
+            self.controller.diff(args[0] if args else None)
+
+        elif command == 'merge3':
+            if args:
+                self.controller.merge(args[0], args[1] if len(args) > 1 else None)
+            else:
+                return self._usage("merge3 <theirs> [base]")
 
         # Info commands
         elif command == 'stats':
             self.controller.get_stats()
 
+        elif command == 'profile':
+            self.controller.profile_report(int(args[0]) if args else 10)
+
         elif command == 'help' or command == 'h':
             self.print_help()
 
@@ -974,18 +6152,23 @@ class NotebookCLI:
             self.running = False
 
         else:
-            print(f"❌ Unknown command: {command}")
-            print("Type 'help' for available commands")
+            self.controller._emit('error', f"❌ Unknown command: {command}\nType 'help' for available commands",
+                                  command=command)
+            return False
+
+        return True
 
     def print_help(self):
         """Print help message."""
         help_text = """
 📖 AVAILABLE COMMANDS
 
+Cells are given by index or by id (see 'list'); an all-digit reference is an index.
+
 Navigation:
   next, n              Move to next cell
   prev, p              Move to previous cell
-  jump <index>, j      Jump to specific cell
+  jump <cell>, j       Jump to specific cell
   first                Jump to first cell
   last                 Jump to last cell
 
@@ -997,13 +6180,21 @@ Viewing:
 Editing:
   edit, e              Edit current cell
   clear [index]        Clear cell content
-  delete [index], del  Delete cell
+  delete [index], del  Delete cell (or a range: delete 10-14)
+  move <a[-b]> <to>    Move cells a..b so the first lands at position <to>
+  merge <a> <b>        Merge cells a..b into one
+  split [index]        Split a cell at its blank lines
   insert [type]        Insert new cell (code/markdown)
   duplicate, dup       Duplicate current cell
+  id [index]           Show a cell's id
 
 Execution:
   run [index], r       Execute cell
-  runall               Execute all cells
+  runall [workers]     Execute all cells (read-only cells in parallel if workers > 1)
+  stale                List cells out of date in the kernel
+  runstale             Execute only edited cells and their dependents
+  restart              Restart the persistent kernel
+  clearcache           Delete the execution cache
   clearoutputs [all]   Clear cell output(s)
 
 Undo/Redo:
@@ -1014,11 +6205,22 @@ Undo/Redo:
 Save:
   save, s              Save notebook
   saveas <path>        Save as new file
+  backups              List backup points
+  restore [id]         Restore a backup point (default: latest)
+  vacuum [text=N] [dpi=N] [mime=html|plain] [minify]
+                       Shrink outputs: cap text, recompress/downscale PNGs, drop mime types
+  diff [path|id]       Compare with a notebook file or backup (default: latest backup)
+  merge3 <theirs> [base]
+                       Three-way merge another version (base default: latest backup)
 
 Info:
   stats                Show notebook statistics
+  profile [n]          Show the n slowest cells of the last profiled run
   help, h              Show this help
   exit, quit, q        Exit interactive mode
+
+The same commands can be run from a file with --script FILE (or - for stdin);
+content for edit/insert follows the command and ends with a line holding '.'.
 """
         print(help_text)
 
@@ -1034,8 +6236,9 @@ def main():
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
-  # Interactive mode
+  # Interactive mode (optionally with options such as --kernel)
   python notebook_controller.py notebook.ipynb
+  python notebook_controller.py notebook.ipynb --kernel
 
   # View specific cell
   python notebook_controller.py notebook.ipynb --view 5
@@ -1043,23 +6246,29 @@ Examples:
   # Execute all cells
   python notebook_controller.py notebook.ipynb --execute-all
 
+  # Execute all cells in one persistent kernel
+  python notebook_controller.py notebook.ipynb --execute-all --kernel
+
   # Clear all outputs
   python notebook_controller.py notebook.ipynb --clear-outputs
 
   # Search for pattern
   python notebook_controller.py notebook.ipynb --search "import pandas"
+
+  # Run interactive-mode commands from a file (or - for stdin), saving once
+  python notebook_controller.py notebook.ipynb --script commands.txt
         """
     )
 
     parser.add_argument('notebook', help='Path to .ipynb file')
     parser.add_argument('-i', '--interactive', action='store_true',
                        help='Start interactive CLI mode')
-    parser.add_argument('-v', '--view', type=int, metavar='INDEX',
+    parser.add_argument('-v', '--view', type=parse_cell_ref, metavar='CELL',
                        help='View specific cell')
     parser.add_argument('-l', '--list', action='store_true',
                        help='List all cells')
-    parser.add_argument('-e', '--execute', type=int, metavar='INDEX',
-                       help='Execute specific cell')
+    parser.add_argument('-e', '--execute', type=parse_cell_ref, metavar='CELL',
+                       help='Execute specific cell (index or id)')
     parser.add_argument('--execute-all', action='store_true',
                        help='Execute all cells')
     parser.add_argument('-c', '--clear-outputs', action='store_true',
@@ -1070,18 +6279,81 @@ Examples:
                        help='Show notebook statistics')
     parser.add_argument('--no-backup', action='store_true',
                        help='Disable automatic backups')
+    parser.add_argument('-k', '--kernel', action='store_true',
+                       help='Execute cells in one persistent kernel')
+    parser.add_argument('-w', '--workers', type=int, default=1, metavar='N',
+                       help='With --execute-all, run independent read-only cells on N kernels')
+    parser.add_argument('--blob-store', type=str, metavar='DIR',
+                       help='Move large outputs into a content-addressed store on save')
+    parser.add_argument('--cache', type=str, metavar='DIR',
+                       help='Reuse outputs of unchanged cells from an execution cache')
+    parser.add_argument('--profile', action='store_true',
+                       help='Record per-cell time, CPU and memory in cell metadata')
+    parser.add_argument('--profile-threshold', type=float, metavar='SECONDS',
+                       help='Sample the stacks of cells slower than this (implies --profile)')
+    parser.add_argument('--stream', action=argparse.BooleanOptionalAction, default=None,
+                       help='Print outputs while cells run (without --kernel, each cell gets a fresh kernel); '
+                            'interactive mode with --kernel streams unless --no-stream is given')
+    parser.add_argument('--stream-limit', type=int, metavar='CHARS',
+                       help='Keep at most CHARS of each stream output in the notebook; spill the rest to disk')
+    parser.add_argument('--vacuum', action='store_true',
+                       help='Shrink outputs (cap text, recompress images) and save')
+    parser.add_argument('--max-text', type=int, default=10000, metavar='CHARS',
+                       help='With --vacuum, characters kept of each text output (default: 10000)')
+    parser.add_argument('--dpi', type=float, metavar='DPI',
+                       help='With --vacuum, downscale PNG outputs rendered above DPI (requires Pillow)')
+    parser.add_argument('--keep-mime', choices=MIME_POLICIES,
+                       help='With --vacuum, keep only this of text/html and text/plain')
+    parser.add_argument('--minify', action='store_true',
+                       help='With --vacuum, save the notebook as compact JSON')
+    parser.add_argument('--script', type=str, metavar='FILE',
+                       help='Run interactive-mode commands from FILE (- for stdin), then save once')
+    parser.add_argument('--no-save', action='store_true',
+                       help='With --script, do not save the notebook at the end')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                       help='Suppress status messages')
+    parser.add_argument('--trace', type=str, metavar='FILE',
+                       help='Write status events with timings to FILE as JSON lines instead of printing them')
 
     args = parser.parse_args()
 
     # Create controller
     try:
-        controller = NotebookController(args.notebook, auto_backup=not args.no_backup)
+        read_only = args.view is not None or args.list or args.search or args.stats
+        controller = NotebookController(args.notebook, auto_backup=not args.no_backup,
+                                        persistent_kernel=args.kernel, lazy=bool(read_only),
+                                        blob_store=args.blob_store, exec_cache=args.cache,
+                                        profile=args.profile, profile_threshold=args.profile_threshold,
+                                        stream_outputs=args.stream, stream_limit=args.stream_limit,
+                                        events='null' if args.quiet else args.trace)
     except FileNotFoundError as e:
         print(f"❌ {e}")
         sys.exit(1)
 
-    # Execute commands
-    if args.view is not None:
+    with controller:
+        status = run_cli_command(controller, args)
+    controller.events.close()
+    if status:
+        sys.exit(status)
+
+
+def run_cli_command(controller: NotebookController, args):
+    """
+    Dispatch the parsed command-line options to the controller.
+
+    Returns:
+        Exit status (nonzero if a script failed)
+    """
+    if args.script:
+        cli = NotebookCLI(controller)
+        if args.script == '-':
+            ok = cli.run_script(sys.stdin, save=not args.no_save)
+        else:
+            with open(args.script, encoding='utf-8') as f:
+                ok = cli.run_script(f, save=not args.no_save)
+        return 0 if ok else 1
+
+    elif args.view is not None:
         controller.view_cell(args.view)
 
     elif args.list:
@@ -1092,26 +6364,29 @@ Examples:
         controller.save()
 
     elif args.execute_all:
-        controller.execute_all_cells()
+        controller.execute_all_cells(workers=args.workers)
         controller.save()
 
     elif args.clear_outputs:
         controller.clear_all_outputs()
         controller.save()
 
+    elif args.vacuum:
+        controller.vacuum(max_text=args.max_text, dpi=args.dpi, mime_policy=args.keep_mime,
+                          minify=True if args.minify else None)
+        controller.save()
+
     elif args.search:
         controller.search_cells(args.search)
 
     elif args.stats:
         controller.get_stats()
 
-    elif args.interactive or len(sys.argv) == 2:
-        # Default to interactive mode
+    else:
+        # A notebook with no command (options such as --kernel aside) opens interactive mode
         cli = NotebookCLI(controller)
         cli.run()
-
-    else:
-        parser.print_help()
+    return 0
 
 
 if __name__ == '__main__':
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Notebook Diff and Merge
+Cell-level comparison and three-way merge of Jupyter notebooks
+
+Cells are aligned by content hash, so a diff reports inserted, deleted,
+moved and modified cells and output-only changes instead of a JSON diff.
+Outputs are compared without being decoded, which keeps large executed
+notebooks fast to compare.
+
+Usage:
+    python notebook_diff.py old.ipynb new.ipynb
+    python notebook_diff.py old.ipynb new.ipynb --no-source --json changes.json
+    python notebook_diff.py --merge base.ipynb ours.ipynb theirs.ipynb -o merged.ipynb
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'notebook_controller'))
+from notebook_controller import (load_notebook_index, diff_notebooks, format_diff,
+                                 merge_notebooks, dump_notebook, _atomic_write)
+
+
+# ==================== DIFF ====================
+
+def diff_files(old_path: str, new_path: str, show: bool = True, source: bool = True) -> List[Dict]:
+    """
+    Compare two notebook files cell by cell.
+
+    Args:
+        old_path: Old version
+        new_path: New version
+        show: Print the differences
+        source: Include source diffs of changed cells when printing
+
+    Returns:
+        Changes as returned by diff_notebooks
+    """
+    old = load_notebook_index(old_path)
+    new = load_notebook_index(new_path)
+    changes = diff_notebooks(old, new)
+    if show:
+        print(f"🔍 {old_path} → {new_path}")
+        print(format_diff(changes, old, new, source=source))
+    return changes
+
+
+# ==================== MERGE ====================
+
+def merge_files(base_path: str, ours_path: str, theirs_path: str,
+                output_path: Optional[str] = None, verbose: bool = True) -> List[Dict]:
+    """
+    Three-way merge two notebook files with their common ancestor.
+
+    Args:
+        base_path: Common ancestor
+        ours_path: Our version (its cell order and notebook metadata win)
+        theirs_path: Their version
+        output_path: Where to write the result (default: over ours_path
+            for a clean merge; with conflicts ours_path is left untouched
+            and the result goes next to it as ``<name>.merged.ipynb``)
+        verbose: Print a summary and every conflict
+
+    Returns:
+        Conflicts as returned by merge_notebooks
+    """
+    merged, conflicts = merge_notebooks(load_notebook_index(base_path),
+                                        load_notebook_index(ours_path),
+                                        load_notebook_index(theirs_path))
+    if output_path:
+        target = Path(output_path)
+    elif conflicts:
+        target = Path(ours_path).with_suffix('.merged.ipynb')
+    else:
+        target = Path(ours_path)
+    _atomic_write(target, dump_notebook(merged))
+
+    if verbose:
+        print(f"🔀 Merged {len(merged['cells'])} cells into {target}")
+        for conflict in conflicts:
+            print(f"   ⚠️  Cell {conflict['index']}: {conflict['message']}")
+        if conflicts:
+            print(f"❌ {len(conflicts)} conflicts; search for '<<<<<<< ours' to resolve source conflicts")
+            if not output_path:
+                print(f"   {ours_path} was left unchanged")
+        else:
+            print("✅ No conflicts")
+    return conflicts
+
+
+# ==================== MAIN ====================
+
+def parse_args():
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(
+        description='Cell-level diff and three-way merge of Jupyter notebooks',
+        epilog='Exit status: 0 if the notebooks match (or merged cleanly), 1 otherwise')
+    parser.add_argument('notebooks', nargs='+',
+                        help='OLD NEW to compare, or BASE OURS THEIRS with --merge')
+    parser.add_argument('-m', '--merge', action='store_true', help='Three-way merge')
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help='With --merge, write the result here (default: over OURS if the merge is '
+                             'clean, else OURS_NAME.merged.ipynb next to it)')
+    parser.add_argument('--no-source', action='store_true', help='Do not print source diffs')
+    parser.add_argument('--json', metavar='FILE', help='Write the changes or conflicts as JSON')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    expected = 3 if args.merge else 2
+    if len(args.notebooks) != expected:
+        print(f"❌ Expected {expected} notebooks, got {len(args.notebooks)}")
+        sys.exit(2)
+
+    try:
+        if args.merge:
+            result = merge_files(*args.notebooks, output_path=args.output)
+        else:
+            result = diff_files(*args.notebooks, source=not args.no_source)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    sys.exit(1 if result else 0)
@@ -7,8 +7,12 @@ Runs each cell and saves outputs to the notebook
 import json
 import sys
 import subprocess
+import argparse
+from pathlib import Path
 from datetime import datetime
 
+CONTROLLER_DIR = Path(__file__).parent.parent / 'notebook_controller'
+
 def execute_notebook_cells(notebook_path, output_path):
     """Execute notebook cell by cell using nbconvert"""
 
@@ -69,11 +73,71 @@ def execute_notebook_cells(notebook_path, output_path):
         print(f"\n❌ Unexpected error: {str(e)}")
         return False
 
+def execute_notebook_warm(notebook_path, output_path, pool, timeout=600):
+    """Execute notebook cell by cell in a warm kernel taken from the pool"""
+    from notebook_controller import NotebookController
+
+    print("="*80)
+    print("EXECUTING NOTEBOOK IN WARM KERNEL")
+    print("="*80)
+    print(f"Input: {notebook_path}")
+    print(f"Output: {output_path}")
+    print(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("="*80)
+
+    try:
+        with NotebookController(notebook_path, auto_backup=False, kernel_pool=pool) as controller:
+            success = controller.execute_all_cells(timeout=timeout)
+            controller.save_as(output_path)
+        return success
+
+    except Exception as e:
+        print(f"\n❌ Unexpected error: {str(e)}")
+        return False
+
+def parse_args():
+    """Parse command-line options"""
+    parser = argparse.ArgumentParser(description='Execute notebooks and save their outputs')
+    parser.add_argument('notebooks', nargs='*',
+                        help='Notebooks to execute (default: the project notebook)')
+    parser.add_argument('--warm-pool', type=int, metavar='SIZE', default=0,
+                        help='Run in warm kernels from a pool of SIZE pre-started kernels')
+    parser.add_argument('--timeout', type=int, default=600,
+                        help='Per-cell timeout in seconds')
+    args = parser.parse_args()
+    # The warm pool only runs the notebooks named on the command line, and
+    # named notebooks are only run through the pool
+    if args.warm_pool and not args.notebooks:
+        parser.error('--warm-pool needs at least one notebook to execute')
+    if args.notebooks and not args.warm_pool:
+        parser.error('notebook arguments are only supported with --warm-pool SIZE')
+    return args
+
 if __name__ == "__main__":
-    input_notebook = "notebooks/Ames_Housing_Price_Prediction_VERIFIED.ipynb"
-    output_notebook = "Ames_Housing_Price_Prediction_EXECUTED.ipynb"  # Just filename, nbconvert adds directory
+    args = parse_args()
+
+    if args.warm_pool and args.notebooks:
+        # Batch mode: each notebook gets a kernel that already has the imports loaded.
+        # The controller is only needed here, so the nbconvert path runs without it.
+        sys.path.insert(0, str(CONTROLLER_DIR))
+        from notebook_controller import KernelPool
+
+        results = {}
+        outputs = []
+        with KernelPool(size=args.warm_pool) as pool:
+            for notebook in args.notebooks:
+                output = str(Path(notebook).with_name(Path(notebook).stem + '_EXECUTED.ipynb'))
+                outputs.append(output)
+                results[notebook] = execute_notebook_warm(notebook, output, pool, args.timeout)
+        success = all(results.values())
+        output_notebook = ', '.join(outputs)
+        for notebook, ok in results.items():
+            print(f"{'✅' if ok else '❌'} {notebook}")
+    else:
+        input_notebook = "notebooks/Ames_Housing_Price_Prediction_VERIFIED.ipynb"
+        output_notebook = "Ames_Housing_Price_Prediction_EXECUTED.ipynb"  # Just filename, nbconvert adds directory
 
-    success = execute_notebook_cells(input_notebook, output_notebook)
+        success = execute_notebook_cells(input_notebook, output_notebook)
 
     if success:
         print("\n" + "="*80)
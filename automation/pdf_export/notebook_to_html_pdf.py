@@ -28,7 +28,7 @@ from datetime import datetime
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent / 'notebook_controller'))
-from notebook_controller import NotebookController
+from notebook_controller import NotebookController, cell_source, output_blob_refs, save_blob_image
 
 
 class NotebookToHTMLPDFConverter:
@@ -60,7 +60,7 @@ class NotebookToHTMLPDFConverter:
     def load_notebook(self):
         """Load notebook using NotebookController."""
         print("\n📖 Loading notebook...")
-        self.nb_controller = NotebookController(str(self.notebook_path), auto_backup=False)
+        self.nb_controller = NotebookController(str(self.notebook_path), auto_backup=False, lazy=True)
         print(f"   ✓ Loaded {self.nb_controller.get_cell_count()} cells")
 
     def save_image_from_base64(self, base64_data, image_format='png'):
@@ -123,10 +123,17 @@ class NotebookToHTMLPDFConverter:
 
         elif output_type == 'execute_result' or output_type == 'display_data':
             data = output.get('data', {})
+            refs = output_blob_refs(output)
 
             # Handle images
-            if 'image/png' in data:
-                image_path = self.save_image_from_base64(data['image/png'], 'png')
+            if 'image/png' in refs or 'image/png' in data:
+                if 'image/png' in refs:
+                    self.image_counter += 1
+                    image_path = save_blob_image(self.nb_controller.blobs, refs['image/png'],
+                                                 self.images_dir, self.image_counter)
+                    print(f"   💾 Saved image: {image_path.name}")
+                else:
+                    image_path = self.save_image_from_base64(data['image/png'], 'png')
                 rel_path = image_path.relative_to(self.work_dir)
                 html_parts.append(f'<div class="output-image"><img src="{rel_path}" alt="Output image"/></div>')
 
@@ -142,6 +149,10 @@ class NotebookToHTMLPDFConverter:
                 html = ''.join(data['text/html'])
                 html_parts.append(f'<div class="output-html">{html}</div>')
 
+            elif 'text/html' in refs:
+                html = self.nb_controller.blobs.read_bytes(refs['text/html'], 'text/html').decode('utf-8')
+                html_parts.append(f'<div class="output-html">{html}</div>')
+
         elif output_type == 'error':
             # Error output
             ename = output.get('ename', 'Error')
@@ -400,7 +411,7 @@ class NotebookToHTMLPDFConverter:
         for i in range(cell_count):
             cell = self.nb_controller.view_cell(i, show_output=False)
             cell_type = cell['cell_type']
-            source = ''.join(cell.get('source', []))
+            source = cell_source(cell)
 
             if cell_type == 'markdown':
                 # Add markdown content
@@ -28,7 +28,7 @@ from datetime import datetime
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent / 'notebook_controller'))
-from notebook_controller import NotebookController
+from notebook_controller import NotebookController, cell_source, output_blob_refs, save_blob_image
 
 
 class NotebookToPDFConverter:
@@ -60,7 +60,7 @@ class NotebookToPDFConverter:
     def load_notebook(self):
         """Load notebook using NotebookController."""
         print("\n📖 Loading notebook...")
-        self.nb_controller = NotebookController(str(self.notebook_path), auto_backup=False)
+        self.nb_controller = NotebookController(str(self.notebook_path), auto_backup=False, lazy=True)
         print(f"   ✓ Loaded {self.nb_controller.get_cell_count()} cells")
 
     def escape_latex(self, text):
@@ -148,10 +148,17 @@ class NotebookToPDFConverter:
 
         elif output_type == 'execute_result' or output_type == 'display_data':
             data = output.get('data', {})
+            refs = output_blob_refs(output)
 
             # Handle images
-            if 'image/png' in data:
-                image_path = self.save_image_from_base64(data['image/png'], 'png')
+            if 'image/png' in refs or 'image/png' in data:
+                if 'image/png' in refs:
+                    self.image_counter += 1
+                    image_path = save_blob_image(self.nb_controller.blobs, refs['image/png'],
+                                                 self.images_dir, self.image_counter)
+                    print(f"   💾 Saved image: {image_path.name}")
+                else:
+                    image_path = self.save_image_from_base64(data['image/png'], 'png')
                 rel_path = image_path.relative_to(self.work_dir)
                 latex_parts.append(r'\begin{figure}[H]')
                 latex_parts.append(r'\centering')
@@ -167,8 +174,7 @@ class NotebookToPDFConverter:
                     latex_parts.append(r'\end{verbatim}')
 
             # Handle HTML tables (basic conversion)
-            elif 'text/html' in data:
-                html = ''.join(data['text/html'])
+            elif 'text/html' in data or 'text/html' in refs:
                 # For now, just mention there's a table
                 latex_parts.append(r'\textit{[Table output - see notebook for details]}')
 
@@ -258,7 +264,7 @@ class NotebookToPDFConverter:
         for i in range(cell_count):
             cell = self.nb_controller.view_cell(i, show_output=False)
             cell_type = cell['cell_type']
-            source = ''.join(cell.get('source', []))
+            source = cell_source(cell)
 
             if cell_type == 'markdown':
                 # Add markdown content
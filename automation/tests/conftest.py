@@ -0,0 +1,139 @@
+"""
+Shared fixtures for the automation tests.
+
+Run from the repository root:
+    python -m pytest automation/tests
+"""
+
+import sys
+import json
+import contextlib
+from pathlib import Path
+
+import pytest
+
+AUTOMATION = Path(__file__).parent.parent
+for tool in ('notebook_controller', 'notebook_batch', 'notebook_diff'):
+    sys.path.insert(0, str(AUTOMATION / tool))
+
+
+def make_notebook(cells):
+    """Build an nbformat 4.5 notebook from (cell_type, source[, outputs]) tuples."""
+    notebook_cells = []
+    for i, spec in enumerate(cells):
+        cell_type, source = spec[0], spec[1]
+        cell = {'cell_type': cell_type, 'id': f'cell{i}', 'metadata': {},
+                'source': source.splitlines(keepends=True)}
+        if cell_type == 'code':
+            cell['execution_count'] = None
+            cell['outputs'] = spec[2] if len(spec) > 2 else []
+        notebook_cells.append(cell)
+    return {'cells': notebook_cells, 'metadata': {'kernelspec': {'name': 'python3'}},
+            'nbformat': 4, 'nbformat_minor': 5}
+
+
+def stream(text):
+    """A stdout stream output."""
+    return {'output_type': 'stream', 'name': 'stdout', 'text': text.splitlines(keepends=True)}
+
+
+class _StreamWriter:
+    """stdout replacement that reports print() output like kernel stream messages."""
+
+    def __init__(self, outputs, on_output, spill):
+        self.outputs = outputs
+        self.on_output = on_output
+        self.spill = spill
+
+    def write(self, text):
+        if not text:
+            return 0
+        last = self.outputs[-1] if self.outputs else None
+        if not (last and last['output_type'] == 'stream'):
+            last = {'output_type': 'stream', 'name': 'stdout', 'text': []}
+            self.outputs.append(last)
+        last['text'].append(text if self.spill is None else self.spill.accept(last, text))
+        if self.on_output is not None:
+            self.on_output(last, text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class FakeKernel:
+    """
+    In-process stand-in for KernelSession, for tests without jupyter_client.
+
+    Cells run with exec() in one namespace per kernel; print() output
+    arrives as stream outputs, through on_output and the spill like
+    KernelSession does. Every kernel created is kept in ``FakeKernel.started``.
+    """
+
+    started = []
+
+    def __init__(self):
+        self.namespace = {}
+        self.execution_count = 0
+        self.sources = []  # every source executed, in order
+        self.is_alive = True
+        FakeKernel.started.append(self)
+
+    def execute(self, source, outputs, timeout=60, store_history=True, on_output=None, spill=None):
+        self.sources.append(source)
+        if store_history:
+            self.execution_count += 1
+        try:
+            with contextlib.redirect_stdout(_StreamWriter(outputs, on_output, spill)):
+                exec(source, self.namespace)
+            status, message = 'ok', "Execution successful"
+        except Exception as e:
+            outputs.append({'output_type': 'error', 'ename': type(e).__name__,
+                            'evalue': str(e), 'traceback': []})
+            status, message = 'error', f"{type(e).__name__}: {e}"
+        finally:
+            if spill is not None:
+                spill.close()
+            for output in outputs:
+                if output['output_type'] == 'stream' and isinstance(output['text'], list):
+                    output['text'] = ''.join(output['text'])
+        return status, self.execution_count, message
+
+    def restart(self):
+        self.namespace = {}
+        self.execution_count = 0
+
+    def shutdown(self):
+        self.is_alive = False
+
+    def set_cwd(self, path):
+        pass
+
+
+@pytest.fixture
+def fake_kernels(monkeypatch):
+    """Make every controller start FakeKernels; yields the list of kernels started."""
+    import notebook_controller
+    FakeKernel.started = []
+    monkeypatch.setattr(notebook_controller.NotebookController, '_new_kernel', lambda self: FakeKernel())
+    yield FakeKernel.started
+
+
+def write_notebook(path, cells):
+    """Write a notebook built by make_notebook to ``path`` and return the path."""
+    path.write_text(json.dumps(make_notebook(cells), indent=1, ensure_ascii=False), encoding='utf-8')
+    return path
+
+
+@pytest.fixture
+def notebook_path(tmp_path):
+    """A small notebook on disk, written as Jupyter writes it."""
+    notebook = make_notebook([
+        ('markdown', '# Title'),
+        ('code', 'x = 1\nprint(x)', [stream('1\n')]),
+        ('code', 'y = x + 1', []),
+        ('markdown', 'Notes'),
+    ])
+    path = tmp_path / 'test.ipynb'
+    path.write_text(json.dumps(notebook, indent=1, ensure_ascii=False), encoding='utf-8')
+    return path
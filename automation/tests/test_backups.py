@@ -0,0 +1,73 @@
+"""Tests for the deduplicated backup store."""
+
+import json
+from datetime import datetime, timedelta
+
+from notebook_controller import NotebookController, BackupStore
+
+
+def objects(store):
+    return sorted(path.name for path in store.object_dir.glob('*/*.gz'))
+
+
+def test_unchanged_cells_are_stored_once(notebook_path):
+    nb = NotebookController(str(notebook_path), events='null')
+    nb.save()
+    store = nb.backups
+    first = objects(store)
+    assert len(first) == 4 + 1  # cells and the template
+
+    nb.save()
+    assert objects(store) == first
+    nb.edit_cell('y = 2', 2)
+    nb.save()
+    # Only the edited cell adds an object
+    assert len(objects(store)) == len(first) + 1
+    assert len(store.list()) == 3
+
+
+def test_restore_gives_back_the_saved_text(notebook_path):
+    nb = NotebookController(str(notebook_path), events='null')
+    nb.save()
+    saved = notebook_path.read_text(encoding='utf-8')
+    first = nb.backups.list()[-1]['id']
+
+    nb.edit_cell('y = 2', 2)
+    nb.save()
+    assert nb.backups.restore_text() == notebook_path.read_text(encoding='utf-8')
+    assert nb.backups.restore_text(first) == saved
+
+    assert nb.restore_backup(first)
+    assert nb.notebook['cells'][2].text == 'y = x + 1'
+
+
+def test_keep_last_prunes_points_and_unreferenced_objects(notebook_path):
+    nb = NotebookController(str(notebook_path), events='null', backup_keep=2)
+    for i in range(4):
+        nb.edit_cell(f'y = {i}', 2)
+        nb.save()
+
+    store = nb.backups
+    assert len(store.list()) == 2
+    assert len(objects(store)) == 3 + 2 + 1  # three shared cells, two versions of cell 2, template
+    assert store.restore_text() == notebook_path.read_text(encoding='utf-8')
+
+
+def test_max_age_drops_old_points(tmp_path):
+    store = BackupStore(tmp_path / 'store', keep_last=10, max_age_days=1)
+    template = json.dumps({'cells': '__cells__'})
+    old = store.create(template, ['"a"'])
+    manifest_path = store.manifest_dir / f"{old}.json"
+    manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+    manifest['timestamp'] = (datetime.now() - timedelta(days=2)).isoformat()
+    manifest_path.write_text(json.dumps(manifest), encoding='utf-8')
+
+    new = store.create(template, ['"b"'])
+    assert [backup['id'] for backup in store.list()] == [new]
+    assert len(objects(store)) == 2  # the template and "b"
+
+
+def test_missing_backup_is_reported(notebook_path):
+    nb = NotebookController(str(notebook_path), events='null')
+    assert not nb.restore_backup('19990101_000000_000000')
+    assert nb.error_count == 1
@@ -0,0 +1,40 @@
+"""Tests for the per-notebook pipeline of the batch runner."""
+
+from batch_notebooks import process_notebook
+
+RESULT_KEYS = {'path', 'ok', 'seconds', 'steps', 'error', 'traceback', 'log'}
+STEP_KEYS = {'step', 'ok', 'seconds', 'result'}
+
+
+def broken_step(controller):
+    print("about to fail")
+    raise RuntimeError("step failed")
+
+
+def test_successful_pipeline(notebook_path):
+    result = process_notebook(str(notebook_path), ['clear_outputs', 'verify'], {'auto_backup': False})
+    assert result['ok'] and result['error'] is None
+    assert set(result) == RESULT_KEYS
+    assert [step['step'] for step in result['steps']] == ['clear_outputs', 'verify']
+    assert all(set(step) == STEP_KEYS and step['ok'] for step in result['steps'])
+
+
+def test_failing_step_has_the_same_keys(notebook_path):
+    result = process_notebook(str(notebook_path), ['clear_outputs', (broken_step, {})], {'auto_backup': False})
+    assert not result['ok']
+    assert set(result) == RESULT_KEYS
+    assert result['error'] == "RuntimeError: step failed"
+    assert 'RuntimeError' in result['traceback']
+    assert result['log'][-1] == "about to fail"
+
+    failed = result['steps'][-1]
+    assert set(failed) == STEP_KEYS
+    assert failed['step'] == 'broken_step' and not failed['ok']
+    assert failed['result'] is None and failed['seconds'] >= 0
+
+
+def test_missing_notebook(tmp_path):
+    result = process_notebook(str(tmp_path / 'missing.ipynb'), ['verify'])
+    assert not result['ok'] and result['steps'] == []
+    assert set(result) == RESULT_KEYS
+    assert result['error'].startswith('FileNotFoundError')
@@ -0,0 +1,85 @@
+"""Tests for addressing cells by nbformat id."""
+
+import pytest
+
+from notebook_controller import NotebookController, MemorySink
+
+
+@pytest.fixture
+def nb(notebook_path):
+    return NotebookController(str(notebook_path), auto_backup=False, events=MemorySink())
+
+
+def test_ids_resolve_to_indices(nb):
+    assert nb.index_of('cell2') == 2
+    assert nb.jump_to_cell('cell2')
+    assert nb.current_cell_index == 2
+    assert nb.get_cell_id() == 'cell2'
+
+
+def test_ids_follow_cells_after_inserts(nb):
+    nb.insert_cell('z = 0', 'code', 0, 'before')
+    assert nb.index_of('cell2') == 3
+    assert nb.edit_cell('y = 5', 'cell2')
+    assert nb.notebook['cells'][3]['source'] == 'y = 5'
+
+
+def test_unknown_id_is_reported_not_raised(nb):
+    before = nb.get_cell_count()
+    assert nb.jump_to_cell('missing') is False
+    assert nb.edit_cell('x', 'missing') is False
+    assert nb.delete_cell('missing') is False
+    assert nb.delete_cells('cell0', 'missing') is False
+    assert nb.view_cell('missing') == {}
+    assert nb.get_cell_id('missing') is None
+    assert nb.execute_cell('missing') == (False, "Unknown cell id: missing")
+    assert nb.execute_all_cells(end_index='missing') is False
+
+    assert nb.get_cell_count() == before
+    assert nb.error_count == 8
+    assert "❌ Unknown cell id: missing" in nb.events.messages()
+
+
+def test_index_of_raises_for_unknown_id(nb):
+    with pytest.raises(ValueError):
+        nb.index_of('missing')
+
+
+def assert_ids_current(nb):
+    cells = nb.notebook['cells']
+    assert {cell_id: i for cell_id, i in nb._ids.items() if i >= 0} == {cell['id']: i for i, cell in enumerate(cells)}
+
+
+def test_id_map_is_kept_current_by_structural_changes(nb):
+    steps = [
+        lambda: nb.insert_cell('a = 1', 'code', 1, 'after'),
+        lambda: nb.insert_cell('b = 2', 'code', 0, 'replace'),
+        lambda: nb.insert_cells(['c = 3', 'd = 4'], 0, 'before'),
+        lambda: nb.move_cells(0, 1, 3),
+        lambda: nb.merge_cells(1, 2),
+        lambda: nb.split_cell(1),
+        lambda: nb.delete_cell(0),
+        lambda: nb.delete_cells(1, 2),
+        lambda: nb.duplicate_cell(0),
+        nb.undo, nb.undo, nb.redo,
+    ]
+    for step in steps:
+        assert step()
+        assert_ids_current(nb)
+
+    removed = nb.notebook['cells'][0]['id']
+    nb.delete_cell(0)
+    assert removed not in nb._ids
+    assert nb.jump_to_cell(removed) is False
+
+    with pytest.raises(RuntimeError):
+        with nb.transaction():
+            nb.delete_cells(0, 1)
+            raise RuntimeError
+    assert_ids_current(nb)
+
+
+def test_failed_insert_releases_reserved_ids(nb):
+    assert not nb.insert_cells(['a = 1', ('b', 'bogus')], 0)
+    assert all(i >= 0 for i in nb._ids.values())
+    assert_ids_current(nb)
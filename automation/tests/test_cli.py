@@ -0,0 +1,80 @@
+"""Tests for running interactive-mode commands as a script."""
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import AUTOMATION
+from notebook_controller import NotebookController, NotebookCLI
+
+
+def run(path, script, save=True):
+    nb = NotebookController(str(path), auto_backup=False, events='null')
+    return NotebookCLI(nb).run_script(script.splitlines(keepends=True), save=save), nb
+
+
+def sources(path):
+    return [''.join(cell['source']) for cell in json.loads(path.read_text(encoding='utf-8'))['cells']]
+
+
+def test_script_edits_and_saves_once(notebook_path):
+    ok, nb = run(notebook_path, "# tidy up\njump 2\nedit\nz = 3\nw = 4\n.\n\n"
+                                "insert markdown\n## Done\n.\nview\n")
+    assert ok
+    assert nb.error_count == 0
+    assert sources(notebook_path) == ['# Title', 'x = 1\nprint(x)', 'z = 3\nw = 4', '## Done', 'Notes']
+
+
+@pytest.mark.parametrize('command', ['bogus', 'jump 9999', 'jump missing', 'move 1', 'run 9999',
+                                     'run 0', 'view 9999', 'id 9999', 'diff missing.ipynb',
+                                     'delete 1-9999'])
+def test_failing_command_stops_script_unsaved(notebook_path, command):
+    original = notebook_path.read_bytes()
+    ok, nb = run(notebook_path, f"jump 2\nedit\nz = 3\n.\n{command}\nnext\n")
+    assert ok is False
+    assert nb.current_cell_index == 2  # 'next' never ran
+    assert notebook_path.read_bytes() == original
+
+
+def test_no_save_leaves_file_untouched(notebook_path):
+    original = notebook_path.read_bytes()
+    ok, nb = run(notebook_path, "jump 2\nclear\n", save=False)
+    assert ok
+    assert nb.notebook['cells'][2]['source'] == ''
+    assert notebook_path.read_bytes() == original
+
+
+def test_exit_ends_script(notebook_path):
+    ok, nb = run(notebook_path, "jump 1\nexit\nbogus\n")
+    assert ok
+    assert nb.current_cell_index == 1
+
+
+def run_main(path, script, *options):
+    command = [sys.executable, str(AUTOMATION / 'notebook_controller' / 'notebook_controller.py'),
+               str(path), '--script', '-', '--no-backup', *options]
+    return subprocess.run(command, input=script, capture_output=True, text=True, encoding='utf-8')
+
+
+def test_exit_status_reports_script_failure(notebook_path):
+    assert run_main(notebook_path, "jump 1\nstats\n").returncode == 0
+    failed = run_main(notebook_path, "jump 1\nrun 9999\n")
+    assert failed.returncode == 1
+    assert "Script stopped at line 2: run 9999" in failed.stdout
+
+
+def test_quiet_script_prints_nothing(notebook_path):
+    result = run_main(notebook_path, "list\nstats\nhistory\nid 1\nstale\nbogus\n", '-q')
+    assert result.returncode == 1
+    assert result.stdout == ''
+
+
+def test_notebook_without_command_starts_interactive_mode(notebook_path):
+    command = [sys.executable, str(AUTOMATION / 'notebook_controller' / 'notebook_controller.py'),
+               str(notebook_path), '--kernel', '--no-backup']
+    result = subprocess.run(command, input="jump 2\nexit\n", capture_output=True, text=True, encoding='utf-8')
+    assert result.returncode == 0
+    assert "Interactive Mode" in result.stdout
+    assert "[Cell 2] >" in result.stdout
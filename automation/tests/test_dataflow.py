@@ -0,0 +1,134 @@
+"""Tests for the def/use analysis behind run_stale, the execution cache and parallel runs."""
+
+import json
+
+from conftest import make_notebook
+from notebook_controller import NotebookController, DataflowGraph, cell_names
+
+
+def defs(source, modules=frozenset()):
+    return cell_names(source, modules)[0]
+
+
+def uses(source):
+    return cell_names(source)[1]
+
+
+def test_assignment_defines_and_reads_use():
+    assert defs('x = y + 1') == {'x'}
+    assert uses('x = y + 1') == {'y'}
+
+
+def test_names_bound_before_use_are_not_uses():
+    assert uses('for col in cols:\n    print(col)') == {'cols', 'print'}
+    assert uses('fig, ax = plt.subplots()\nax.plot([1])') == {'plt'}
+
+
+def test_locals_are_ignored():
+    assert defs('def f(a):\n    b = a\n    return b') == {'f'}
+    assert uses('[v * 2 for v in values]') == {'values'}
+
+
+def test_subscript_and_attribute_assignment_redefine_object():
+    assert defs("df['a'] = 1") == {'df'}
+    assert defs('model.coef_ = None') == {'model'}
+    assert defs("del cache['key']") == {'cache'}
+    assert 'df' in uses("df['a'] = 1")
+
+
+def test_method_calls_redefine_object():
+    assert defs('df.append(9)') == {'df'}
+    assert defs('items.pop()') == {'items'}
+    assert defs('config.update(extra)') == {'config'}
+    assert defs('model.fit(X, y)') == {'model'}
+    assert defs("model.named_steps['scaler'].fit(X)") == {'model'}
+
+
+def test_pure_methods_do_not_redefine_object():
+    assert defs('df.head()') == frozenset()
+    assert defs('summary = df.describe()') == {'summary'}
+    assert defs('y_pred = model.predict(X)') == {'y_pred'}
+
+
+def test_inplace_calls_redefine_object():
+    assert defs('df.fillna(0, inplace=True)') == {'df'}
+    assert defs('df.fillna(0, inplace=False)') == frozenset()
+
+
+def test_module_calls_do_not_redefine_module():
+    assert defs('import pandas as pd\ndata = pd.read_csv("a.csv")') == {'pd', 'data'}
+    assert defs('data = pd.read_csv("a.csv")', frozenset({'pd'})) == {'data'}
+    assert defs('plt.figure()', frozenset({'plt'})) == frozenset()
+
+
+def test_module_state_setters_redefine_module():
+    assert defs('np.random.seed(0)', frozenset({'np'})) == {'np'}
+    assert defs("pd.set_option('display.max_rows', 10)", frozenset({'pd'})) == {'pd'}
+    assert defs("plt.style.use('ggplot')", frozenset({'plt'})) == {'plt'}
+
+
+def test_unparsable_cell_returns_none():
+    assert cell_names('def (') is None
+
+
+def test_magics_are_ignored():
+    assert cell_names('%matplotlib inline\nx = 1') == (frozenset({'x'}), frozenset())
+
+
+def code_cells(*sources):
+    return make_notebook([('code', source) for source in sources])['cells']
+
+
+def test_mutating_cell_is_upstream_of_readers():
+    cells = code_cells('df = [1, 2, 3]', 'df.append(9)', 'print(df)')
+    assert DataflowGraph().upstream(cells) == {0: [], 1: [0], 2: [1]}
+
+
+def test_module_calls_do_not_chain_cells():
+    cells = code_cells('import pandas as pd', 'a = pd.read_csv("a.csv")', 'b = pd.read_csv("b.csv")')
+    assert DataflowGraph().upstream(cells) == {0: [], 1: [0], 2: [0]}
+
+
+def test_stale_includes_readers_of_mutated_object():
+    cells = code_cells('df = [1, 2, 3]', 'df.append(9)', 'print(df)', 'print(other)')
+    assert DataflowGraph().stale(cells, {1}) == [1, 2]
+
+
+def test_parallel_plan_keeps_mutating_cells_on_main_kernel(tmp_path):
+    notebook = make_notebook([('code', 'df = [1, 2, 3]'), ('code', 'df.append(9)'),
+                              ('code', 'print(df)'), ('code', 'df.head()')])
+    path = tmp_path / 'plan.ipynb'
+    path.write_text(json.dumps(notebook, indent=1), encoding='utf-8')
+    nb = NotebookController(str(path), auto_backup=False, events='null')
+
+    owner, runs = nb._parallel_plan([0, 1, 2, 3], workers=3)
+    assert owner[0] == owner[1] == 0
+    # Every kernel that runs a reader of df has run the append first
+    for run in runs:
+        if 2 in run or 3 in run:
+            assert 1 in run
+
+
+def test_side_effects():
+    graph = DataflowGraph()
+    effects = [graph.side_effects(cell) for cell in code_cells(
+        'df.to_csv("out.csv")', 'plt.savefig("plot.png")', 'np.random.seed(0)',
+        'open("log.txt", "a").write("x")', '!rm -rf build', 'x = (',
+        'print(df.head())', 'rows = open("data.csv").read()', 'text = path.open("r").read()')]
+    assert effects == [True] * 6 + [False] * 3
+
+
+def test_parallel_plan_keeps_side_effects_off_replicas(tmp_path):
+    notebook = make_notebook([('code', 'rows = [3, 1, 2]'), ('code', 'open("rows.txt", "w").write(str(rows))'),
+                              ('code', 'seeded = sorted(rows)\nrandom.seed(seeded[0])'),
+                              ('code', 'print(seeded)'), ('code', 'print(len(rows))')])
+    path = tmp_path / 'plan.ipynb'
+    path.write_text(json.dumps(notebook, indent=1), encoding='utf-8')
+    nb = NotebookController(str(path), auto_backup=False, events='null')
+
+    owner, runs = nb._parallel_plan([0, 1, 2, 3, 4], workers=3)
+    # The file write is a leaf but has to run once; the reader of a reseeding cell
+    # would make a replica replay it
+    assert owner[1] == owner[2] == owner[3] == 0
+    assert owner[4] != 0
+    assert all(1 not in run and 2 not in run for run in runs[1:])
@@ -0,0 +1,62 @@
+"""Tests for three-way notebook merges."""
+
+import json
+import uuid
+
+from conftest import make_notebook, write_notebook
+from notebook_controller import merge_notebooks, new_cell_id
+from notebook_diff import merge_files
+
+
+def test_new_cell_id_skips_taken_and_all_digit_ids(monkeypatch):
+    values = iter(['12345678' + '0' * 24, 'abcdef01' + '0' * 24, 'fedcba98' + '0' * 24])
+    monkeypatch.setattr(uuid, 'uuid4', lambda: uuid.UUID(next(values)))
+    assert new_cell_id({'abcdef01'}) == 'fedcba98'
+
+
+def test_merge_renames_duplicate_ids():
+    base = make_notebook([('code', 'a = 1'), ('code', 'b = 2')])
+    ours = make_notebook([('code', 'a = 1'), ('code', 'b = 2'), ('code', 'ours = 1')])
+    theirs = make_notebook([('code', 'theirs = 1'), ('code', 'a = 1'), ('code', 'b = 2')])
+    theirs['cells'][0]['id'] = 'cell2'  # the id our new cell has
+    for cell in theirs['cells'][1:]:
+        cell['id'] = f"cell{int(cell['id'][4:]) - 1}"
+
+    merged, conflicts = merge_notebooks(base, ours, theirs)
+    ids = [cell['id'] for cell in merged['cells']]
+    assert conflicts == []
+    assert len(ids) == 4 and {'cell0', 'cell1', 'cell2'} < set(ids)
+    assert not any(cell_id.isdigit() for cell_id in ids)
+
+
+def conflicting(tmp_path):
+    base = write_notebook(tmp_path / 'base.ipynb', [('code', 'a = 1')])
+    ours = write_notebook(tmp_path / 'ours.ipynb', [('code', 'a = 2')])
+    theirs = write_notebook(tmp_path / 'theirs.ipynb', [('code', 'a = 3')])
+    return base, ours, theirs
+
+
+def test_conflicted_merge_leaves_ours_untouched(tmp_path):
+    base, ours, theirs = conflicting(tmp_path)
+    original = ours.read_bytes()
+    conflicts = merge_files(base, ours, theirs, verbose=False)
+    assert conflicts
+    assert ours.read_bytes() == original
+    merged = json.loads((tmp_path / 'ours.merged.ipynb').read_text(encoding='utf-8'))
+    assert '<<<<<<< ours' in ''.join(merged['cells'][0]['source'])
+
+
+def test_conflicted_merge_with_output_path(tmp_path):
+    base, ours, theirs = conflicting(tmp_path)
+    assert merge_files(base, ours, theirs, output_path=str(tmp_path / 'out.ipynb'), verbose=False)
+    assert (tmp_path / 'out.ipynb').exists()
+    assert not (tmp_path / 'ours.merged.ipynb').exists()
+
+
+def test_clean_merge_writes_over_ours(tmp_path):
+    base = write_notebook(tmp_path / 'base.ipynb', [('code', 'a = 1'), ('code', 'b = 1')])
+    ours = write_notebook(tmp_path / 'ours.ipynb', [('code', 'a = 2'), ('code', 'b = 1')])
+    theirs = write_notebook(tmp_path / 'theirs.ipynb', [('code', 'a = 1'), ('code', 'b = 2')])
+    assert merge_files(base, ours, theirs, verbose=False) == []
+    merged = json.loads(ours.read_text(encoding='utf-8'))
+    assert [''.join(cell['source']) for cell in merged['cells']] == ['a = 2', 'b = 2']
@@ -0,0 +1,61 @@
+"""Tests for routing status and display messages through the event sink."""
+
+from notebook_controller import NotebookController, MemorySink
+
+
+def show_everything(nb):
+    nb.view_cell(1)
+    nb.list_all_cells(show_content=True)
+    nb.show_history()
+    nb.list_backups()
+    nb.profile_report()
+    return nb.get_stats()
+
+
+def test_quiet_sink_prints_nothing(notebook_path, capsys):
+    nb = NotebookController(str(notebook_path), events='null')
+    stats = show_everything(nb)
+    assert capsys.readouterr().out == ''
+    assert stats['cells'] == 4
+    assert stats['code_cells'] == 2
+
+
+def test_displays_are_events(notebook_path, capsys):
+    sink = MemorySink()
+    nb = NotebookController(str(notebook_path), events=sink)
+    show_everything(nb)
+    assert capsys.readouterr().out == ''
+
+    kinds = [event['event'] for event in sink.events]
+    for kind in ('view', 'list', 'history', 'backups', 'stats'):
+        assert kind in kinds
+    view = next(event for event in sink.events if event['event'] == 'view')
+    assert view['index'] == 1
+    assert 'print(x)' in view['message']
+    assert '[Stream 0]:\n1\n' in view['message']
+
+
+def test_console_sink_prints_displays(notebook_path, capsys):
+    nb = NotebookController(str(notebook_path), auto_backup=False)
+    capsys.readouterr()
+    nb.get_stats()
+    assert '📊 Notebook Statistics' in capsys.readouterr().out
+
+
+def test_diff_reports_missing_version_as_error(notebook_path, capsys):
+    nb = NotebookController(str(notebook_path), auto_backup=False, events=MemorySink())
+    assert nb.diff(str(notebook_path.parent / 'missing.ipynb')) is False
+    assert nb.error_count == 1
+    assert capsys.readouterr().out == ''
+
+
+def test_diff_is_an_event(notebook_path, tmp_path):
+    other = tmp_path / 'other.ipynb'
+    other.write_bytes(notebook_path.read_bytes())
+    sink = MemorySink()
+    nb = NotebookController(str(notebook_path), auto_backup=False, events=sink)
+    nb.edit_cell('y = 2', 2)
+    changes = nb.diff(str(other))
+    assert [change['op'] for change in changes] == ['modified']
+    event = next(event for event in sink.events if event['event'] == 'diff')
+    assert event['changes'] == 1
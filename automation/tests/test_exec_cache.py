@@ -0,0 +1,89 @@
+"""Tests for the content-hash execution result cache."""
+
+import os
+
+import pytest
+
+from conftest import stream, write_notebook
+from notebook_controller import NotebookController, ExecutionCache
+
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = ExecutionCache(tmp_path / 'cache')
+    assert cache.get('a' * 64) is None
+    cache.put('a' * 64, [stream('hi\n')], 3)
+    assert 'a' * 64 in cache
+    assert cache.get('a' * 64) == {'outputs': [stream('hi\n')], 'execution_count': 3}
+    assert cache.hits == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ExecutionCache(tmp_path / 'cache')
+    keys = [c * 64 for c in 'abc']
+    cache.put(keys[0], [stream('x\n')], 1)
+    cache.put(keys[1], [stream('y\n')], 2)
+    os.utime(cache._path(keys[0]), ns=(1, 1_000_000_000))
+    os.utime(cache._path(keys[1]), ns=(1, 2_000_000_000))
+    cache.get(keys[0])  # a is now the most recently used
+
+    cache.max_bytes = cache.size + cache.size // 4  # room for two entries, not three
+    cache.put(keys[2], [stream('z\n')], 3)
+    assert keys[0] in cache and keys[2] in cache
+    assert keys[1] not in cache
+    assert cache.size <= cache.max_bytes
+
+
+def test_clear(tmp_path):
+    cache = ExecutionCache(tmp_path / 'cache')
+    cache.put('a' * 64, [], 1)
+    cache.clear()
+    assert 'a' * 64 not in cache
+    assert cache.size == 0
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the notebook's directory, as for a real kernel
+    (tmp_path / 'data.csv').write_text('1\n2\n3\n', encoding='utf-8')
+    return write_notebook(tmp_path / 'pipeline.ipynb', [
+        ('code', "rows = open('data.csv').read().split()"),
+        ('code', 'total = sum(map(int, rows))'),
+        ('code', 'print(total)'),
+    ])
+
+
+def run(path, tmp_path):
+    nb = NotebookController(str(path), auto_backup=False, persistent_kernel=True, events='null',
+                            exec_cache=str(tmp_path / 'cache'))
+    assert nb.execute_all_cells()
+    return nb
+
+
+def test_unchanged_cells_are_restored_instead_of_executed(pipeline, tmp_path, fake_kernels):
+    first = run(pipeline, tmp_path)
+    assert len(fake_kernels[0].sources) == 3
+    assert first.exec_cache.misses == 3
+
+    second = run(pipeline, tmp_path)
+    assert all(kernel.sources == [] for kernel in fake_kernels[1:])
+    assert second.exec_cache.hits == 3
+    assert second.notebook['cells'][2]['outputs'] == [stream('6\n')]
+
+
+def test_edit_invalidates_cell_and_dependents(pipeline, tmp_path, fake_kernels):
+    run(pipeline, tmp_path).save()
+    nb = NotebookController(str(pipeline), auto_backup=False, persistent_kernel=True, events='null',
+                            exec_cache=str(tmp_path / 'cache'))
+    nb.edit_cell('total = 2 * sum(map(int, rows))', 1)
+    assert nb.execute_all_cells()
+    # Cell 0 re-runs too: the kernel needs the names it defines
+    assert len(fake_kernels[-1].sources) == 3
+    assert nb.notebook['cells'][2]['outputs'] == [stream('12\n')]
+
+
+def test_changed_data_file_invalidates_readers(pipeline, tmp_path, fake_kernels):
+    run(pipeline, tmp_path)
+    (tmp_path / 'data.csv').write_text('10\n20\n', encoding='utf-8')
+    nb = run(pipeline, tmp_path)
+    assert nb.exec_cache.hits == 0
+    assert nb.notebook['cells'][2]['outputs'] == [stream('30\n')]
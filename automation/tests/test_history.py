@@ -0,0 +1,126 @@
+"""Tests for the undo history: shared cell versions, undo/redo and the memory budget."""
+
+import json
+
+from conftest import make_notebook, stream
+from notebook_controller import NotebookController, NotebookHistory
+
+
+def open_controller(path, **kwargs):
+    return NotebookController(str(path), auto_backup=False, events='null', **kwargs)
+
+
+def sources(nb):
+    return [cell.text for cell in nb.notebook['cells']]
+
+
+def test_unchanged_cells_are_shared_between_states(notebook_path):
+    nb = open_controller(notebook_path)
+    nb.edit_cell('y = 2', 2)
+    nb.edit_cell('z = 3', 2)
+    # States are recorded before each change: the original and the first edit
+    first, last = nb.history.states[0]['cells'], nb.history.states[-1]['cells']
+    assert len(nb.history) == 2
+    assert all(first[i] is last[i] for i in (0, 1, 3))
+    assert first[2] is not last[2]
+
+
+def test_recording_copies_only_changed_cells():
+    history = NotebookHistory()
+    notebook = make_notebook([('code', 'a = 1', [stream('x' * 1000)]), ('code', 'b = 2')])
+    history.record(notebook, 0)
+    size = history.resident_bytes
+    notebook['cells'][1]['source'] = ['b = 3']
+    history.record(notebook, 1)
+    # Only the edited cell was copied, not the one with the large output
+    assert history.resident_bytes - size < 500
+
+
+def test_undo_and_redo_walk_the_states(notebook_path):
+    nb = open_controller(notebook_path)
+    nb.edit_cell('y = 2', 2)
+    nb.insert_cell('w = 0', 'code', 0, 'before')
+    nb.delete_cell(4)
+    edited = sources(nb)
+
+    assert nb.undo() and nb.undo() and nb.undo()
+    assert sources(nb) == ['# Title', 'x = 1\nprint(x)', 'y = x + 1', 'Notes']
+    assert not nb.undo()
+
+    assert nb.redo() and nb.redo() and nb.redo()
+    assert sources(nb) == edited
+    assert not nb.redo()
+
+
+def test_new_edit_drops_redo_states(notebook_path):
+    nb = open_controller(notebook_path)
+    nb.edit_cell('y = 2', 2)
+    nb.undo()
+    nb.edit_cell('y = 3', 2)
+    assert not nb.redo()
+    assert sources(nb)[2] == 'y = 3'
+
+
+def test_undo_brings_back_replaced_outputs(notebook_path):
+    nb = open_controller(notebook_path)
+    nb.clear_all_outputs()
+    assert nb.notebook['cells'][1]['outputs'] == []
+    nb.undo()
+    assert nb.notebook['cells'][1]['outputs'] == [stream('1\n')]
+    nb.redo()
+    assert nb.notebook['cells'][1]['outputs'] == []
+
+
+def big_notebook(tmp_path, cells=6, size=20000):
+    notebook = make_notebook([('code', f'c{i} = {i}', [stream(f'{i}' * size)]) for i in range(cells)])
+    path = tmp_path / 'big.ipynb'
+    path.write_text(json.dumps(notebook, indent=1), encoding='utf-8')
+    return path
+
+
+def test_history_over_budget_spills_oldest_states(tmp_path):
+    nb = open_controller(big_notebook(tmp_path), history_budget=60000)
+    for i in range(6):
+        nb.clear_outputs(i)
+    nb.undo()  # records the live state too
+
+    history = nb.history
+    assert history.resident_bytes <= history.max_bytes
+    assert history.spilled_count > 0
+    assert history.spilled_bytes > 0
+    assert len(list(history.spill_dir.glob('*.pkl.gz'))) > 0
+    assert 'spilled' not in history.states[history.position]
+
+
+def test_undo_reloads_spilled_states(tmp_path):
+    nb = open_controller(big_notebook(tmp_path), history_budget=60000)
+    for i in range(6):
+        nb.clear_outputs(i)
+    while nb.undo():
+        pass
+
+    assert [len(''.join(cell['outputs'][0]['text'])) for cell in nb.notebook['cells']] == [20000] * 6
+    # The current state alone is over budget; every other state went to disk
+    assert nb.history.spilled_count == len(nb.history) - 1
+    while nb.redo():
+        pass
+    assert all(cell['outputs'] == [] for cell in nb.notebook['cells'])
+
+
+def test_spilled_cell_versions_are_written_once():
+    history = NotebookHistory(max_bytes=1)
+    notebook = make_notebook([('code', 'a = 1', [stream('x' * 5000)]), ('code', 'b = 2')])
+    for i in range(4):
+        notebook['cells'][1]['source'] = [f'b = {i}']
+        history.record(notebook, 1)
+    # The unchanged first cell is shared by every spilled state but stored once
+    assert len(history._disk) == 1 + 3
+    history.close()
+    assert history.spill_dir is None
+
+
+def test_history_size_is_reported(notebook_path):
+    nb = NotebookController(str(notebook_path), auto_backup=False, events='memory')
+    nb.show_history()
+    message = nb.events.messages()[-1]
+    assert 'Resident:' in message and 'Spilled:' in message
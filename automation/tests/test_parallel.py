@@ -0,0 +1,104 @@
+"""Tests for running cells on several kernels with execute_all_cells(workers=N)."""
+
+import pytest
+
+from conftest import stream, write_notebook
+from notebook_controller import NotebookController
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the notebook's directory, as for a real kernel
+    return write_notebook(tmp_path / 'pipeline.ipynb', [
+        ('code', 'rows = [3, 1, 2]'),
+        ('code', "written = open('log.out', 'a').write('ran\\n')"),
+        ('code', 'print(sorted(rows))'),
+        ('code', 'print(len(rows))'),
+        ('code', 'print(sum(rows), written)'),
+    ])
+
+
+def open_controller(path, **kwargs):
+    return NotebookController(str(path), auto_backup=False, events='memory', **kwargs)
+
+
+def outputs(nb):
+    return [cell['outputs'] for cell in nb.notebook['cells']]
+
+
+def test_outputs_are_merged_in_notebook_order(pipeline, fake_kernels):
+    nb = open_controller(pipeline)
+    assert nb.execute_all_cells(workers=3)
+    assert len(fake_kernels) == 3
+    assert outputs(nb)[2:] == [[stream('[1, 2, 3]\n')], [stream('3\n')], [stream('6 4\n')]]
+    # Execution counts are the ones the kernels reported
+    counts = {cell['execution_count'] for cell in nb.notebook['cells']}
+    assert None not in counts and counts <= {1, 2, 3}
+
+
+def test_side_effect_cells_run_once(pipeline, tmp_path, fake_kernels):
+    assert open_controller(pipeline).execute_all_cells(workers=3)
+    assert (tmp_path / 'log.out').read_text() == 'ran\n'
+    assert sum(kernel.sources.count("written = open('log.out', 'a').write('ran\\n')") for kernel in fake_kernels) == 1
+
+
+def test_failure_stops_later_cells_and_keeps_outputs_of_cells_that_ran(tmp_path, fake_kernels):
+    path = write_notebook(tmp_path / 'failing.ipynb', [
+        ('code', 'rows = [3, 1, 2]'),
+        ('code', 'print(len(rows))'),
+        ('code', 'total = sum(missing)'),
+        ('code', 'print(total)'),
+    ])
+    nb = open_controller(path)
+    assert not nb.execute_all_cells(workers=2)
+    assert outputs(nb)[1] == [stream('3\n')]
+    assert outputs(nb)[2][0]['ename'] == 'NameError'
+    assert outputs(nb)[3] == []
+    assert all('print(total)' not in kernel.sources for kernel in fake_kernels)
+    assert "\n⚠️  Failed at cell 2, stopping execution" in nb.events.messages()
+
+
+def test_cached_cells_are_restored_not_run(pipeline, tmp_path, fake_kernels):
+    cache = str(tmp_path / 'cache')
+    assert open_controller(pipeline, exec_cache=cache).execute_all_cells(workers=3)
+    del fake_kernels[:]
+
+    nb = open_controller(pipeline, exec_cache=cache)
+    assert nb.execute_all_cells(workers=3)
+    assert fake_kernels == []
+    assert nb.exec_cache.hits == 5
+    assert outputs(nb)[4] == [stream('6 4\n')]
+    assert (tmp_path / 'log.out').read_text() == 'ran\n'
+
+
+def test_profiling_is_rejected(pipeline, fake_kernels):
+    nb = open_controller(pipeline, profile=True)
+    assert not nb.execute_all_cells(workers=2)
+    assert fake_kernels == []
+    assert nb.error_count == 1
+
+
+def test_outputs_stream_while_cells_run(pipeline, fake_kernels):
+    nb = open_controller(pipeline, stream_outputs=True)
+    assert nb.execute_all_cells(workers=3)
+    streamed = {}
+    for event in nb.events.events:
+        if event['event'] == 'stream':
+            streamed[event['index']] = streamed.get(event['index'], '') + event['message']
+    assert streamed == {2: '[1, 2, 3]\n', 3: '3\n', 4: '6 4\n'}
+
+
+def test_stream_limit_spills_owned_cells_only(tmp_path, monkeypatch, fake_kernels):
+    monkeypatch.chdir(tmp_path)
+    path = write_notebook(tmp_path / 'chatty.ipynb', [
+        ('code', "text = 'x' * 50\nprint(text)"),
+        ('code', 'print(len(text))'),
+        ('code', 'print(text[:3])'),
+    ])
+    nb = open_controller(path, stream_limit=10)
+    assert nb.execute_all_cells(workers=2)
+    assert any('print(text[:3])' in kernel.sources for kernel in fake_kernels[1:])
+    assert outputs(nb)[0][0]['text'][0] == 'x' * 10 + '\n'
+    # The replica replaying cell 0 does not write over the main kernel's spill file
+    assert [p.name for p in (tmp_path / '.chatty.outputs').iterdir()] == ['cell_cell0.stdout.txt']
+    assert (tmp_path / '.chatty.outputs' / 'cell_cell0.stdout.txt').read_text() == 'x' * 40 + '\n'
@@ -0,0 +1,85 @@
+"""Tests for the range operations: delete, move, merge, split and insert many cells."""
+
+import pytest
+
+from conftest import write_notebook
+from notebook_controller import NotebookController
+
+
+@pytest.fixture
+def nb(tmp_path):
+    path = write_notebook(tmp_path / 'ranges.ipynb', [('code', f'c{i} = {i}') for i in range(6)])
+    return NotebookController(str(path), auto_backup=False, events='memory')
+
+
+def sources(nb):
+    return [cell.text for cell in nb.notebook['cells']]
+
+
+ORIGINAL = [f'c{i} = {i}' for i in range(6)]
+
+
+def test_delete_cells_is_one_undo_step(nb):
+    assert nb.delete_cells(1, 3)
+    assert sources(nb) == ['c0 = 0', 'c4 = 4', 'c5 = 5']
+    nb.undo()
+    assert sources(nb) == ORIGINAL
+
+
+def test_delete_cells_by_id(nb):
+    assert nb.delete_cells('cell4', 'cell5')
+    assert sources(nb) == ORIGINAL[:4]
+    assert nb.current_cell_index <= 3
+
+
+def test_move_cells(nb):
+    assert nb.move_cells(0, 1, 4)
+    assert sources(nb) == ['c2 = 2', 'c3 = 3', 'c4 = 4', 'c5 = 5', 'c0 = 0', 'c1 = 1']
+    assert nb.current_cell_index == 4
+    assert nb.move_cells(4, 5, 0)
+    assert sources(nb) == ORIGINAL
+    nb.undo()
+    nb.undo()
+    assert sources(nb) == ORIGINAL
+
+
+def test_merge_and_split_round_trip(nb):
+    assert nb.merge_cells(1, 3)
+    assert sources(nb) == ['c0 = 0', 'c1 = 1\n\nc2 = 2\n\nc3 = 3', 'c4 = 4', 'c5 = 5']
+    assert nb.split_cell(1)
+    assert sources(nb) == ORIGINAL
+    # The merged cell keeps its id, the split-off cells get new ones
+    assert nb.notebook['cells'][1]['id'] == 'cell1'
+    assert len({cell['id'] for cell in nb.notebook['cells']}) == 6
+    nb.undo()
+    assert nb.get_cell_count() == 4
+
+
+def test_split_at_given_lines(nb):
+    nb.edit_cell('a = 1\nb = 2\nc = 3', 0)
+    assert nb.split_cell(0, at=[2])
+    assert sources(nb)[:2] == ['a = 1\nb = 2', 'c = 3']
+
+
+def test_insert_cells_is_one_undo_step(nb):
+    assert nb.insert_cells(['x = 1', ('# Notes', 'markdown'), {'cell_type': 'raw', 'id': 'cell0',
+                                                              'metadata': {}, 'source': 'raw'}], 1)
+    assert sources(nb)[2:5] == ['x = 1', '# Notes', 'raw']
+    assert [cell['cell_type'] for cell in nb.notebook['cells'][2:5]] == ['code', 'markdown', 'raw']
+    assert nb.notebook['cells'][4]['id'] != 'cell0'  # already in use
+    assert nb.current_cell_index == 4
+    nb.undo()
+    assert sources(nb) == ORIGINAL
+
+
+@pytest.mark.parametrize('operation, args', [
+    ('delete_cells', (3, 1)), ('delete_cells', (0, 9)), ('delete_cells', (0, 5)),
+    ('move_cells', (0, 1, 5)), ('move_cells', (2, 1, 0)), ('merge_cells', (2, 2)),
+    ('merge_cells', ('cell1', 'missing')), ('split_cell', (0,)), ('insert_cells', (['x'], 9)),
+    ('insert_cells', ([('x', 'bogus')], 0)),
+])
+def test_invalid_ranges_change_nothing(nb, operation, args):
+    assert not getattr(nb, operation)(*args)
+    assert sources(nb) == ORIGINAL
+    assert nb.error_count == 1
+    assert not nb.undo()
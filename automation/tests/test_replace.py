@@ -0,0 +1,64 @@
+"""Tests for single-pass multi-pattern replacement."""
+
+import pytest
+
+from notebook_controller import NotebookController, MultiReplacer
+
+
+def test_longest_key_wins_and_replacements_are_not_rescanned():
+    replacer = MultiReplacer({'a': 'b', 'b': 'c', 'ab': 'X'})
+    assert replacer.replace('ab a b') == ('X b c', 3)
+    assert replacer.hits == {'a': 1, 'b': 1, 'ab': 1}
+
+
+def test_regex_patterns_use_group_references():
+    replacer = MultiReplacer({'pd': 'pandas'}, {r'df_(\w+)': r'frame_\1', r'v(?P<n>\d)': r'version\g<n>'})
+    text, count = replacer.replace('df_sales = pd.read_csv(v2)')
+    assert text == 'frame_sales = pandas.read_csv(version2)'
+    assert count == 3
+
+
+def test_invalid_replacers_are_rejected():
+    with pytest.raises(ValueError):
+        MultiReplacer({'': 'x'})
+    with pytest.raises(ValueError):
+        MultiReplacer({})
+    with pytest.raises(ValueError):
+        MultiReplacer({}, {'(unclosed': 'x'})
+
+
+@pytest.fixture
+def nb(notebook_path):
+    return NotebookController(str(notebook_path), auto_backup=False, events='memory')
+
+
+def sources(nb):
+    return [cell.text for cell in nb.notebook['cells']]
+
+
+def test_replace_many_counts_per_pattern_in_one_undo_step(nb):
+    original = sources(nb)
+    untouched = nb.notebook['cells'][3]
+    hits = nb.replace_many({'x': 'a', 'y': 'b'}, {r'print\((\w)\)': r'show(\1)'})
+    assert hits == {'x': 2, 'y': 1, r'print\((\w)\)': 1}
+    assert sources(nb) == ['# Title', 'a = 1\nshow(x)', 'b = a + 1', 'Notes']
+    assert nb.notebook['cells'][3] is untouched
+
+    nb.undo()
+    assert sources(nb) == original
+    assert not nb.undo()
+
+
+def test_replace_many_cell_type_filter(nb):
+    assert nb.replace_many({'t': 'T'}, cell_type='markdown') == {'t': 2}
+    assert sources(nb)[0] == '# TiTle' and sources(nb)[1] == 'x = 1\nprint(x)'
+
+
+def test_no_match_records_no_undo_state(nb):
+    assert nb.replace_many({'missing': 'found'}) == {'missing': 0}
+    assert not nb.undo()
+
+
+def test_bad_pattern_is_reported(nb):
+    assert nb.replace_many({}, {'(unclosed': 'x'}) == {}
+    assert nb.error_count == 1
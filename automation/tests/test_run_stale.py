@@ -0,0 +1,63 @@
+"""Tests for re-running only the stale cells in a persistent kernel."""
+
+import pytest
+
+from conftest import write_notebook
+from notebook_controller import NotebookController
+
+
+@pytest.fixture
+def nb(tmp_path, fake_kernels):
+    path = write_notebook(tmp_path / 'pipeline.ipynb', [
+        ('code', 'import math'),
+        ('code', 'raw = [4, 9, 16]'),
+        ('code', 'clean = [math.sqrt(v) for v in raw]'),
+        ('code', 'print(sum(clean))'),
+        ('markdown', '## Plots'),
+        ('code', 'print(len(raw))'),
+    ])
+    return NotebookController(str(path), auto_backup=False, persistent_kernel=True, events='null')
+
+
+def test_every_cell_is_stale_before_running(nb):
+    assert nb.stale_cells() == [0, 1, 2, 3, 5]
+
+
+def test_run_stale_runs_edited_cell_and_dependents_only(nb, fake_kernels):
+    assert nb.run_stale()
+    assert nb.stale_cells() == []
+    assert nb.notebook['cells'][3]['outputs'][0]['text'] == ['9.0\n']
+
+    nb.edit_cell('clean = [math.sqrt(v) * 2 for v in raw]', 2)
+    assert nb.stale_cells() == [2, 3]
+
+    kernel = fake_kernels[0]
+    del kernel.sources[:]
+    assert nb.run_stale()
+    assert kernel.sources == [nb.notebook['cells'][2].text, nb.notebook['cells'][3].text]
+    assert nb.notebook['cells'][3]['outputs'][0]['text'] == ['18.0\n']
+
+
+def test_run_stale_with_nothing_to_do(nb, fake_kernels):
+    nb.run_stale()
+    runs = len(fake_kernels[0].sources)
+    assert nb.run_stale()
+    assert len(fake_kernels[0].sources) == runs
+
+
+def test_failed_cell_stays_stale(nb):
+    nb.edit_cell('clean = [math.sqrt(v) for v in missing]', 2)
+    assert not nb.run_stale()
+    assert 2 in nb.stale_cells()
+
+
+def test_restart_makes_everything_stale(nb):
+    nb.run_stale()
+    nb.restart_kernel()
+    assert nb.stale_cells() == [0, 1, 2, 3, 5]
+
+
+def test_run_stale_needs_a_persistent_kernel(notebook_path):
+    nb = NotebookController(str(notebook_path), auto_backup=False, events='null')
+    assert not nb.run_stale()
+    assert nb.error_count == 1
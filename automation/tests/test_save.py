@@ -0,0 +1,112 @@
+"""Tests for saving notebooks: round trips, incremental fragments and lazy outputs."""
+
+import base64
+import json
+
+from conftest import make_notebook, stream
+from notebook_controller import NotebookController, LazyOutputs, output_blob_refs, save_blob_image
+
+
+def open_controller(path, **kwargs):
+    return NotebookController(str(path), auto_backup=False, events='null', **kwargs)
+
+
+def test_unchanged_notebook_saves_byte_identical(notebook_path):
+    original = notebook_path.read_bytes()
+    open_controller(notebook_path).save()
+    assert notebook_path.read_bytes() == original
+
+
+def test_edit_reaches_file(notebook_path):
+    nb = open_controller(notebook_path)
+    nb.save()
+    nb.edit_cell('z = 3', 2)
+    nb.save()
+    saved = json.loads(notebook_path.read_text())
+    assert saved['cells'][2]['source'] == ['z = 3']
+
+
+def test_in_place_edits_after_save_reach_file(notebook_path):
+    nb = open_controller(notebook_path)
+    nb.save()
+    nb.notebook['cells'][0]['metadata']['tags'] = ['intro']
+    nb.notebook['cells'][1]['outputs'].clear()
+    nb.save()
+
+    saved = json.loads(notebook_path.read_text())
+    assert saved['cells'][0]['metadata'] == {'tags': ['intro']}
+    assert saved['cells'][1]['outputs'] == []
+
+
+def test_in_place_edit_of_nested_value_reaches_file(notebook_path):
+    nb = open_controller(notebook_path)
+    nb.save()
+    nb.notebook['cells'][1]['outputs'][0]['text'][0] = '2\n'
+    nb.save()
+    nb.notebook['metadata']['kernelspec']['name'] = 'other'
+    nb.save()
+
+    saved = json.loads(notebook_path.read_text())
+    assert saved['cells'][1]['outputs'][0]['text'] == ['2\n']
+    assert saved['metadata']['kernelspec']['name'] == 'other'
+
+
+def test_in_place_edit_is_undoable_after_save(notebook_path):
+    nb = open_controller(notebook_path)
+    nb.save()
+    nb.notebook['cells'][1]['outputs'].clear()
+    nb.save()
+    nb.undo()
+    assert len(nb.notebook['cells'][1]['outputs']) == 1
+
+
+def test_lazy_save_matches_full_save(tmp_path):
+    notebook = make_notebook([('code', 'print("é")', [stream('é ✓\n')]),
+                              ('code', 'pass', [stream('\x1b[31mred\n')])])
+    for name, options in [('indent2', {'indent': 2}), ('escaped', {'indent': 1}),
+                          ('minified', {'separators': (',', ':'), 'ensure_ascii': False})]:
+        source = tmp_path / f'{name}.ipynb'
+        source.write_text(json.dumps(notebook, **options), encoding='utf-8')
+        saved = []
+        for lazy in (False, True):
+            nb = open_controller(source, lazy=lazy)
+            nb.minify = False
+            target = tmp_path / f'{name}_{lazy}.ipynb'
+            nb.save_as(str(target))
+            saved.append(target.read_text(encoding='utf-8'))
+        assert saved[0] == saved[1], name
+        assert '\\u00e9' not in saved[1]
+
+
+def test_save_is_atomic_leaves_no_temporary_files(notebook_path):
+    nb = open_controller(notebook_path)
+    nb.edit_cell('a = 1', 1)
+    nb.save()
+    assert [p.name for p in notebook_path.parent.iterdir() if p.suffix == '.tmp'] == []
+
+
+def test_restore_backup_keeps_lazy_loading(notebook_path):
+    nb = NotebookController(str(notebook_path), lazy=True, events='null')
+    nb.edit_cell('x = 2', 1)
+    nb.save()
+    nb.edit_cell('x = 3', 1)
+    assert nb.restore_backup()
+    assert nb.notebook['cells'][1]['source'] == 'x = 2'
+    assert isinstance(nb.notebook['cells'][1]['outputs'], LazyOutputs)
+
+
+def test_blob_store_images_copy_out_without_base64(tmp_path):
+    png = base64.b64encode(b'\x89PNG\r\n\x1a\n' + b'\0' * 20000).decode('ascii')
+    image = {'output_type': 'display_data', 'metadata': {}, 'data': {'image/png': png}}
+    source = tmp_path / 'plot.ipynb'
+    source.write_text(json.dumps(make_notebook([('code', 'plot()', [image])]), indent=1), encoding='utf-8')
+
+    nb = open_controller(source, blob_store=str(tmp_path / 'blobs'))
+    nb.save()
+    nb = open_controller(source)
+    refs = output_blob_refs(nb.notebook['cells'][0]['outputs'][0])
+    assert png not in source.read_text(encoding='utf-8')
+
+    path = save_blob_image(nb.blobs, refs['image/png'], tmp_path, 7)
+    assert path.name == 'image_007.png'
+    assert path.read_bytes() == base64.b64decode(png)
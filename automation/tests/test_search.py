@@ -0,0 +1,62 @@
+"""Tests for the trigram search index behind search_cells."""
+
+import pytest
+
+from notebook_controller import NotebookController, SearchIndex
+
+
+@pytest.fixture
+def nb(notebook_path):
+    return NotebookController(str(notebook_path), auto_backup=False, events='null')
+
+
+def found(nb, pattern, **kwargs):
+    return [i for i, _ in nb.search_cells(pattern, **kwargs)]
+
+
+def test_literal_search_is_case_insensitive(nb):
+    assert found(nb, 'PRINT') == [1]
+    assert found(nb, 'x') == [1, 2]
+    assert found(nb, 'missing') == []
+
+
+def test_line_hits(nb):
+    results = nb.search_index.search(nb.notebook['cells'], 'print')
+    assert results == [(1, 'x = 1\nprint(x)', [(2, 'print(x)')])]
+
+
+def test_regex_and_cell_type_filter(nb):
+    assert found(nb, r'^[xy] =', regex=True) == [1, 2]
+    assert found(nb, 't', cell_type='markdown') == [0, 3]
+
+
+def test_index_follows_edits_inserts_and_deletes(nb):
+    nb.edit_cell('total = 0', 2)
+    assert found(nb, 'total') == [2]
+    assert found(nb, 'y = x') == []
+
+    nb.insert_cell('grand_total = 1', 'code', 0, 'before')
+    assert found(nb, 'total') == [0, 3]
+
+    nb.delete_cell(3)
+    assert found(nb, 'total') == [0]
+    assert len(nb.search_index) == nb.get_cell_count()
+
+
+def test_index_stays_correct_after_undo_and_redo(nb):
+    nb.edit_cell('total = 0', 2)
+    nb.delete_cell(0)
+    nb.undo()
+    nb.undo()
+    assert found(nb, 'total') == []
+    assert found(nb, 'y = x') == [2]
+    assert found(nb, 'title') == [0]
+
+    nb.redo()
+    assert found(nb, 'total') == [2]
+    assert len(nb.search_index) == nb.get_cell_count()
+
+
+def test_compiled_patterns_are_cached():
+    index = SearchIndex()
+    assert index.compile('a+b') is index.compile('a+b')
@@ -0,0 +1,64 @@
+"""Tests for grouping edits with transaction()."""
+
+import pytest
+
+from notebook_controller import NotebookController
+
+
+@pytest.fixture
+def nb(notebook_path):
+    return NotebookController(str(notebook_path), auto_backup=False, events='memory')
+
+
+def sources(nb):
+    return [cell.text for cell in nb.notebook['cells']]
+
+
+def test_edits_share_one_undo_step(nb):
+    original = sources(nb)
+    with nb.transaction():
+        nb.insert_cell('## Summary', 'markdown', 3, 'after')
+        nb.edit_cell('y = 2', 2)
+        nb.merge_cells(1, 2)
+    assert sources(nb) == ['# Title', 'x = 1\nprint(x)\n\ny = 2', 'Notes', '## Summary']
+
+    nb.undo()
+    assert sources(nb) == original
+    nb.redo()
+    assert sources(nb)[-1] == '## Summary'
+
+
+def test_exception_rolls_back_every_edit(nb):
+    original = sources(nb)
+    nb.jump_to_cell(1)
+    with pytest.raises(RuntimeError):
+        with nb.transaction():
+            nb.delete_cell(0)
+            nb.edit_cell('broken', 0)
+            raise RuntimeError('stop')
+    assert sources(nb) == original
+    assert nb.current_cell_index == 1
+    assert "↩️  Transaction rolled back" in nb.events.messages()
+    # The rolled back edits are not left behind as redo states
+    assert not nb.redo()
+
+
+def test_nested_transactions_join_the_outer_one(nb):
+    original = sources(nb)
+    with pytest.raises(ValueError):
+        with nb.transaction():
+            nb.edit_cell('a = 1', 1)
+            with nb.transaction():
+                nb.edit_cell('b = 2', 2)
+            raise ValueError
+    assert sources(nb) == original
+
+
+def test_save_on_commit_writes_once(nb, notebook_path):
+    with nb.transaction(save=True):
+        nb.edit_cell('a = 1', 1)
+        nb.edit_cell('b = 2', 2)
+        assert 'a = 1' not in notebook_path.read_text(encoding='utf-8')
+    saved = notebook_path.read_text(encoding='utf-8')
+    assert 'a = 1' in saved and 'b = 2' in saved
+    assert [event['op'] for event in nb.events.events if event['event'] == 'save'] == ['save']
@@ -0,0 +1,102 @@
+"""Tests for shrinking notebook outputs with vacuum."""
+
+import json
+import subprocess
+import sys
+
+from conftest import AUTOMATION, make_notebook, stream
+from notebook_controller import NotebookController
+
+
+def html_result(html, plain):
+    return {'output_type': 'execute_result', 'execution_count': 1, 'metadata': {},
+            'data': {'text/html': [html], 'text/plain': [plain]}}
+
+
+def write(path, notebook, minified=False):
+    if minified:
+        path.write_text(json.dumps(notebook, separators=(',', ':')), encoding='utf-8')
+    else:
+        path.write_text(json.dumps(notebook, indent=1), encoding='utf-8')
+    return path
+
+
+def long_output_notebook(tmp_path, minified=False):
+    notebook = make_notebook([('code', 'for i in range(5000): print(i)',
+                               [stream(''.join(f'{i}\n' for i in range(5000)))]),
+                              ('code', 'df', [html_result('<table></table>', 'df')])])
+    return write(tmp_path / 'long.ipynb', notebook, minified)
+
+
+def open_controller(path):
+    return NotebookController(str(path), auto_backup=False, events='null')
+
+
+def test_long_text_is_capped_and_reported(tmp_path):
+    path = long_output_notebook(tmp_path)
+    nb = open_controller(path)
+    original = ''.join(nb.notebook['cells'][0]['outputs'][0]['text'])
+
+    report = nb.vacuum(max_text=1000)
+    capped = ''.join(nb.notebook['cells'][0]['outputs'][0]['text'])
+    assert len(capped) < 2000
+    assert capped.startswith('0\n1\n') and capped.endswith('4999\n')
+    assert list(report['cells']) == [0]
+    assert report['saved'] == report['cells'][0] > 0
+
+    size = path.stat().st_size
+    nb.save()
+    assert size - path.stat().st_size == report['saved']
+
+    nb.undo()
+    assert ''.join(nb.notebook['cells'][0]['outputs'][0]['text']) == original
+
+
+def test_nothing_to_shrink_is_not_an_undo_step(notebook_path):
+    nb = open_controller(notebook_path)
+    states = len(nb.history)
+    assert nb.vacuum() == {'cells': {}, 'saved': 0}
+    assert len(nb.history) == states
+
+
+def test_mime_policy_drops_alternatives(tmp_path):
+    nb = open_controller(long_output_notebook(tmp_path))
+    nb.vacuum(max_text=None, mime_policy='plain')
+    assert nb.notebook['cells'][1]['outputs'][0]['data'] == {'text/plain': ['df']}
+    assert len(nb.notebook['cells'][0]['outputs'][0]['text']) == 5000
+
+
+def test_invalid_mime_policy_is_an_error(notebook_path):
+    nb = open_controller(notebook_path)
+    assert nb.vacuum(mime_policy='pdf') == {'cells': {}, 'saved': 0}
+    assert nb.error_count == 1
+
+
+def test_minified_notebook_stays_minified(tmp_path):
+    path = long_output_notebook(tmp_path, minified=True)
+    nb = open_controller(path)
+    nb.vacuum(max_text=1000)
+    nb.save()
+    assert '\n ' not in path.read_text(encoding='utf-8')
+
+
+def test_minify_switches_format_both_ways(notebook_path):
+    nb = open_controller(notebook_path)
+    report = nb.vacuum(minify=True)
+    assert report['saved'] > 0
+    nb.save()
+    assert notebook_path.read_text(encoding='utf-8').startswith('{"')
+
+    nb.vacuum(minify=False)
+    nb.save()
+    assert notebook_path.read_text(encoding='utf-8').startswith('{\n')
+
+
+def test_cli_vacuum_keeps_minified_file_minified(tmp_path):
+    path = long_output_notebook(tmp_path, minified=True)
+    script = AUTOMATION / 'notebook_controller' / 'notebook_controller.py'
+    subprocess.run([sys.executable, str(script), str(path), '--vacuum', '--max-text', '1000', '-q'],
+                   check=True, capture_output=True)
+    text = path.read_text(encoding='utf-8')
+    assert '\n ' not in text
+    assert len(''.join(json.loads(text)['cells'][0]['outputs'][0]['text'])) < 2000
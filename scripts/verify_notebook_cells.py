@@ -4,16 +4,18 @@ Comprehensive Cell-by-Cell Notebook Verification
 Checks every single cell in the notebook systematically
 """
 
-import json
 import sys
 from pathlib import Path
 from typing import Dict, List, Any
 
+sys.path.insert(0, str(Path(__file__).parent.parent / 'automation' / 'notebook_controller'))
+from notebook_controller import load_notebook_index
+
 class NotebookCellVerifier:
     def __init__(self, notebook_path: str):
         self.notebook_path = Path(notebook_path)
-        with open(self.notebook_path, 'r', encoding='utf-8') as f:
-            self.notebook = json.load(f)
+        # Outputs are only indexed (type and offsets), never decoded
+        self.notebook = load_notebook_index(self.notebook_path)
         self.cells = self.notebook['cells']
         self.total_cells = len(self.cells)
         self.verification_results = []
@@ -35,10 +37,7 @@ class NotebookCellVerifier:
         outputs = cell.get('outputs', [])
         has_output = len(outputs) > 0
 
-        output_types = []
-        for output in outputs:
-            output_type = output.get('output_type', 'unknown')
-            output_types.append(output_type)
+        output_types = list(getattr(outputs, 'output_types', []))
 
         return (has_output, output_types)
 